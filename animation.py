@@ -0,0 +1,377 @@
+"""Resize animated GIF and WebP images frame by frame.
+
+resize_image hands animations to resize_animation. Frames are decoded, resampled and
+encoded one at a time, so memory holds a few frames however long the animation is, and
+every frame's duration and the loop count are kept. Animations may also be transcoded
+to animated WebP or AVIF.
+
+In target size mode the byte budget is met by trading off, level by level, the scale,
+the palette size (GIF) or encoder quality (WebP, AVIF), and the frame rate: frames are
+dropped and their time given to the frame before. GIF attempts stop encoding as soon as
+they overflow the budget and extrapolate their full size, so a failed attempt costs a
+fraction of a full encode.
+"""
+import io
+import logging
+
+from PIL import GifImagePlugin, Image, ImageChops
+
+from image_resizer import (ANIMATED_FORMATS, DEFAULT_EFFORT, DEFAULT_PRESET, DEFAULT_QUALITY, FINAL_ATTEMPTS,
+                           SEARCH_EFFORT, ResizeMetrics, as_list, copy_file, encoder_options, get_output_filename,
+                           model_search, resample, target_size_bytes_for, write_file)
+
+logger = logging.getLogger(__name__)
+
+# Palette sizes (GIF) and encoder qualities (WebP, AVIF) the target size search steps down through
+GIF_COLORS = (256, 128, 64, 32)
+WEBP_QUALITIES = (DEFAULT_QUALITY, 80, 60, 40)
+# Keep every frame, then every 2nd, then every 3rd
+FRAME_STEPS = (1, 2, 3)
+# A level is only searched down to this scale before trying fewer colors or frames;
+# the last level may shrink further
+MIN_LEVEL_SCALE = 0.5
+# Encodes spent on one level, and on the last one
+LEVEL_ATTEMPTS = 3
+LAST_LEVEL_ATTEMPTS = 8
+
+
+def is_animation(image):
+    return image.format in ANIMATED_FORMATS and getattr(image, "is_animated", False)
+
+
+class Encoding:
+    """An encoded animation. data is None if the encode was abandoned over budget, in
+    which case size is the extrapolated full size."""
+    def __init__(self, data, size=None):
+        self.data = data
+        self.size = len(data) if size is None else size
+
+
+def frame_mode(image):
+    return "RGBA" if image.has_transparency_data else "RGB"
+
+
+def output_size(image, scale):
+    width, height = image.size
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def resized_frames(image, size, step=1, preset=DEFAULT_PRESET, metrics=None):
+    """Yield (frame, duration_ms) for every step-th frame of image, resized to size.
+
+    A kept frame also lasts as long as the dropped frames after it. Only the frame being
+    resized and the one waiting for its duration are held in memory.
+    """
+    metrics = metrics if metrics is not None else ResizeMetrics()
+    mode = frame_mode(image)
+    pending = None
+    for index in range(image.n_frames):
+        with metrics.stage("decode"):
+            image.seek(index)
+            image.load()
+        duration = image.info.get("duration", 0)
+        if index % step:
+            pending[1] += duration
+            continue
+        if pending is not None:
+            yield tuple(pending)
+        with metrics.stage("resample"):
+            frame = image.convert(mode)
+            pending = [frame if frame.size == size else resample(frame, size, preset), duration]
+    if pending is not None:
+        yield tuple(pending)
+    image.seek(0)
+
+
+def quantize_frame(frame, colors):
+    """Return (paletted frame, transparency index or None) using at most colors palette entries.
+
+    The palette only holds the colors the frame uses.
+    """
+    if frame.mode != "RGBA" or frame.getchannel("A").getextrema()[0] >= 128:
+        return frame.convert("RGB").quantize(colors, dither=Image.Dither.NONE), None
+    # The entry after the frame's colors is reserved for transparent pixels
+    paletted = frame.convert("RGB").quantize(colors - 1, dither=Image.Dither.NONE)
+    palette = paletted.getpalette()
+    transparency = len(palette) // 3
+    paletted.putpalette(palette + [0, 0, 0])
+    paletted.paste(transparency, mask=frame.getchannel("A").point(lambda alpha: 255 if alpha < 128 else 0))
+    return paletted, transparency
+
+
+def palette_colors(paletted):
+    palette = paletted.getpalette()
+    return [tuple(palette[index:index + 3]) for index in range(0, len(palette), 3)]
+
+
+def remap_to_palette(paletted, transparency, palette, palette_transparency):
+    """Return paletted using palette (a list of colors) instead of its own, or None if
+    palette lacks some of its colors or a transparent entry it needs."""
+    if transparency is not None and palette_transparency is None:
+        return None
+    indexes = {color: index for index, color in enumerate(palette) if index != palette_transparency}
+    lut = []
+    for index, color in enumerate(palette_colors(paletted)):
+        if index == transparency:
+            lut.append(palette_transparency)
+        elif color in indexes:
+            lut.append(indexes[color])
+        else:
+            return None
+    remapped = paletted.point(lut + [0] * (256 - len(lut)))
+    remapped.putpalette([value for color in palette for value in color])
+    return remapped
+
+
+def union(box, other):
+    if box is None or other is None:
+        return box or other
+    return min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])
+
+
+def newly_transparent(previous, frame):
+    """Bounding box of the pixels that are opaque in previous and transparent in frame."""
+    if frame.mode != "RGBA":
+        return None
+    def opaque(image):
+        return image.getchannel("A").point(lambda alpha: 255 if alpha >= 128 else 0)
+    return ImageChops.subtract(opaque(previous), opaque(frame)).getbbox()
+
+
+def encode_gif(frames, frame_count, colors=256, loop=None, budget=None, metrics=None):
+    """Write (frame, duration) pairs as a GIF as they come.
+
+    The first frame's palette is the global color table; later frames use it when it
+    holds all their colors and carry their own palette otherwise. Only the rectangle
+    that changed since the previous frame is stored; the rest of the canvas is left as
+    it was (disposal 1). Where pixels turn transparent the previous frame is cleared
+    (disposal 2) instead, which is decided one frame ahead. With a budget, encoding
+    stops once the output exceeds it and the returned Encoding has the size
+    extrapolated from the frames written (of frame_count).
+    """
+    metrics = metrics if metrics is not None else ResizeMetrics()
+    out = io.BytesIO()
+    written = 0
+    global_palette = None  # (colors, transparency index or None) of the global color table
+
+    def write(frame, box, duration, disposal):
+        nonlocal global_palette
+        paletted, transparency = quantize_frame(frame.crop(box), colors)
+        if not written:
+            header, _ = GifImagePlugin.getheader(paletted, info={} if loop is None else {"loop": loop})
+            out.write(b"".join(header))
+            global_palette = (palette_colors(paletted), transparency)
+            include_color_table = False
+        else:
+            remapped = remap_to_palette(paletted, transparency, *global_palette)
+            include_color_table = remapped is None
+            if remapped is not None:
+                paletted = remapped
+                if transparency is not None:
+                    transparency = global_palette[1]
+        params = {"duration": duration, "disposal": disposal, "include_color_table": include_color_table}
+        if transparency is not None:
+            params["transparency"] = transparency
+        out.write(b"".join(GifImagePlugin.getdata(paletted, offset=box[:2], **params)))
+
+    pending = None  # (frame, box, duration) waiting for the next frame to choose its disposal
+    for frame, duration in frames:
+        with metrics.stage("encode"):
+            if pending is None:
+                box = (0, 0) + frame.size
+            else:
+                previous, previous_box, previous_duration = pending
+                cleared = newly_transparent(previous, frame)
+                if cleared is not None:
+                    previous_box = union(previous_box, cleared)
+                write(previous, previous_box, previous_duration, 2 if cleared is not None else 1)
+                written += 1
+                box = union(ImageChops.difference(previous, frame).getbbox(),
+                            previous_box if cleared is not None else None) or (0, 0, 1, 1)
+            pending = (frame, box, duration)
+        if budget is not None and out.tell() > budget:
+            return Encoding(None, out.tell() * frame_count // written)
+    if pending is not None:
+        with metrics.stage("encode"):
+            write(*pending, 1)
+    out.write(b";")
+    return Encoding(out.getvalue())
+
+
+class FrameStream(Image.Image):
+    """The resized frames of an animation, produced when Pillow's WebP or AVIF writer seeks to them.
+
+    Lets Image.save(save_all=True) encode one frame at a time instead of needing a list of
+    every resized frame.
+    """
+    def __init__(self, image, size, step=1, preset=DEFAULT_PRESET, metrics=None):
+        super().__init__()
+        self.source = image
+        self.step = step
+        self.preset = preset
+        self.metrics = metrics if metrics is not None else ResizeMetrics()
+        self._mode = frame_mode(image)
+        self._size = size
+        self.info = {key: value for key, value in image.info.items() if key in ("background", "loop")}
+        self.n_frames = (image.n_frames + step - 1) // step
+        self.is_animated = self.n_frames > 1
+        self._position = None
+        self.seek(0)
+
+    def seek(self, frame):
+        if frame == self._position:
+            return
+        if not 0 <= frame < self.n_frames:
+            # Ends ImageSequence.Iterator, which the AVIF writer walks the frames with
+            raise EOFError("no more frames")
+        with self.metrics.stage("decode"):
+            self.source.seek(frame * self.step)
+            self.source.load()
+        with self.metrics.stage("resample"):
+            resized = self.source.convert(self._mode)
+            if resized.size != self.size:
+                resized = resample(resized, self.size, self.preset)
+        self.im = resized.im
+        self._position = frame
+
+    def tell(self):
+        return self._position
+
+
+def frame_durations(image):
+    """Read every frame's duration in ms (WebP only has them once a frame is decoded)."""
+    durations = []
+    for index in range(image.n_frames):
+        image.seek(index)
+        image.load()
+        durations.append(image.info.get("duration", 0))
+    image.seek(0)
+    return durations
+
+
+def encode_stream(image, size, step=1, quality=DEFAULT_QUALITY, durations=None, preset=DEFAULT_PRESET,
+                  metrics=None, format="WEBP", options=None):
+    """Encode image's frames as an animated WebP or AVIF with Pillow's writer, through a FrameStream.
+
+    options are extra save options (see encoder_options).
+    """
+    metrics = metrics if metrics is not None else ResizeMetrics()
+    durations = durations if durations is not None else frame_durations(image)
+    stream = FrameStream(image, size, step, preset, metrics)
+    kept_durations = [sum(durations[index:index + step]) for index in range(0, len(durations), step)]
+    buffer = io.BytesIO()
+    with metrics.stage("encode"):
+        stream.save(buffer, format=format, save_all=True, duration=kept_durations,
+                    loop=image.info.get("loop", 0), quality=quality, **(options or {}))
+    return Encoding(buffer.getvalue())
+
+
+def encode_animation(image, scale, detail=None, step=1, budget=None, durations=None, preset=DEFAULT_PRESET,
+                     metrics=None, format=None, effort=DEFAULT_EFFORT):
+    """Encode image's frames at scale as format (by default the source's).
+
+    detail is the GIF palette size or the WebP/AVIF quality, and effort the encoder's
+    speed/effort preset (see ENCODER_EFFORTS).
+    """
+    metrics = metrics if metrics is not None else ResizeMetrics()
+    metrics.encodes += 1
+    size = output_size(image, scale)
+    format = format or image.format
+    if format == "GIF":
+        frames = resized_frames(image, size, step, preset, metrics)
+        return encode_gif(frames, (image.n_frames + step - 1) // step, detail or GIF_COLORS[0],
+                          image.info.get("loop"), budget, metrics)
+    return encode_stream(image, size, step, detail or WEBP_QUALITIES[0], durations, preset, metrics, format,
+                         encoder_options(format, effort))
+
+
+def search_levels(format, min_quality=None):
+    """(detail, frame step) pairs from the best looking to the smallest."""
+    if format == "GIF":
+        details = GIF_COLORS
+    else:
+        details = [quality for quality in WEBP_QUALITIES if quality >= (min_quality or 0)] or [min_quality]
+    return [(detail, 1) for detail in details] + [(details[-1], step) for step in FRAME_STEPS[1:]]
+
+
+def search_animation(image, target_size_mb, current_size_bytes, min_quality=None, preset=DEFAULT_PRESET,
+                     metrics=None, format=None, effort=DEFAULT_EFFORT):
+    """Find the best looking encoding of the animation as format that fits in target_size_mb.
+
+    Attempts are encoded at SEARCH_EFFORT, and the scale found refined at effort as in
+    search_target_size.
+    """
+    metrics = metrics if metrics is not None else ResizeMetrics()
+    format = format or image.format
+    target_size_bytes = target_size_bytes_for(target_size_mb)
+    durations = frame_durations(image) if format != "GIF" else None
+    levels = search_levels(format, min_quality)
+    # Encoded size scales roughly with the pixel count
+    guess = min(1.0, (target_size_bytes / current_size_bytes) ** 0.5)
+
+    for number, (detail, step) in enumerate(levels):
+        last = number == len(levels) - 1
+        lower = 0.0 if last else MIN_LEVEL_SCALE
+        points = []
+
+        def encode_at(scale, effort=SEARCH_EFFORT):
+            encoding = encode_animation(image, scale, detail, step, target_size_bytes, durations, preset, metrics,
+                                        format, effort)
+            metrics.attempts += 1
+            points.append((scale, encoding.size))
+            logger.info(f"Attempt {metrics.attempts}: Scale={scale:.2f}, Detail={detail}, Frame step={step}, "
+                        f"Size={encoding.size / (1024 * 1024):.2f}MB (Target: {target_size_mb}MB)")
+            return None, encoding
+
+        best, _ = model_search(encode_at, target_size_bytes, lower, 1.0, first=max(lower, guess),
+                               max_attempts=LAST_LEVEL_ATTEMPTS if last else LEVEL_ATTEMPTS,
+                               resolution=0.01, size_of=lambda encoding: encoding.size)
+        if best is not None:
+            if encoder_options(format, effort) != encoder_options(format, SEARCH_EFFORT):
+                refined, _ = model_search(lambda scale: encode_at(scale, effort), target_size_bytes, lower, 1.0,
+                                          first=best[0], max_attempts=FINAL_ATTEMPTS, resolution=0.01,
+                                          size_of=lambda encoding: encoding.size)
+                best = refined or best
+            return best[2].data
+        # Start the next level where the last attempt predicts this one would have fit
+        scale, size = points[-1]
+        guess = min(1.0, scale * (target_size_bytes / size) ** 0.5)
+    raise ValueError("Could not find suitable size within constraints")
+
+
+def resize_animation(image, input_path, output_path, scaled_size=None, target_size_mb=None, min_quality=None,
+                     preset=DEFAULT_PRESET, metrics=None, file_io=None, output_format=None, effort=DEFAULT_EFFORT):
+    """resize_image for an animated GIF or WebP that is already open.
+
+    Takes the same sizes as resize_image (single values or lists for variants), and
+    output_format "WEBP" or "AVIF" to transcode. Returns None, or a list of Nones for
+    variants.
+    """
+    if not as_list(scaled_size) and not as_list(target_size_mb):
+        raise ValueError(f"Invalid scaled_size value: {scaled_size}")
+    multi_variant = isinstance(scaled_size, (list, tuple)) or isinstance(target_size_mb, (list, tuple))
+    current_size_bytes = file_io.size(input_path)
+    width, height = image.size
+
+    for size in as_list(scaled_size):
+        if not isinstance(size, (int, float)):
+            raise ValueError(f"Invalid scaled_size value: {size}")
+        path = get_output_filename(output_path, "pixels", size) if multi_variant else output_path
+        encoding = encode_animation(image, size / min(width, height), preset=preset, metrics=metrics,
+                                    format=output_format, effort=effort)
+        write_file(file_io, path, encoding.data, metrics)
+
+    for size_mb in as_list(target_size_mb):
+        path = get_output_filename(output_path, "size", target_size_mb=size_mb) if multi_variant else output_path
+        if current_size_bytes <= target_size_bytes_for(size_mb) and output_format is None:
+            copy_file(file_io, input_path, path, metrics)
+            logger.info(f"Skipped resizing: file already under target size "
+                        f"({current_size_bytes / (1024 * 1024):.2f}MB)")
+            continue
+        data = search_animation(image, size_mb, current_size_bytes, min_quality, preset, metrics, output_format,
+                                effort)
+        write_file(file_io, path, data, metrics)
+
+    if multi_variant:
+        return [None] * (len(as_list(scaled_size)) + len(as_list(target_size_mb)))
+    return None
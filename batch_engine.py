@@ -0,0 +1,580 @@
+import os
+import csv
+import json
+import time
+import queue
+import pstats
+import shutil
+import cProfile
+import logging
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from image_resizer import (BufferedIO, FileIO, ResizeMetrics, atomic_write, estimate_memory_bytes,
+                           get_output_filename, resize_image, variant_output_paths)
+from duplicates import link_or_copy, split_duplicates
+from planner import plan_batch
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_count():
+    """Return the default number of worker processes (one per CPU core)."""
+    return max(1, os.cpu_count() or 1)
+
+
+def build_jobs(input_files, output_folder, resize_mode, scaled_size=None, target_size_mb=None,
+               input_root=None, **options):
+    """Pair each input file with its output path and resize_image options.
+
+    With input_root, the folder structure below it is mirrored inside output_folder.
+    Extra keyword arguments are passed through to resize_image. When scaled_size or
+    target_size_mb is a list, the job's output path is the base name its variants are
+    named after (see job_outputs). Outputs transcoded to an output_format option get
+    its extension.
+    """
+    multi_variant = isinstance(scaled_size, (list, tuple)) or isinstance(target_size_mb, (list, tuple))
+    output_format = options.get("output_format")
+    jobs = []
+    for input_file in input_files:
+        if multi_variant:
+            output_name = os.path.basename(get_output_filename(input_file, "variants", output_format=output_format))
+        else:
+            output_name = os.path.basename(get_output_filename(input_file, resize_mode, scaled_size, target_size_mb,
+                                                               output_format))
+        if input_root is not None:
+            relative_folder = os.path.relpath(os.path.dirname(input_file), input_root)
+            output_file = os.path.normpath(os.path.join(output_folder, relative_folder, output_name))
+        else:
+            output_file = os.path.join(output_folder, output_name)
+        jobs.append((input_file, output_file, dict(options, scaled_size=scaled_size, target_size_mb=target_size_mb)))
+    return jobs
+
+
+def job_outputs(job):
+    """Return the files a job writes."""
+    _, output_file, options = job
+    return variant_output_paths(output_file, options.get("scaled_size"), options.get("target_size_mb"))
+
+
+def estimate_job_memory(job):
+    """Estimate a job's peak memory in bytes from the image header (0 if the header can't be read)."""
+    input_file, _, options = job
+    try:
+        return estimate_memory_bytes(input_file, **options)
+    except Exception:
+        # Unreadable files fail quickly in the worker; don't let them block scheduling
+        return 0
+
+
+def bounded_memory_job(job):
+    """Return the job adjusted to use as little memory as resize_image allows.
+
+    The fast preset decodes JPEGs at up to 1/8 scale instead of full resolution. Other
+    formats still need one full decode, so this rarely helps them.
+    """
+    input_file, output_file, options = job
+    return input_file, output_file, dict(options, preset="fast")
+
+
+class MemoryBudget:
+    """Bytes reserved against an optional budget by several threads.
+
+    A reservation that doesn't fit only goes through when nothing else is reserved, so
+    a single item larger than the whole budget can still run, alone.
+    """
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, size):
+        return self.budget is None or not self.in_use or self.in_use + size <= self.budget
+
+    def try_reserve(self, size, force=False):
+        """Reserve size bytes if they fit (or force). Returns True if reserved."""
+        with self._condition:
+            if not force and not self._fits(size):
+                return False
+            self.in_use += size
+            return True
+
+    def reserve(self, size, stop_event):
+        """Wait until size bytes fit and reserve them. Returns False if stop_event was set first."""
+        with self._condition:
+            while not self._fits(size):
+                if stop_event.is_set():
+                    return False
+                self._condition.wait(0.05)
+            self.in_use += size
+            return True
+
+    def release(self, size):
+        with self._condition:
+            self.in_use -= size
+            self._condition.notify_all()
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def run_job(input_file, output_file, options, profile_path=None, file_io=None):
+    """Resize a single file. Runs inside a worker process.
+
+    Returns the job's metrics: resize_image's stage timings plus total time and bytes in/out.
+    With profile_path, the job runs under cProfile and the stats are dumped there.
+    """
+    metrics = ResizeMetrics()
+    file_io = file_io if file_io is not None else FileIO()
+    start = time.perf_counter()
+    if profile_path is not None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(resize_image, input_file, output_file, metrics=metrics, file_io=file_io, **options)
+        finally:
+            profiler.dump_stats(profile_path)
+    else:
+        resize_image(input_file, output_file, metrics=metrics, file_io=file_io, **options)
+    return dict(metrics.as_dict(),
+                total_seconds=time.perf_counter() - start,
+                bytes_in=file_size(input_file),
+                bytes_out=sum(file_io.output_size(path) for path in job_outputs((input_file, output_file, options))))
+
+
+def run_buffered_job(input_file, output_file, options, data, profile_path=None):
+    """Resize a file whose bytes were already read, without touching the disk.
+
+    Returns (metrics, outputs) where outputs are BufferedIO's (path, data, copied_from)
+    entries, left for the caller to write.
+    """
+    file_io = BufferedIO(input_file, data)
+    metrics = run_job(input_file, output_file, options, profile_path, file_io)
+    return metrics, file_io.outputs
+
+
+def write_outputs(outputs):
+    """Atomically write run_buffered_job's outputs. Plain copies keep their source's metadata."""
+    for path, data, copied_from in outputs:
+        atomic_write(path, data)
+        if copied_from is not None:
+            shutil.copystat(copied_from, path)
+
+
+REPORT_FIELDS = ["input", "status", "error", "total_seconds"] + [
+    f"{stage}_seconds" for stage in ResizeMetrics.STAGES] + ["read_seconds", "attempts", "encodes", "bytes_in",
+                                                           "bytes_out", "duplicate_of"]
+
+
+def write_report(rows, path):
+    """Write per-file metrics rows as CSV (for a .csv path) or JSON."""
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+class BatchEngine:
+    """Run resize jobs on a process pool and report progress through a queue.
+
+    Jobs are (input_file, output_file, options) tuples where options are the
+    keyword arguments passed to resize_image. output_files in events lists every
+    file the job wrote (one per variant). Events put on the queue are:
+        ("done", input_file, output_files)
+        ("skipped", input_file, output_files)  - unchanged since the last run (needs a manifest)
+        ("duplicate", input_file, output_files, original_input_file)  - with dedupe
+        ("failed", input_file, error_message)
+        ("planned", plan)  - with plan, before any job runs (see planner.BatchPlan)
+        ("finished", processed_count, failed_count)
+
+    Per-file metrics of the last run are kept in report (see write_report). With
+    profile_path, every job is profiled and the merged cProfile stats are written there.
+    With a journal (journal.BatchJournal), every completed job is recorded so the batch
+    can be resumed after a crash and undone later; batch_id is the running batch.
+    With dedupe, inputs identical to an earlier one (same content and options) are not
+    resized again: their outputs are hard links to (or copies of) the original's.
+    With plan, the jobs are planned from their headers first: inputs already under their
+    target size are copied right away instead of going through a worker, and the rest run
+    most expensive first so no large file is left running alone at the end of the batch.
+    """
+    def __init__(self, workers=None, progress_queue=None, manifest=None, memory_budget_mb=None,
+                 profile_path=None, journal=None, dedupe=False, plan=False):
+        self.workers = max(1, workers or default_worker_count())
+        self.progress_queue = progress_queue if progress_queue is not None else queue.Queue()
+        self.manifest = manifest
+        # Jobs are only started while their estimated footprints fit in this budget
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.profile_path = profile_path
+        self.journal = journal
+        self.batch_id = None
+        self.dedupe = dedupe
+        self.duplicates = {}
+        self._duplicates_failed = 0
+        self.plan_jobs = plan
+        self.plan = None
+        self.report = []
+        self._profile_folder = None
+        self._cancel_event = threading.Event()
+        self._thread = None
+
+    def start(self, jobs, batch_id=None):
+        """Process jobs in a background thread so the caller stays responsive."""
+        self._cancel_event.clear()
+        self._thread = threading.Thread(target=self.run, args=(list(jobs), batch_id), daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def cancel(self):
+        """Stop submitting new jobs. Jobs already running are allowed to finish."""
+        self._cancel_event.set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def job_done(self, job, metrics):
+        input_file, output_file, options = job
+        self.record_done(job)
+        self.report.append(dict(metrics, input=input_file, status="done"))
+        self.progress_queue.put(("done", input_file, job_outputs(job)))
+        for duplicate in self.duplicates.pop(input_file, ()):
+            self.duplicate_done(job, duplicate)
+
+    def record_done(self, job):
+        input_file, output_file, options = job
+        if self.journal is not None:
+            self.journal.record_done(self.batch_id, input_file, job_outputs(job))
+        if self.manifest is not None:
+            self.manifest.record(input_file, output_file, options)
+            self.manifest.save_if_due()
+
+    def duplicate_done(self, original, duplicate):
+        """Give a duplicate input the outputs of its original."""
+        try:
+            for source, target in zip(job_outputs(original), job_outputs(duplicate)):
+                link_or_copy(source, target)
+            self.record_done(duplicate)
+        except OSError as e:
+            self._duplicates_failed += 1
+            self.report.append({"input": duplicate[0], "status": "failed", "error": str(e)})
+            self.progress_queue.put(("failed", duplicate[0], str(e)))
+            return
+        self.report.append({"input": duplicate[0], "status": "duplicate", "duplicate_of": original[0],
+                            "bytes_in": file_size(duplicate[0]),
+                            "bytes_out": sum(file_size(path) for path in job_outputs(duplicate))})
+        self.progress_queue.put(("duplicate", duplicate[0], job_outputs(duplicate), original[0]))
+
+    def job_failed(self, job, error):
+        self.report.append({"input": job[0], "status": "failed", "error": str(error)})
+        self.progress_queue.put(("failed", job[0], str(error)))
+        for duplicate in self.duplicates.pop(job[0], ()):
+            self._duplicates_failed += 1
+            self.report.append({"input": duplicate[0], "status": "failed", "error": str(error),
+                                "duplicate_of": job[0]})
+            self.progress_queue.put(("failed", duplicate[0], str(error)))
+
+    def job_arguments(self, job, index):
+        """Return run_job's arguments for a job."""
+        profile_path = None
+        if self._profile_folder is not None:
+            profile_path = os.path.join(self._profile_folder, f"{index}.prof")
+        return (*job, profile_path)
+
+    def merge_profiles(self):
+        """Combine the per-job cProfile dumps into profile_path."""
+        dumps = [os.path.join(self._profile_folder, name) for name in os.listdir(self._profile_folder)]
+        if dumps:
+            pstats.Stats(*dumps).dump_stats(self.profile_path)
+        shutil.rmtree(self._profile_folder, ignore_errors=True)
+        self._profile_folder = None
+
+    def fit_to_budget(self, jobs, costs):
+        """Switch jobs over the memory budget to the bounded-memory strategy where it lowers
+        their estimate. Jobs still over the budget run alone while the other workers wait.
+
+        Returns the (jobs, costs) to run.
+        """
+        fitted_jobs, fitted_costs = [], []
+        for job, cost in zip(jobs, costs):
+            if cost > self.memory_budget:
+                bounded_job = bounded_memory_job(job)
+                bounded_cost = estimate_job_memory(bounded_job)
+                if bounded_cost < cost:
+                    job, cost = bounded_job, bounded_cost
+                if cost > self.memory_budget:
+                    logger.warning(f"{job[0]} needs about {cost / (1024 * 1024):.0f}MB, over the memory budget: "
+                                   f"running it alone")
+            fitted_jobs.append(job)
+            fitted_costs.append(cost)
+        return fitted_jobs, fitted_costs
+
+    def run(self, jobs, batch_id=None):
+        """Process jobs and block until all of them are done.
+
+        With a journal, pass the batch_id of an interrupted batch (and its remaining jobs)
+        to resume it; otherwise a new batch is begun. Returns a (processed_count,
+        failed_count) tuple.
+        """
+        self.report = []
+        if self.journal is not None:
+            self.batch_id = batch_id if batch_id is not None else self.journal.begin(jobs)
+        if self.profile_path is not None:
+            self._profile_folder = tempfile.mkdtemp(prefix="image_resizer_profile_")
+
+        if self.manifest is not None:
+            jobs, skipped = self.manifest.split_jobs(jobs)
+            for job in skipped:
+                self.report.append({"input": job[0], "status": "skipped"})
+                self.progress_queue.put(("skipped", job[0], job_outputs(job)))
+
+        self.duplicates = {}
+        self._duplicates_failed = 0
+        if self.dedupe:
+            jobs, self.duplicates = split_duplicates(jobs)
+
+        if self.plan_jobs:
+            self.plan = plan_batch(jobs)
+            self.progress_queue.put(("planned", self.plan))
+            # Plain copies go first, through the same workers (and I/O stages) as the resizes
+            jobs = self.plan.copies + self.plan.jobs
+
+        if self.memory_budget is not None:
+            if self.plan is not None:
+                costs = [self.plan.memory[job[0]] for job in jobs]
+            else:
+                costs = [estimate_job_memory(job) for job in jobs]
+            jobs, costs = self.fit_to_budget(jobs, costs)
+        else:
+            costs = [0] * len(jobs)
+
+        processed_count, failed_count = self.process(jobs, costs)
+        failed_count += self._duplicates_failed
+
+        if self.manifest is not None:
+            self.manifest.save()
+        if self.journal is not None and not self._cancel_event.is_set():
+            # A cancelled batch stays open so it can be resumed
+            self.journal.end(self.batch_id)
+        if self._profile_folder is not None:
+            self.merge_profiles()
+        self.progress_queue.put(("finished", processed_count, failed_count))
+        return processed_count, failed_count
+
+    def process(self, jobs, costs):
+        """Run the jobs (already filtered by the manifest) and return (processed_count, failed_count)."""
+        processed_count = 0
+        failed_count = 0
+        if self.workers == 1 or len(jobs) <= 1:
+            # No point paying for a pool when there is nothing to parallelise
+            for index, (job, cost) in enumerate(zip(jobs, costs)):
+                if self._cancel_event.is_set():
+                    break
+                try:
+                    metrics = run_job(*self.job_arguments(job, index))
+                    self.job_done(job, metrics)
+                    processed_count += 1
+                except Exception as e:
+                    self.job_failed(job, e)
+                    failed_count += 1
+        else:
+            pending = deque(enumerate(zip(jobs, costs)))
+            running = {}
+            memory_in_use = 0
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as executor:
+                while pending or running:
+                    # Admit jobs in order while a worker is free and the budget allows. A job that
+                    # doesn't fit waits for running jobs to finish; one larger than the whole
+                    # budget runs alone.
+                    while pending and len(running) < self.workers and not self._cancel_event.is_set():
+                        index, (job, cost) = pending[0]
+                        if running and self.memory_budget is not None and memory_in_use + cost > self.memory_budget:
+                            break
+                        pending.popleft()
+                        future = executor.submit(run_job, *self.job_arguments(job, index))
+                        running[future] = (job, cost)
+                        memory_in_use += cost
+
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job, cost = running.pop(future)
+                        memory_in_use -= cost
+                        try:
+                            self.job_done(job, future.result())
+                            processed_count += 1
+                        except Exception as e:
+                            self.job_failed(job, e)
+                            failed_count += 1
+        return processed_count, failed_count
+
+
+class PipelinedBatchEngine(BatchEngine):
+    """BatchEngine that overlaps reading, resizing and writing.
+
+    Reader threads prefetch input bytes into a bounded queue, workers resize from
+    memory and writer threads store the results, so slow storage and CPU work run
+    side by side. At most prefetch inputs wait in memory to be resized and as many
+    results wait to be written. Outputs are written atomically.
+
+    A single worker runs in a thread (Pillow releases the GIL while decoding,
+    resampling and encoding), more workers run in processes.
+    """
+    def __init__(self, workers=None, progress_queue=None, manifest=None, memory_budget_mb=None,
+                 profile_path=None, journal=None, dedupe=False, plan=False, io_threads=4, prefetch=8):
+        super().__init__(workers, progress_queue, manifest, memory_budget_mb, profile_path, journal, dedupe, plan)
+        self.io_threads = max(1, io_threads)
+        self.prefetch = max(1, prefetch)
+        self.memory = None
+        self._lock = threading.Lock()
+
+    def job_done(self, job, metrics):
+        with self._lock:
+            super().job_done(job, metrics)
+
+    def job_failed(self, job, error):
+        with self._lock:
+            super().job_failed(job, error)
+
+    def read_inputs(self, job_queue, read_queue, stop_event, memory):
+        """Reader thread: load input bytes for queued jobs until the queue is empty.
+
+        Each input's bytes are reserved against the memory budget before it's read, and
+        stay reserved until its job is done.
+        """
+        while not stop_event.is_set():
+            try:
+                index, job, cost = job_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                size = os.path.getsize(job[0])
+            except OSError:
+                size = 0
+            if not memory.reserve(size, stop_event):
+                break
+            start = time.perf_counter()
+            try:
+                with open(job[0], "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                data = e
+            read_queue.put((index, job, cost, size, data, time.perf_counter() - start))
+        read_queue.put(None)
+
+    def write_results(self, write_queue, counts):
+        """Writer thread: store finished jobs' outputs and report them."""
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            job, outcome, read_seconds = item
+            try:
+                if isinstance(outcome, Exception):
+                    raise outcome
+                metrics, outputs = outcome.result()
+                start = time.perf_counter()
+                write_outputs(outputs)
+                write_seconds = time.perf_counter() - start
+                metrics = dict(metrics, read_seconds=read_seconds,
+                               write_seconds=metrics["write_seconds"] + write_seconds,
+                               total_seconds=metrics["total_seconds"] + read_seconds + write_seconds,
+                               bytes_out=sum(len(data) for _, data, _ in outputs))
+                self.job_done(job, metrics)
+                status = "processed"
+            except Exception as e:
+                self.job_failed(job, e)
+                status = "failed"
+            with self._lock:
+                counts[status] += 1
+
+    def process(self, jobs, costs):
+        if not jobs:
+            return 0, 0
+        job_queue = queue.Queue()
+        for index, (job, cost) in enumerate(zip(jobs, costs)):
+            job_queue.put((index, job, cost))
+        read_queue = queue.Queue(maxsize=self.prefetch)
+        write_queue = queue.Queue(maxsize=self.prefetch)
+        stop_event = threading.Event()
+        counts = {"processed": 0, "failed": 0}
+        self.memory = memory = MemoryBudget(self.memory_budget)
+
+        readers = [threading.Thread(target=self.read_inputs, args=(job_queue, read_queue, stop_event, memory),
+                                    daemon=True)
+                   for _ in range(min(self.io_threads, len(jobs)))]
+        writers = [threading.Thread(target=self.write_results, args=(write_queue, counts), daemon=True)
+                   for _ in range(self.io_threads)]
+        for thread in readers + writers:
+            thread.start()
+
+        workers = min(self.workers, len(jobs))
+        executor_class = ThreadPoolExecutor if workers == 1 else ProcessPoolExecutor
+        running = {}
+        readers_left = len(readers)
+        waiting = None
+        try:
+            with executor_class(max_workers=workers) as executor:
+                while True:
+                    # Admit read jobs while a worker is free and the budget allows, as BatchEngine does
+                    while len(running) < workers and not self._cancel_event.is_set():
+                        if waiting is None:
+                            if readers_left == 0:
+                                break
+                            try:
+                                # Only block for input when there is nothing else to wait for
+                                waiting = read_queue.get(block=not running)
+                            except queue.Empty:
+                                break
+                            if waiting is None:
+                                readers_left -= 1
+                                continue
+                        index, job, cost, size, data, read_seconds = waiting
+                        if isinstance(data, Exception):
+                            memory.release(size)
+                            write_queue.put((job, data, read_seconds))
+                            waiting = None
+                            continue
+                        # The input's bytes are already reserved; a worker process also holds its own copy
+                        if workers > 1:
+                            cost += len(data)
+                        if not memory.try_reserve(cost, force=not running):
+                            break
+                        input_file, output_file, options, profile_path = self.job_arguments(job, index)
+                        future = executor.submit(run_buffered_job, input_file, output_file, options, data,
+                                                 profile_path)
+                        running[future] = (job, cost + size, read_seconds)
+                        waiting = None
+
+                    if not running:
+                        if readers_left == 0 or self._cancel_event.is_set():
+                            break
+                        continue
+                    # Poll while more input may be arriving for a free worker
+                    more_input = readers_left > 0 and len(running) < workers and not self._cancel_event.is_set()
+                    done, _ = wait(running, timeout=0.05 if more_input else None, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job, reserved, read_seconds = running.pop(future)
+                        memory.release(reserved)
+                        write_queue.put((job, future, read_seconds))
+        finally:
+            # Unblock readers (after a cancel they may be waiting on a full queue)
+            stop_event.set()
+            while any(thread.is_alive() for thread in readers):
+                try:
+                    read_queue.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+            for _ in writers:
+                write_queue.put(None)
+            for thread in writers:
+                thread.join()
+        return counts["processed"], counts["failed"]
@@ -0,0 +1,197 @@
+"""Benchmark resize_image on a deterministic synthetic corpus.
+
+    python benchmark.py --save-baseline baseline.json     # record a baseline on this machine
+    python benchmark.py --baseline baseline.json          # fail if a case regressed
+
+Each case runs in a fresh process so its peak RSS is not inflated by earlier cases.
+Timings are only comparable on the same machine; encode counts are deterministic.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+
+from PIL import Image, ImageDraw
+
+import image_resizer
+
+FORMATS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "TIFF": ".tif", "GIF": ".gif"}
+RESOLUTIONS = [(640, 480), (2048, 1536), (4000, 3000)]
+QUICK_RESOLUTIONS = [(640, 480), (1280, 960)]
+ENTROPY_LEVELS = ["low", "medium", "high"]
+CORPUS_SEED = 20240601
+# Pixel mode scales the shortest side to this fraction, small enough for JPEG draft decoding
+# and the pre-reducing resample; target mode aims for this fraction of the source size
+PIXEL_TARGET_RATIO = 0.2
+TARGET_SIZE_RATIO = 0.4
+DEFAULT_THRESHOLD = 0.25
+
+
+def synthetic_image(size, entropy, seed):
+    """Build a deterministic RGB test image.
+
+    low: smooth gradients with flat shapes (screenshots, graphics)
+    medium: upsampled noise, i.e. soft detail at several scales (typical photos)
+    high: per-pixel noise (worst case for every encoder)
+    """
+    rng = random.Random(seed)
+    width, height = size
+    if entropy == "high":
+        return Image.frombytes("RGB", size, rng.randbytes(width * height * 3))
+    if entropy == "medium":
+        small = (max(1, width // 16), max(1, height // 16))
+        base = Image.frombytes("RGB", small, rng.randbytes(small[0] * small[1] * 3)).resize(size, Image.Resampling.BICUBIC)
+        grain = (max(1, width // 2), max(1, height // 2))
+        detail = Image.frombytes("RGB", grain, rng.randbytes(grain[0] * grain[1] * 3)).resize(size, Image.Resampling.BILINEAR)
+        return Image.blend(base, detail, 0.25)
+
+    gradient = Image.linear_gradient("L").resize(size)
+    image = Image.merge("RGB", (gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), gradient.rotate(90)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(1, width // 3 + 2), y0 + rng.randrange(1, height // 3 + 2)
+        draw.rectangle((x0, y0, x1, y1), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return image
+
+
+def build_corpus(folder, resolutions=RESOLUTIONS, formats=FORMATS, entropy_levels=ENTROPY_LEVELS):
+    """Write the corpus into folder (reusing files already there) and return their paths."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for width, height in resolutions:
+        for entropy in entropy_levels:
+            image = None
+            for format, ext in formats.items():
+                path = os.path.join(folder, f"{format.lower()}-{width}x{height}-{entropy}{ext}")
+                if not os.path.exists(path):
+                    if image is None:
+                        seed = CORPUS_SEED + width * 7919 + height * 31 + ENTROPY_LEVELS.index(entropy)
+                        image = synthetic_image((width, height), entropy, seed)
+                    to_save = image.convert("P", palette=Image.Palette.ADAPTIVE) if format == "GIF" else image
+                    to_save.save(path, format=format)
+                paths.append(path)
+    return paths
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(input_path, mode, repeat):
+    """Time one case. Runs in its own process."""
+    if mode == "pixels":
+        _, width, height, _, _ = image_resizer.read_header(input_path)
+        options = {"scaled_size": max(1, round(min(width, height) * PIXEL_TARGET_RATIO))}
+    else:
+        options = {"target_size_mb": os.path.getsize(input_path) * TARGET_SIZE_RATIO / (1024 * 1024)}
+
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "output" + os.path.splitext(input_path)[1])
+        for _ in range(repeat):
+            metrics = image_resizer.ResizeMetrics()
+            start = time.perf_counter()
+            image_resizer.resize_image(input_path, output_path, metrics=metrics, **options)
+            timings.append(time.perf_counter() - start)
+            encodes = metrics.encodes
+        output_bytes = os.path.getsize(output_path)
+
+    return {
+        "seconds": statistics.median(timings),
+        "peak_rss_mb": peak_rss_mb(),
+        "encodes": encodes,
+        "output_bytes": output_bytes,
+    }
+
+
+def run_benchmarks(paths, modes=("pixels", "size"), repeat=3):
+    """Run every corpus file in every mode. Returns {case_name: result}."""
+    results = {}
+    # maxtasksperchild=1 gives each case a fresh process for a clean peak RSS
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        for path in paths:
+            for mode in modes:
+                name = f"{os.path.splitext(os.path.basename(path))[0]}/{mode}"
+                results[name] = pool.apply(run_case, (path, mode, repeat))
+                print(f"{name}: {results[name]['seconds'] * 1000:.1f} ms, "
+                      f"{results[name]['encodes']} encodes, peak RSS {results[name]['peak_rss_mb'] or 0:.0f} MB",
+                      file=sys.stderr)
+    return results
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare results against a baseline and return a list of regression messages.
+
+    Time and peak RSS may grow by threshold (a fraction) before counting as a regression;
+    encode counts are deterministic and may not grow at all.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric in ("seconds", "peak_rss_mb"):
+            if result.get(metric) is not None and expected.get(metric):
+                if result[metric] > expected[metric] * (1 + threshold):
+                    regressions.append(f"{name}: {metric} {result[metric]:.3f} > baseline {expected[metric]:.3f}")
+        if result["encodes"] > expected.get("encodes", result["encodes"]):
+            regressions.append(f"{name}: encodes {result['encodes']} > baseline {expected['encodes']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark resize_image on a synthetic image corpus")
+    parser.add_argument("--corpus", default=os.path.join(tempfile.gettempdir(), "image_resizer_bench_corpus"),
+                        help="Folder to generate (or reuse) the corpus in")
+    parser.add_argument("--quick", action="store_true", help="Use small resolutions only")
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument("--modes", nargs="+", choices=["pixels", "size"], default=["pixels", "size"])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the median time is reported")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Store the results as the baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="Fail if results regress against this baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed fractional slowdown before a case counts as regressed")
+    args = parser.parse_args(argv)
+
+    resolutions = QUICK_RESOLUTIONS if args.quick else RESOLUTIONS
+    formats = {format: FORMATS[format] for format in args.formats}
+    paths = build_corpus(args.corpus, resolutions=resolutions, formats=formats)
+    results = run_benchmarks(paths, modes=args.modes, repeat=args.repeat)
+
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import argparse
+import logging
+
+from image_resizer import DEFAULT_EFFORT, DEFAULT_PRESET, EFFORTS, OUTPUT_EXTENSIONS, RESIZE_PRESETS, find_input_files
+from batch_engine import BatchEngine, PipelinedBatchEngine, build_jobs, default_worker_count, write_report
+from manifest import Manifest
+from journal import BatchJournal
+from planner import plan_batch
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="image_resizer",
+        description="Batch resize images without the GUI. Progress is written to stdout as JSON lines.")
+    parser.add_argument("inputs", nargs="*", help="Image files or folders to resize")
+    parser.add_argument("-o", "--output", required=True, help="Output folder")
+    parser.add_argument("--pixels", type=int, nargs="+", metavar="PX",
+                        help="Shortest side of the output in pixels. Several sizes are produced from one decode")
+    parser.add_argument("--target-mb", type=float, nargs="+", metavar="MB",
+                        help="Target output file size in MB. Several sizes are produced from one decode")
+    parser.add_argument("--min-quality", type=int, metavar="Q",
+                        help="Lowest JPEG/WEBP quality the target size search may use before shrinking")
+    parser.add_argument("--preset", choices=list(RESIZE_PRESETS), default=DEFAULT_PRESET,
+                        help="Speed/quality preset for large downscales")
+    add_output_arguments(parser)
+    parser.add_argument("-w", "--workers", type=int, default=default_worker_count(),
+                        help="Number of worker processes")
+    parser.add_argument("--memory-budget-mb", type=float, metavar="MB",
+                        help="Only run jobs concurrently while their estimated memory fits in this budget")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Prefetch inputs and write outputs on I/O threads while workers resize "
+                             "(helps on slow or network storage)")
+    parser.add_argument("--io-threads", type=int, default=4, metavar="N",
+                        help="With --pipeline, number of reader and of writer threads")
+    parser.add_argument("--prefetch", type=int, default=8, metavar="N",
+                        help="With --pipeline, inputs read ahead (and results queued for writing) at most")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Descend into subfolders and mirror them in the output folder")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip inputs that are unchanged since the last run with the same settings "
+                             "(tracked in a manifest in the output folder)")
+    parser.add_argument("--hash", action="store_true",
+                        help="With --incremental, compare content hashes when a file's mtime changed")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Resize identical inputs only once and hard link (or copy) the other outputs")
+    parser.add_argument("--plan", action="store_true",
+                        help="Plan the batch from image headers first: report total pixels and an ETA, copy "
+                             "inputs already under the target size up front and resize the largest first")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report the plan (as with --plan) without resizing anything, then exit")
+    parser.add_argument("--resume", action="store_true",
+                        help="Finish the interrupted batch recorded in the output folder's journal, if any")
+    parser.add_argument("--undo", action="store_true",
+                        help="Delete every file written by the last batch into the output folder, then exit")
+    parser.add_argument("--report", metavar="PATH",
+                        help="Write per-file stage timings and byte counts (.csv or .json)")
+    parser.add_argument("--profile", metavar="PATH", help="Write merged cProfile stats for the batch")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log resize details to stderr")
+    return parser
+
+
+def add_output_arguments(parser):
+    """Add the transcoding options, shared with the worker and watch commands."""
+    parser.add_argument("--format", choices=[format.lower() for format in OUTPUT_EXTENSIONS],
+                        help="Transcode outputs to this format (JPEG outputs are progressive)")
+    parser.add_argument("--effort", choices=EFFORTS, default=DEFAULT_EFFORT,
+                        help="Encoder speed/effort for the written outputs; target size searches "
+                             "try their candidates at the fast effort")
+
+
+def output_options(args):
+    """resize_image options for the transcoding arguments (none for the defaults)."""
+    options = {}
+    if getattr(args, "format", None):
+        options["output_format"] = args.format.upper()
+    if getattr(args, "effort", DEFAULT_EFFORT) != DEFAULT_EFFORT:
+        options["effort"] = args.effort
+    return options
+
+
+def emit(event, **fields):
+    """Write one JSON progress record to stdout."""
+    sys.stdout.write(json.dumps(dict(event=event, **fields)) + "\n")
+    sys.stdout.flush()
+
+
+def emit_plan(plan, workers):
+    emit("plan", resize=len(plan.jobs), copy=len(plan.copies), pixels=plan.total_pixels,
+         bytes=plan.total_bytes, estimated_seconds=round(plan.estimated_seconds(workers), 1))
+
+
+def collect_jobs(args):
+    """Expand the input paths into resize jobs."""
+    if args.pixels and args.target_mb or len(args.pixels or args.target_mb) > 1:
+        # Several variants per input, each named after the input via get_output_filename
+        resize_mode, scaled_size, target_size_mb = "variants", args.pixels, args.target_mb
+    elif args.pixels:
+        resize_mode, scaled_size, target_size_mb = "pixels", args.pixels[0], None
+    else:
+        resize_mode, scaled_size, target_size_mb = "size", None, args.target_mb[0]
+
+    options = dict(output_options(args), preset=args.preset)
+    if args.min_quality is not None:
+        options["min_quality"] = args.min_quality
+
+    jobs = []
+    for path in args.inputs:
+        if os.path.isdir(path):
+            input_files = find_input_files(path, recursive=args.recursive, exclude=(args.output,))
+            jobs.extend(build_jobs(input_files, args.output, resize_mode, scaled_size, target_size_mb,
+                                   input_root=path if args.recursive else None, **options))
+        elif os.path.isfile(path):
+            jobs.extend(build_jobs([path], args.output, resize_mode, scaled_size, target_size_mb, **options))
+    return jobs
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    journal = BatchJournal(args.output)
+    if args.undo:
+        undone = journal.undo_last_batch()
+        emit("undone", removed=undone or 0)
+        return 0
+    interrupted = journal.interrupted_batch() if args.resume else None
+
+    if interrupted is None and not args.inputs:
+        parser.error("the following arguments are required: inputs")
+    if interrupted is None and not args.pixels and not args.target_mb:
+        parser.error("one of --pixels or --target-mb is required")
+    if any(size <= 0 for size in args.pixels or []):
+        parser.error("--pixels must be greater than 0")
+    if any(size <= 0 for size in args.target_mb or []):
+        parser.error("--target-mb must be greater than 0")
+    if args.workers <= 0:
+        parser.error("--workers must be at least 1")
+    if args.memory_budget_mb is not None and args.memory_budget_mb <= 0:
+        parser.error("--memory-budget-mb must be greater than 0")
+    if args.io_threads <= 0 or args.prefetch <= 0:
+        parser.error("--io-threads and --prefetch must be at least 1")
+
+    # Keep stdout for JSON progress; resize details go to stderr
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(message)s", stream=sys.stderr)
+
+    if interrupted is not None:
+        # The batch's own jobs and settings; inputs and size options are ignored
+        batch_id, jobs, done_count = interrupted
+        emit("resume", batch=batch_id, done=done_count, remaining=len(jobs))
+    else:
+        batch_id = None
+        jobs = collect_jobs(args)
+        if not jobs:
+            parser.error("no valid input files found")
+
+    if args.dry_run:
+        emit_plan(plan_batch(jobs), args.workers)
+        journal.close()
+        return 0
+
+    for output_folder in {os.path.dirname(output_file) for _, output_file, _ in jobs}:
+        os.makedirs(output_folder, exist_ok=True)
+
+    manifest = Manifest(args.output, use_hash=args.hash) if args.incremental else None
+    if args.pipeline:
+        engine = PipelinedBatchEngine(workers=args.workers, manifest=manifest, memory_budget_mb=args.memory_budget_mb,
+                                      profile_path=args.profile, journal=journal, dedupe=args.dedupe,
+                                      plan=args.plan, io_threads=args.io_threads, prefetch=args.prefetch)
+    else:
+        engine = BatchEngine(workers=args.workers, manifest=manifest, memory_budget_mb=args.memory_budget_mb,
+                             profile_path=args.profile, journal=journal, dedupe=args.dedupe, plan=args.plan)
+    emit("start", total=len(jobs), workers=engine.workers)
+    engine.start(jobs, batch_id)
+
+    skipped_count = 0
+    duplicate_count = 0
+    while True:
+        kind, *fields = engine.progress_queue.get()
+        if kind == "done":
+            emit("done", input=fields[0], outputs=fields[1])
+        elif kind == "skipped":
+            skipped_count += 1
+            emit("skipped", input=fields[0], outputs=fields[1])
+        elif kind == "duplicate":
+            duplicate_count += 1
+            emit("duplicate", input=fields[0], outputs=fields[1], duplicate_of=fields[2])
+        elif kind == "failed":
+            emit("failed", input=fields[0], error=fields[1])
+        elif kind == "planned":
+            emit_plan(fields[0], engine.workers)
+        elif kind == "finished":
+            processed_count, failed_count = fields
+            if args.report:
+                write_report(engine.report, args.report)
+            counts = dict(processed=processed_count, skipped=skipped_count, failed=failed_count)
+            if args.dedupe:
+                counts["duplicates"] = duplicate_count
+            emit("finished", **counts)
+            journal.close()
+            return 1 if failed_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
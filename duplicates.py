@@ -0,0 +1,64 @@
+import os
+import json
+import uuid
+
+from image_resizer import atomic_copy
+from manifest import file_hash
+
+
+def split_duplicates(jobs):
+    """Split jobs into (unique_jobs, duplicates).
+
+    Inputs with identical content and resize options are duplicates: only the first
+    one's job is kept, and duplicates maps its input file to the jobs that can reuse its
+    outputs. Only files whose size matches another input's are hashed, so a batch
+    without duplicates costs one stat per file.
+    """
+    sizes = {}
+    for input_file, _, options in jobs:
+        try:
+            size = os.path.getsize(input_file)
+        except OSError:
+            continue
+        sizes.setdefault((size, json.dumps(options, sort_keys=True)), []).append(input_file)
+    candidates = {input_file for group in sizes.values() if len(group) > 1 for input_file in group}
+
+    unique, duplicates, originals, hashes = [], {}, {}, {}
+    for job in jobs:
+        input_file, _, options = job
+        if input_file not in candidates:
+            unique.append(job)
+            continue
+        try:
+            if input_file not in hashes:
+                hashes[input_file] = file_hash(input_file)
+        except OSError:
+            unique.append(job)
+            continue
+        key = (hashes[input_file], json.dumps(options, sort_keys=True))
+        original = originals.get(key)
+        if original is None or os.path.abspath(original) == os.path.abspath(input_file):
+            originals.setdefault(key, input_file)
+            unique.append(job)
+        else:
+            duplicates.setdefault(original, []).append(job)
+    return unique, duplicates
+
+
+def link_or_copy(source, target):
+    """Make target a hard link to source, or an atomic copy where links aren't possible
+    (other file system, FAT, ...). An existing target is replaced."""
+    if os.path.abspath(source) == os.path.abspath(target):
+        return
+    folder, name = os.path.split(target)
+    temp_path = os.path.join(folder, f".{name}.{uuid.uuid4().hex}.tmp")
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        atomic_copy(source, target)
+        return
+    try:
+        os.replace(temp_path, target)
+    except BaseException:
+        os.remove(temp_path)
+        raise
@@ -0,0 +1,716 @@
+import os
+import queue
+import logging
+import threading
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+from PIL import ImageTk
+from tkinterdnd2 import DND_FILES, TkinterDnD  # Import tkinterdnd2
+
+from image_resizer import (DEFAULT_EFFORT, DEFAULT_PRESET, EFFORTS, OUTPUT_EXTENSIONS, RESIZE_PRESETS, as_list,
+                           find_input_files, get_output_filename)
+from batch_engine import PipelinedBatchEngine, build_jobs, default_worker_count
+from manifest import Manifest
+from journal import BatchJournal
+from thumbnails import THUMBNAIL_SIZE, ThumbnailCache, ThumbnailLoader, default_cache_folder
+from watcher import FolderWatcher, check_output_folder
+
+# Output format choice that keeps each input's format
+SAME_FORMAT = "Same"
+
+
+class DragDropEntry(ttk.Entry):
+    """Custom Entry widget that supports drag and drop."""
+    def __init__(self, master=None, **kwargs):
+        super().__init__(master, **kwargs)
+        
+        # Enable drag and drop
+        self.drop_target_register(DND_FILES)
+        self.dnd_bind('<<Drop>>', self.drop)
+
+    def drop(self, event):
+        """Handle dropped files."""
+        data = event.data
+        
+        # Remove unnecessary curly braces from file paths
+        if data.startswith('{') and data.endswith('}'):
+            data = data[1:-1]
+
+        # Update the entry with the dropped path
+        self.delete(0, tk.END)
+        self.insert(0, data.strip())
+
+
+class PreviewPanel(tk.Frame):
+    """Scrollable thumbnail grid of an input folder with a before/after preview of the selected image.
+
+    Only the cells in view exist on the canvas. Thumbnails are produced by a
+    ThumbnailLoader thread and picked up with after(), so large folders never block the
+    Tk loop. get_options returns the current resize_image options for the preview, or
+    None when the settings are invalid.
+    """
+    CELL = THUMBNAIL_SIZE[0] + 24
+    COLUMNS = 3
+    POLL_MS = 50
+
+    def __init__(self, master, get_options, cache=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.get_options = get_options
+        self.loader = ThumbnailLoader(cache or ThumbnailCache(default_cache_folder()), wanted=self.is_visible)
+        self.files = []
+        self.selected = None
+        self._cells = {}       # index -> canvas item ids
+        self._photos = {}      # index -> PhotoImage (kept alive while the cell is in view)
+        self._requested = set()
+        self._visible = set()
+        self._preview_photos = []
+
+        self.canvas = tk.Canvas(self, width=self.CELL * self.COLUMNS, height=self.CELL * 3, bg="white",
+                                highlightthickness=0)
+        scrollbar = tk.Scrollbar(self, orient="vertical", command=self.scroll)
+        self.canvas.config(yscrollcommand=scrollbar.set)
+        self.canvas.grid(row=0, column=0, columnspan=2, sticky="nsew")
+        scrollbar.grid(row=0, column=2, sticky="ns")
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll("scroll", -1 if event.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda event: self.scroll("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll("scroll", 1, "units"))
+        self.canvas.bind("<Button-1>", self.on_click)
+
+        self.before_label = tk.Label(self, text="Before", compound="top", font=("Arial", 8))
+        self.before_label.grid(row=1, column=0, padx=5, pady=5)
+        self.after_label = tk.Label(self, text="After", compound="top", font=("Arial", 8))
+        self.after_label.grid(row=1, column=1, padx=5, pady=5)
+        self.grid_rowconfigure(0, weight=1)
+
+        self.after(self.POLL_MS, self.poll_results)
+
+    def show_folder(self, folder):
+        """List folder in the background and show its images."""
+        self.loader.clear()
+        self.set_files([])
+        if os.path.isdir(folder):
+            self.loader.request_listing(folder)
+
+    def set_files(self, files):
+        self.files = list(files)
+        self.selected = None
+        self.canvas.delete("all")
+        self._cells.clear()
+        self._photos.clear()
+        self._requested.clear()
+        self._visible.clear()
+        rows = -(-len(self.files) // self.COLUMNS)
+        self.canvas.config(scrollregion=(0, 0, self.CELL * self.COLUMNS, rows * self.CELL))
+        self.canvas.yview_moveto(0)
+        self.before_label.config(image="", text="Before")
+        self.after_label.config(image="", text="After")
+        self.refresh()
+
+    def scroll(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def is_visible(self, path):
+        # Called from the loader thread; reading a set is safe under the GIL
+        return path in self._visible
+
+    def visible_range(self):
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(0, int(top // self.CELL)) * self.COLUMNS
+        last = (int(bottom // self.CELL) + 1) * self.COLUMNS
+        return range(first, min(last, len(self.files)))
+
+    def refresh(self):
+        """Create the cells in view, drop the rest and request missing thumbnails."""
+        in_view = self.visible_range()
+        for index in list(self._cells):
+            if index not in in_view:
+                for item in self._cells.pop(index):
+                    self.canvas.delete(item)
+                self._photos.pop(index, None)
+                self._requested.discard(index)
+        self._visible = {self.files[index] for index in in_view}
+        # Request the last cells first: the loader serves the newest request first
+        for index in in_view:
+            if index not in self._cells:
+                x = (index % self.COLUMNS) * self.CELL
+                y = (index // self.COLUMNS) * self.CELL
+                name = os.path.basename(self.files[index])
+                self._cells[index] = [
+                    self.canvas.create_rectangle(x + 4, y + 4, x + self.CELL - 4, y + self.CELL - 4,
+                                                 outline="light gray"),
+                    self.canvas.create_text(x + self.CELL // 2, y + self.CELL - 10, font=("Arial", 7),
+                                            text=name if len(name) <= 20 else name[:17] + "..."),
+                ]
+        for index in reversed(in_view):
+            if index not in self._requested:
+                self._requested.add(index)
+                self.loader.request_thumbnail(self.files[index])
+
+    def on_click(self, event):
+        column = int(self.canvas.canvasx(event.x) // self.CELL)
+        index = int(self.canvas.canvasy(event.y) // self.CELL) * self.COLUMNS + column
+        if column < self.COLUMNS and index < len(self.files):
+            self.select(self.files[index])
+
+    def select(self, path):
+        """Show a before/after preview of path with the current settings."""
+        self.selected = path
+        options = self.get_options()
+        if options is None:
+            self.after_label.config(image="", text="After\n(check the settings)")
+            return
+        self.after_label.config(image="", text="After\n(working...)")
+        self.loader.request_preview(path, options)
+
+    def poll_results(self):
+        while True:
+            try:
+                generation, kind, path, result = self.loader.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.loader.generation:
+                continue
+            if kind == "listing":
+                self.set_files(result)
+            elif kind == "thumbnail":
+                self.show_thumbnail(path, result)
+            elif kind == "preview" and path == self.selected:
+                self.show_preview(result)
+            elif kind == "error" and path == self.selected:
+                self.after_label.config(image="", text=f"After\n{result}")
+        self.after(self.POLL_MS, self.poll_results)
+
+    def show_thumbnail(self, path, image):
+        for index in self._cells:
+            if self.files[index] == path:
+                photo = ImageTk.PhotoImage(image)
+                self._photos[index] = photo
+                x = (index % self.COLUMNS) * self.CELL + self.CELL // 2
+                y = (index // self.COLUMNS) * self.CELL + (self.CELL - 14) // 2
+                self._cells[index].append(self.canvas.create_image(x, y, image=photo))
+                return
+
+    def show_preview(self, preview):
+        self._preview_photos = []
+        for label, title in ((self.before_label, "Before"), (self.after_label, "After")):
+            image, (width, height), size = preview[title.lower()]
+            photo = ImageTk.PhotoImage(image)
+            self._preview_photos.append(photo)
+            label.config(image=photo, text=f"{title}: {width}x{height}, {size / 1024:.0f} KB")
+
+
+# Ensure the main window uses TkinterDnD for drag-and-drop support
+class ImageResizerApp:
+    def __init__(self, root):
+        self.root = root
+        self.progress_queue = queue.Queue()
+        self.batch_engine = None
+        self.skipped_count = 0
+        self.duplicate_count = 0
+        
+        # Input & Output folder selection
+        tk.Label(root, text="Input Folder:").grid(row=0, column=0, sticky="w", padx=5, pady=5)
+        self.input_folder = tk.StringVar()
+        self.input_folder_entry = DragDropEntry(root, width=50, textvariable=self.input_folder)
+        self.input_folder_entry.grid(row=0, column=1, padx=5, pady=5)
+        tk.Button(root, text="Browse", command=self.select_input_folder).grid(row=0, column=2, padx=5, pady=5)
+
+        tk.Label(root, text="Output Folder:").grid(row=1, column=0, sticky="w", padx=5, pady=5)
+        self.output_folder = tk.StringVar()
+        self.output_folder_entry = DragDropEntry(root, width=50, textvariable=self.output_folder)
+        self.output_folder_entry.grid(row=1, column=1, padx=5, pady=5)
+        tk.Button(root, text="Browse", command=self.select_output_folder).grid(row=1, column=2, padx=5, pady=5)
+
+        # Drag and drop info label
+        dnd_label = tk.Label(root, text="Tip: You can drag & drop folders into the input fields", 
+                             font=("Arial", 8, "italic"), fg="gray")
+        dnd_label.grid(row=2, column=0, columnspan=3, padx=5, pady=(0, 5))
+
+        # Resizing mode selection
+        tk.Label(root, text="Resize Mode:").grid(row=3, column=0, sticky="w", padx=5, pady=5)
+        
+        # Create a frame to hold the radio buttons
+        radio_frame = tk.Frame(root)
+        radio_frame.grid(row=3, column=1, sticky="w", padx=5, pady=5)
+        
+        self.resize_mode = tk.StringVar(value="pixels")
+        tk.Radiobutton(radio_frame, text="Pixels", variable=self.resize_mode, value="pixels", 
+                      command=self.toggle_options).pack(side=tk.LEFT, padx=(0, 10))
+        tk.Radiobutton(radio_frame, text="File Size (MB)", variable=self.resize_mode, value="size", 
+                      command=self.toggle_options).pack(side=tk.LEFT)
+
+        # Output format (transcoding) and encoder effort
+        tk.Label(radio_frame, text="Output:").pack(side=tk.LEFT, padx=(15, 5))
+        self.output_format = tk.StringVar(value=SAME_FORMAT)
+        ttk.Combobox(radio_frame, textvariable=self.output_format, values=[SAME_FORMAT] + list(OUTPUT_EXTENSIONS),
+                     state="readonly", width=8).pack(side=tk.LEFT)
+        tk.Label(radio_frame, text="Effort:").pack(side=tk.LEFT, padx=(15, 5))
+        self.effort = tk.StringVar(value=DEFAULT_EFFORT)
+        ttk.Combobox(radio_frame, textvariable=self.effort, values=list(EFFORTS),
+                     state="readonly", width=8).pack(side=tk.LEFT)
+
+        # Pixel size input
+        tk.Label(root, text="Shortest Side (px):").grid(row=4, column=0, sticky="w", padx=5, pady=5)
+        self.pixel_size_entry = tk.Entry(root, width=10)
+        self.pixel_size_entry.insert(0, "1000")
+        self.pixel_size_entry.grid(row=4, column=1, padx=5, pady=5, sticky="w")
+
+        # File size input
+        tk.Label(root, text="Target Size (MB):").grid(row=5, column=0, sticky="w", padx=5, pady=5)
+        self.file_size_entry = tk.Entry(root, width=10)
+        self.file_size_entry.insert(0, "1.0")  # Default value for clarity
+        self.file_size_entry.grid(row=5, column=1, padx=5, pady=5, sticky="w")
+        self.file_size_entry.config(state="disabled")  # Disabled initially
+
+        # Worker process count and speed/quality preset
+        tk.Label(root, text="Workers:").grid(row=6, column=0, sticky="w", padx=5, pady=5)
+        performance_frame = tk.Frame(root)
+        performance_frame.grid(row=6, column=1, sticky="w", padx=5, pady=5)
+        self.workers_entry = tk.Entry(performance_frame, width=10)
+        self.workers_entry.insert(0, str(default_worker_count()))
+        self.workers_entry.pack(side=tk.LEFT)
+        tk.Label(performance_frame, text="Preset:").pack(side=tk.LEFT, padx=(15, 5))
+        self.preset = tk.StringVar(value=DEFAULT_PRESET)
+        ttk.Combobox(performance_frame, textvariable=self.preset, values=list(RESIZE_PRESETS),
+                     state="readonly", width=10).pack(side=tk.LEFT)
+        tk.Label(performance_frame, text="Memory (MB):").pack(side=tk.LEFT, padx=(15, 5))
+        self.memory_budget_entry = tk.Entry(performance_frame, width=8)  # Empty means unlimited
+        self.memory_budget_entry.pack(side=tk.LEFT)
+        self.skip_unchanged = tk.BooleanVar(value=False)
+        tk.Checkbutton(performance_frame, text="Skip unchanged files",
+                       variable=self.skip_unchanged).pack(side=tk.LEFT, padx=(15, 0))
+        self.skip_duplicates = tk.BooleanVar(value=False)
+        tk.Checkbutton(performance_frame, text="Link duplicates",
+                       variable=self.skip_duplicates).pack(side=tk.LEFT, padx=(5, 0))
+
+        # Format information
+        supported_formats = "Supported formats: JPG, JPEG, PNG, BMP, TIFF, GIF, WEBP, HEIC, HEIF, AVIF"
+        format_label = tk.Label(root, text=supported_formats, font=("Arial", 8), fg="dark blue")
+        format_label.grid(row=7, column=0, columnspan=3, padx=5, pady=(0, 5), sticky="w")
+
+        # Progress bar
+        self.progress = ttk.Progressbar(root, orient="horizontal", length=300, mode="determinate")
+        self.progress.grid(row=8, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
+
+        # Button frame for aligned buttons
+        button_frame = tk.Frame(root)
+        button_frame.grid(row=9, column=0, columnspan=3, pady=10, sticky="ew")
+        
+        # Process Button (left-aligned in frame)
+        self.process_button = tk.Button(button_frame, text="Resize Images", 
+                                      command=self.process_images, 
+                                      bg="green", fg="white")
+        self.process_button.pack(side=tk.LEFT, padx=5)
+
+        # Stops the batch after the images being resized; it can be resumed later
+        self.cancel_button = tk.Button(button_frame, text="Cancel", command=self.cancel_batch, state="disabled")
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        self.batch_cancelled = False
+
+        # Keeps resizing new images as they arrive in the input folder
+        self.watch_button = tk.Button(button_frame, text="Watch Folder", command=self.toggle_watch)
+        self.watch_button.pack(side=tk.LEFT, padx=5)
+        self.watch_queue = queue.Queue()
+        self.watch_stop = None
+        self.watch_counts = [0, 0]
+
+        # Undo Button (right-aligned in frame)
+        self.undo_button = tk.Button(button_frame, text="Undo Last Batch", 
+                                   command=self.undo_last_batch, 
+                                   state="disabled", bg="orange", fg="white")
+        self.undo_button.pack(side=tk.RIGHT, padx=5)
+
+        # Status label
+        self.status_label = tk.Label(root, text="Ready", font=("Arial", 9))
+        self.status_label.grid(row=10, column=0, columnspan=3, padx=5, pady=5)
+
+        # Thumbnails of the input folder and a before/after preview of the clicked image
+        self.preview_panel = PreviewPanel(root, self.preview_options)
+        self.preview_panel.grid(row=0, column=3, rowspan=11, sticky="nsew", padx=5, pady=5)
+        root.grid_columnconfigure(3, weight=1)
+        self._shown_folder = None
+        self._preview_update = None
+        # Typing, browsing and drag & drop all change the entry's variable
+        self.input_folder.trace_add("write", lambda *args: self.schedule_preview_update())
+        # Batches are journaled in their output folder, so undo is offered for it even after a restart
+        self.output_folder.trace_add("write", lambda *args: self.update_undo_state())
+
+    def toggle_options(self):
+        """Enable/Disable input fields based on selected resize mode."""
+        if self.resize_mode.get() == "pixels":
+            self.pixel_size_entry.config(state="normal")
+            self.file_size_entry.config(state="disabled")
+        else:
+            self.pixel_size_entry.config(state="disabled")
+            self.file_size_entry.config(state="normal")
+
+    def select_input_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.input_folder_entry.delete(0, tk.END)
+            self.input_folder_entry.insert(0, folder)
+
+    def update_undo_state(self):
+        """Enable Undo when the output folder's journal has a batch to undo."""
+        if self.batch_engine is not None and self.batch_engine.is_running():
+            return
+        output_folder = self.output_folder_entry.get().strip()
+        try:
+            undoable = bool(output_folder) and BatchJournal(output_folder).last_undoable_batch() is not None
+        except OSError:
+            undoable = False
+        self.undo_button.config(state="normal" if undoable else "disabled")
+
+    def schedule_preview_update(self):
+        # Wait for typing to pause before listing the folder
+        if self._preview_update is not None:
+            self.root.after_cancel(self._preview_update)
+        self._preview_update = self.root.after(400, self.update_preview_folder)
+
+    def update_preview_folder(self):
+        """Show the input folder in the preview panel when it changed."""
+        self._preview_update = None
+        folder = self.input_folder_entry.get().strip()
+        if folder != self._shown_folder:
+            self._shown_folder = folder
+            self.preview_panel.show_folder(folder)
+
+    def preview_options(self):
+        """Current settings as resize_image options for the preview, or None if they are invalid."""
+        try:
+            if self.resize_mode.get() == "pixels":
+                options = {"scaled_size": self.parse_sizes(self.pixel_size_entry.get(), int)}
+            else:
+                options = {"target_size_mb": self.parse_sizes(self.file_size_entry.get(), float)}
+        except ValueError:
+            return None
+        if min(as_list(options.get("scaled_size") or options.get("target_size_mb"))) <= 0:
+            return None
+        return dict(options, preset=self.preset.get(), **self.output_options())
+
+    def output_options(self):
+        """The output format and effort as resize_image options (none for the defaults)."""
+        options = {}
+        if self.output_format.get() != SAME_FORMAT:
+            options["output_format"] = self.output_format.get()
+        if self.effort.get() != DEFAULT_EFFORT:
+            options["effort"] = self.effort.get()
+        return options
+
+    def select_output_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.output_folder_entry.delete(0, tk.END)
+            self.output_folder_entry.insert(0, folder)
+
+    def get_output_filename(self, input_path, resize_mode, scaled_size=None, target_size_mb=None):
+        """Generate output filename with appropriate suffix"""
+        return get_output_filename(input_path, resize_mode, scaled_size, target_size_mb)
+
+    def parse_sizes(self, text, convert):
+        """Parse a size field. Returns a single value, or a list for comma-separated sizes."""
+        sizes = [convert(part.strip()) for part in text.split(',') if part.strip()]
+        if not sizes:
+            raise ValueError("No size given")
+        return sizes[0] if len(sizes) == 1 else sizes
+
+    def parse_memory_budget(self):
+        """Return the memory budget in MB, or None when the field is empty (unlimited)."""
+        text = self.memory_budget_entry.get().strip()
+        return float(text) if text else None
+
+    def process_images(self):
+        input_path = self.input_folder_entry.get().strip()
+        output_folder = self.output_folder_entry.get().strip()
+
+        # An interrupted batch into this folder (crash, kill or cancel) can pick up where it stopped
+        journal = BatchJournal(output_folder)
+        interrupted = journal.interrupted_batch() if output_folder else None
+        if interrupted is not None:
+            batch_id, jobs, done_count = interrupted
+            if messagebox.askyesno("Resume Batch",
+                                   f"The last batch into this folder was interrupted after {done_count} images.\n"
+                                   f"Resume it and process the remaining {len(jobs)}?"):
+                try:
+                    workers = int(self.workers_entry.get())
+                except ValueError:
+                    workers = default_worker_count()
+                try:
+                    memory_budget_mb = self.parse_memory_budget()
+                except ValueError:
+                    memory_budget_mb = None
+                if memory_budget_mb is not None and memory_budget_mb <= 0:
+                    messagebox.showerror("Error", "Memory budget must be greater than 0 MB")
+                    return
+                self.start_batch(jobs, journal, max(1, workers), memory_budget_mb, batch_id)
+                return
+
+        # Handle multiple input files
+        input_files = []
+        if ',' in input_path:  # Multiple files
+            paths = [p.strip() for p in input_path.split(',')]
+            for path in paths:
+                if os.path.isfile(path):
+                    input_files.append(path)
+        elif os.path.isfile(input_path):  # Single file
+            input_files.append(input_path)
+        elif os.path.isdir(input_path):  # Directory
+            input_files = find_input_files(input_path)
+        
+        if not input_files:
+            messagebox.showerror("Error", "No valid input files found")
+            return
+            
+        # Create output folder if it doesn't exist
+        os.makedirs(output_folder, exist_ok=True)
+
+        # Get resizing parameters
+        resize_mode = self.resize_mode.get()
+        
+        try:
+            # Several comma-separated sizes produce one variant per size from a single decode
+            if resize_mode == "pixels":
+                scaled_size = self.parse_sizes(self.pixel_size_entry.get(), int)
+                target_size_mb = None
+                if min(as_list(scaled_size)) <= 0:
+                    messagebox.showerror("Error", "Pixel size must be greater than 0")
+                    return
+            else:
+                scaled_size = None
+                target_size_mb = self.parse_sizes(self.file_size_entry.get(), float)
+                
+                if min(as_list(target_size_mb)) <= 0:
+                    messagebox.showerror("Error", "Target size must be greater than 0 MB")
+                    return
+            workers = int(self.workers_entry.get())
+            if workers <= 0:
+                messagebox.showerror("Error", "Workers must be at least 1")
+                return
+            memory_budget_mb = self.parse_memory_budget()
+            if memory_budget_mb is not None and memory_budget_mb <= 0:
+                messagebox.showerror("Error", "Memory budget must be greater than 0 MB")
+                return
+        except ValueError:
+            messagebox.showerror("Error", "Please enter valid numeric values")
+            return
+
+        jobs = build_jobs(input_files, output_folder, resize_mode, scaled_size, target_size_mb,
+                          preset=self.preset.get(), **self.output_options())
+        self.start_batch(jobs, journal, workers, memory_budget_mb)
+
+    def start_batch(self, jobs, journal, workers, memory_budget_mb, batch_id=None):
+        """Process jobs in the background; progress comes back through the queue."""
+        output_folder = self.output_folder_entry.get().strip()
+        self.process_button.config(state="disabled")
+        self.undo_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.batch_cancelled = False
+        self.progress["maximum"] = len(jobs)
+        self.progress["value"] = 0
+        self.status_label.config(text=f"Processing {len(jobs)} images with {workers} worker(s)...")
+        
+        # Unchanged inputs from earlier runs into this folder are skipped via its manifest
+        manifest = Manifest(output_folder) if self.skip_unchanged.get() else None
+        self.skipped_count = 0
+        self.duplicate_count = 0
+        self.job_seconds = None
+        self.estimated_seconds = None
+        # Identical inputs are resized once; the other copies get hard links to its outputs.
+        # The batch is planned from image headers so the progress bar follows the work, not the file count.
+        # Inputs are read ahead and outputs written on I/O threads, so slow network folders keep the workers busy
+        self.batch_engine = PipelinedBatchEngine(workers=workers, progress_queue=self.progress_queue,
+                                                 manifest=manifest, memory_budget_mb=memory_budget_mb,
+                                                 journal=journal, dedupe=self.skip_duplicates.get(), plan=True)
+        self.batch_engine.start(jobs, batch_id)
+        self.root.after(100, self.poll_progress)
+
+    def poll_progress(self):
+        """Drain batch engine events and update the UI. Reschedules itself until the batch is finished."""
+        while True:
+            try:
+                event = self.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            kind = event[0]
+            if kind == "planned":
+                _, plan = event
+                self.job_seconds = plan.seconds
+                self.estimated_seconds = plan.estimated_seconds(self.batch_engine.workers)
+                # From here on the bar counts estimated seconds of work
+                self.progress["maximum"] = max(plan.total_seconds, 1e-6)
+                self.progress["value"] = 0
+                self.status_label.config(
+                    text=f"Processing {len(plan.jobs) + len(plan.copies)} images "
+                         f"({plan.total_pixels / 1e6:.0f} megapixels), about {self.format_eta(1.0)} left...")
+            elif kind == "done":
+                _, input_file, output_files = event
+                self.advance_progress(input_file)
+                self.status_label.config(text=f"Processed: {os.path.basename(input_file)}"
+                                              + (f", about {self.format_eta()} left" if self.job_seconds else ""))
+            elif kind == "skipped":
+                self.skipped_count += 1
+                self.advance_progress(event[1])
+            elif kind == "duplicate":
+                self.duplicate_count += 1
+                self.advance_progress(event[1])
+            elif kind == "failed":
+                _, input_file, error = event
+                print(f"Error processing {input_file}: {error}")
+                self.advance_progress(input_file)
+            elif kind == "finished":
+                _, processed_count, failed_count = event
+                self.finish_batch(processed_count, failed_count)
+                return
+
+        self.root.after(100, self.poll_progress)
+
+    def advance_progress(self, input_file):
+        """Advance the bar by a file, or by its share of the planned work once the plan is in."""
+        if self.job_seconds is None:
+            self.progress["value"] += 1
+        else:
+            self.progress["value"] += self.job_seconds.get(input_file, 0)
+
+    def format_eta(self, remaining_fraction=None):
+        """Format the plan's estimate of the time left (proportional to the work left)."""
+        if remaining_fraction is None:
+            remaining_fraction = max(0.0, 1 - self.progress["value"] / self.progress["maximum"])
+        seconds = round(self.estimated_seconds * remaining_fraction)
+        return f"{seconds // 60}m {seconds % 60:02d}s" if seconds >= 60 else f"{seconds}s"
+
+    def cancel_batch(self):
+        """Stop starting new images. The journal keeps the batch open, so it can be resumed."""
+        if self.batch_engine is None or not self.batch_engine.is_running():
+            return
+        self.batch_engine.cancel()
+        self.batch_cancelled = True
+        self.cancel_button.config(state="disabled")
+        self.status_label.config(text="Cancelling: waiting for the images being resized...")
+
+    def finish_batch(self, processed_count, failed_count):
+        # Re-enable buttons
+        self.batch_engine.journal.close()
+        self.process_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+        self.update_undo_state()
+        
+        # Show completion message
+        if self.batch_cancelled:
+            self.status_label.config(text=f"Cancelled: {processed_count} processed, {failed_count} failed")
+            messagebox.showinfo("Batch Cancelled",
+                                f"{processed_count} images were resized before the batch was cancelled.\n"
+                                "Click Resize Images with the same output folder to resume it.")
+        elif self.skipped_count > 0 or self.duplicate_count > 0:
+            self.status_label.config(text=f"Completed: {processed_count} processed, "
+                                          f"{self.skipped_count} unchanged, {self.duplicate_count} duplicates, "
+                                          f"{failed_count} failed")
+            messagebox.showinfo("Processing Complete",
+                              f"{processed_count} images were resized.\n{self.skipped_count} unchanged images were skipped."
+                              f"\n{self.duplicate_count} duplicate images reused another copy's output."
+                              f"\n{failed_count} images failed processing.")
+        elif failed_count > 0:
+            self.status_label.config(text=f"Completed: {processed_count} processed, {failed_count} failed")
+            messagebox.showinfo("Processing Complete", 
+                              f"{processed_count} images were successfully resized.\n{failed_count} images failed processing.")
+        else:
+            self.status_label.config(text=f"Completed: {processed_count} images processed")
+            messagebox.showinfo("Success", "All images have been resized!")
+
+    def toggle_watch(self):
+        """Start or stop resizing images as they arrive in the input folder."""
+        if self.watch_stop is not None:
+            self.watch_stop.set()
+            self.watch_stop = None
+            self.watch_button.config(text="Watch Folder")
+            self.process_button.config(state="normal")
+            self.status_label.config(text="Stopped watching")
+            return
+
+        input_folder = self.input_folder_entry.get().strip()
+        output_folder = self.output_folder_entry.get().strip()
+        options = self.preview_options()
+        if not os.path.isdir(input_folder) or not output_folder:
+            messagebox.showerror("Error", "Choose an input folder and an output folder to watch")
+            return
+        if options is None:
+            messagebox.showerror("Error", "Please enter valid numeric values")
+            return
+        try:
+            workers = max(1, int(self.workers_entry.get()))
+        except ValueError:
+            workers = default_worker_count()
+
+        try:
+            check_output_folder(input_folder, output_folder)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
+        os.makedirs(output_folder, exist_ok=True)
+        scaled_size = options.pop("scaled_size", None)
+        target_size_mb = options.pop("target_size_mb", None)
+        watcher = FolderWatcher(input_folder, output_folder, self.resize_mode.get(), scaled_size, target_size_mb,
+                                workers=workers, on_event=lambda *event: self.watch_queue.put(event), **options)
+        self.watch_stop = threading.Event()
+        self.watch_counts = [0, 0]
+        threading.Thread(target=self.run_watcher, args=(watcher, self.watch_stop), daemon=True).start()
+        self.watch_button.config(text="Stop Watching")
+        self.process_button.config(state="disabled")
+        self.status_label.config(text=f"Watching {input_folder} for new images...")
+        self.root.after(200, self.poll_watch)
+
+    def run_watcher(self, watcher, stop_event):
+        """Watch thread: runs the watcher and reports it if it stops on an error."""
+        try:
+            watcher.run(stop_event)
+        except Exception as e:
+            self.watch_queue.put(("stopped", watcher.folder, str(e)))
+
+    def poll_watch(self):
+        """Show watch mode progress. Reschedules itself while watching."""
+        while True:
+            try:
+                kind, input_file, detail = self.watch_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "stopped":
+                if self.watch_stop is not None:
+                    self.toggle_watch()
+                self.status_label.config(text="Stopped watching after an error")
+                messagebox.showerror("Watch Folder", f"Stopped watching {input_file}: {detail}")
+                continue
+            if kind == "done":
+                self.watch_counts[0] += 1
+            else:
+                self.watch_counts[1] += 1
+                print(f"Error processing {input_file}: {detail}")
+            self.status_label.config(text=f"Watching: {self.watch_counts[0]} resized, {self.watch_counts[1]} failed "
+                                          f"(last: {os.path.basename(input_file)})")
+        if self.watch_stop is not None:
+            self.root.after(200, self.poll_watch)
+
+    def undo_last_batch(self):
+        """Undo the last batch written into the output folder (recorded in its journal)"""
+        journal = BatchJournal(self.output_folder_entry.get().strip())
+        removed = journal.undo_last_batch()
+        journal.close()
+        if removed is not None:
+            self.status_label.config(text=f"Last batch operation undone ({removed} files removed)")
+            self.update_undo_state()
+            messagebox.showinfo("Undo Complete", "The last batch operation has been undone")
+        else:
+            messagebox.showinfo("Nothing to Undo", "No operations to undo")
+
+
+def run():
+    """Start the desktop application."""
+    # Show resize progress messages on the console as before
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    root = TkinterDnD.Tk()  # Use TkinterDnD.Tk() instead of tk.Tk()
+    root.title("Batch Image Resizer")
+    app = ImageResizerApp(root)
+    root.mainloop()
@@ -1,144 +1,737 @@
 import os
+import sys
 import shutil  # Add this import at the top
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from tkinterdnd2 import DND_FILES, TkinterDnD  # Import tkinterdnd2
-from PIL import Image, ImageTk
+import logging
+import multiprocessing
+from PIL import Image
 import io
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# GUI modules (tkinter, tkinterdnd2) are only imported by the GUI entry point so the
+# resizer can be used on headless machines. See gui.py and cli.py.
+
+logger = logging.getLogger(__name__)
+
+VALID_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", 
+                    ".tif", ".gif", ".webp", ".heic", ".heif", ".avif"}
+DEFAULT_QUALITY = 95
+LOSSY_FORMATS = {"JPEG", "WEBP", "AVIF"}
+# Formats outputs can be transcoded to, and the extension their files get
+OUTPUT_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp", "AVIF": ".avif"}
+# Formats that may hold animations, resized frame by frame (see animation.py)
+ANIMATED_FORMATS = {"GIF", "WEBP"}
+ANIMATED_EXTENSIONS = {".gif", ".webp"}
+# A target-size result is accepted once it lands within 5% under the target
+SEARCH_TOLERANCE = 0.05
+# Speed/quality presets: (JPEG draft headroom, LANCZOS reducing_gap).
+# Draft headroom is how much larger than the output the reduced JPEG decode must stay;
+# reducing_gap lets Pillow pre-shrink with Image.reduce before the final resample.
+# None disables the shortcut.
+RESIZE_PRESETS = {
+    "quality": (None, None),
+    "balanced": (2.0, 3.0),
+    "fast": (1.0, 2.0),
+}
+DEFAULT_PRESET = "balanced"
+# Encoder speed/effort presets: extra save options per format. "balanced" is Pillow's
+# default for every format. Target size searches encode their candidates at
+# SEARCH_EFFORT and only refine the result at the requested effort.
+ENCODER_EFFORTS = {
+    "JPEG": {"fast": {}, "balanced": {}, "thorough": {"optimize": True, "progressive": True}},
+    "PNG": {"fast": {"compress_level": 1}, "balanced": {}, "thorough": {"optimize": True}},
+    "WEBP": {"fast": {"method": 0}, "balanced": {"method": 4}, "thorough": {"method": 6}},
+    "AVIF": {"fast": {"speed": 10}, "balanced": {"speed": 6}, "thorough": {"speed": 2}},
+}
+EFFORTS = ("fast", "balanced", "thorough")
+DEFAULT_EFFORT = "balanced"
+SEARCH_EFFORT = "fast"
+# Encodes spent refining a search's result at the requested effort
+FINAL_ATTEMPTS = 3
+# A smaller variant is resampled from the previous (larger) one when that is at least
+# this many times its size; otherwise it is resampled from the source.
+CASCADE_HEADROOM = 2.0
+# Bytes Pillow allocates per pixel by image mode; modes not listed are stored in 32 bits
+MODE_BYTES_PER_PIXEL = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16L": 2, "I;16B": 2}
+# Fixed allowance per job for the worker's own codec buffers and bookkeeping
+JOB_OVERHEAD_BYTES = 16 * 1024 * 1024
+
+
+class ResizeMetrics:
+    """Per-file stage timings and counters collected by resize_image.
+
+    Times are in seconds per stage: decode, resample, encode, write and copy (a file
+    already under its target size copied as is). attempts counts target size search encodes
+    and encodes every encode of an output, in any mode.
+    """
+    STAGES = ("decode", "resample", "encode", "write", "copy")
 
+    def __init__(self):
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.attempts = 0
+        self.encodes = 0
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def as_dict(self):
+        return dict({f"{name}_seconds": seconds for name, seconds in self.seconds.items()}, attempts=self.attempts,
+                    encodes=self.encodes)
+
+
+def atomic_write(path, data):
+    """Write data through a temporary file in the same folder and a rename, so a partial
+    output file never appears under its final name."""
+    folder, name = os.path.split(path)
+    temp_path = os.path.join(folder, f".{name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temp_path, "xb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def atomic_copy(input_path, output_path):
+    """Copy a file with its metadata, atomically like atomic_write."""
+    folder, name = os.path.split(output_path)
+    temp_path = os.path.join(folder, f".{name}.{uuid.uuid4().hex}.tmp")
+    try:
+        shutil.copy2(input_path, temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class FileIO:
+    """How resize_image reads its source and stores its outputs: directly on disk."""
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def open(self, path):
+        return Image.open(path)
+
+    def write(self, path, data):
+        atomic_write(path, data)
+
+    def copy(self, input_path, output_path):
+        atomic_copy(input_path, output_path)
+
+    def output_size(self, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+
+class BufferedIO(FileIO):
+    """Reads the source from prefetched bytes and keeps outputs in memory.
+
+    Lets resize_image run without touching (possibly slow) storage; a separate stage
+    writes outputs afterwards. outputs holds (path, data, copied_from) entries, where
+    copied_from is the source path for plain copies so its metadata can be kept.
+    """
+    def __init__(self, input_path, data):
+        self.input_path = input_path
+        self.data = data
+        self.outputs = []
+
+    def size(self, path):
+        return len(self.data) if path == self.input_path else super().size(path)
+
+    def open(self, path):
+        return Image.open(io.BytesIO(self.data)) if path == self.input_path else super().open(path)
+
+    def write(self, path, data):
+        self.outputs.append((path, data, None))
+
+    def copy(self, input_path, output_path):
+        self.outputs.append((output_path, self.data, input_path))
+
+    def output_size(self, path):
+        return sum(len(data) for output_path, data, _ in self.outputs if output_path == path)
+
+
+def write_file(file_io, path, data, metrics):
+    with metrics.stage("write"):
+        file_io.write(path, data)
+
+
+def copy_file(file_io, input_path, output_path, metrics):
+    with metrics.stage("copy"):
+        file_io.copy(input_path, output_path)
+
+
+def encoder_options(format, effort=DEFAULT_EFFORT, progressive=False):
+    """Return the save options for format at one of EFFORTS (none for formats without presets).
+
+    progressive makes JPEGs progressive whatever the effort.
+    """
+    options = dict(ENCODER_EFFORTS.get(format, {}).get(effort, {}))
+    if progressive and format == "JPEG":
+        options["progressive"] = True
+    return options
+
+
+def encode_image(image, format, quality=None, options=None):
+    """Encode an image in memory with the same settings used for the written output.
+
+    options are extra save options (see encoder_options).
+    """
+    buffer = io.BytesIO()
+    options = options or {}
+    if format in LOSSY_FORMATS:
+        image.save(buffer, format=format, quality=quality or DEFAULT_QUALITY, **options)
+    else:
+        image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def convert_for_format(image, format):
+    """Convert image to a mode format can store: JPEG has no alpha, so transparent
+    pixels are flattened onto white. Other formats convert on save as needed."""
+    if format != "JPEG" or image.mode in ("RGB", "L", "CMYK"):
+        return image
+    if image.has_transparency_data:
+        rgba = image.convert("RGBA")
+        flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        return flattened
+    return image.convert("RGB")
+
+
+def decode_reduced(image, scale, preset):
+    """Let a JPEG decode at a reduced DCT scale (1/2, 1/4 or 1/8) when the output is much smaller.
+
+    Must be called before the image is loaded. The decoded image is never smaller than
+    the output size times the preset's draft headroom. Other formats are left untouched.
+    """
+    headroom, _ = RESIZE_PRESETS[preset]
+    if headroom is None or image.format != "JPEG" or scale * headroom >= 1:
+        return
+    width, height = image.size
+    image.draft(image.mode, (max(1, int(width * scale * headroom)), max(1, int(height * scale * headroom))))
+
+
+def resample(image, size, preset):
+    """Resize with LANCZOS, pre-reducing by an integer factor on large downscales if the preset allows."""
+    _, reducing_gap = RESIZE_PRESETS[preset]
+    width, height = image.size
+    factor = min(width / size[0], height / size[1])
+    # reducing_gap only has an effect once the downscale factor exceeds it
+    if reducing_gap is not None and factor >= reducing_gap:
+        return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+def predict_value(points, target_bytes, fit_value, too_big, upper):
+    """Predict the parameter value expected to encode to target_bytes.
+
+    Encoded size is modelled as a power law of the parameter (size = a * value**k).
+    With two or more measurements the exponent is fitted from the last two (a secant
+    step in log-log space); with one measurement k=2 is assumed, which is exact for
+    bytes-per-pixel when the parameter is a linear scale. Predictions outside the
+    current bracket fall back to bisection.
+    """
+    value, size = points[-1]
+    exponent = 2.0
+    if len(points) >= 2:
+        prev_value, prev_size = points[-2]
+        if prev_value != value and prev_size > 0 and size > 0 and prev_size != size:
+            exponent = math.log(size / prev_size) / math.log(value / prev_value)
+
+    hi = too_big if too_big is not None else upper
+    if size > 0 and exponent > 0:
+        guess = value * (target_bytes / size) ** (1 / exponent)
+        if too_big is None:
+            guess = min(guess, upper)
+        if fit_value < guess < hi or (too_big is None and guess == upper and upper > fit_value):
+            return guess
+    return (fit_value + hi) / 2
+
+
+def model_search(encode_at, target_bytes, lower, upper, first=None, seed=(), max_attempts=10,
+                 resolution=0.0, quantize=None, size_of=len):
+    """Find the largest value in [lower, upper] whose encoding fits in target_bytes.
+
+    encode_at(value) returns an (image, data) pair and size_of(data) its size in bytes.
+    seed holds (value, size_bytes) measurements already made by the caller. Returns
+    ((value, image, data) or None, attempts).
+    """
+    aim_bytes = target_bytes * (1 - SEARCH_TOLERANCE / 2)
+    points = list(seed)
+    fit_value = max([lower] + [v for v, size in points if size <= target_bytes])
+    too_big = min([v for v, size in points if size > target_bytes], default=None)
+    best = None
+    attempts = 0
+
+    value = first if first is not None else predict_value(points, aim_bytes, fit_value, too_big, upper)
+    while attempts < max_attempts:
+        if quantize is not None:
+            value = quantize(value)
+        if any(value == measured for measured, _ in points):
+            break
+
+        image, data = encode_at(value)
+        attempts += 1
+        size = size_of(data)
+        points.append((value, size))
+
+        if size <= target_bytes:
+            if best is None or value > best[0]:
+                best = (value, image, data)
+            fit_value = max(fit_value, value)
+            if size >= target_bytes * (1 - SEARCH_TOLERANCE) or value >= upper:
+                break
+        else:
+            too_big = value if too_big is None else min(too_big, value)
+
+        hi = too_big if too_big is not None else upper
+        if hi - fit_value <= resolution:
+            break
+        value = predict_value(points, aim_bytes, fit_value, too_big, upper)
+
+    return best, attempts
+
+
+def target_size_bytes_for(target_size_mb):
+    """Convert a target size in MB to the byte budget the search aims for."""
+    # Convert MB to bytes using base-2 (1 MB = 1048576 bytes)
+    target_size_bytes = target_size_mb * 1024 * 1024
+    # Add a 2% safety margin to account for filesystem variations
+    return target_size_bytes * 0.98
+
+
+def first_scale_guess(target_size_bytes, current_size_bytes):
+    """Estimate the scale that meets the target, assuming the source's bytes-per-pixel."""
+    return min(1.0, math.sqrt(target_size_bytes * (1 - SEARCH_TOLERANCE / 2) / current_size_bytes))
+
+
+def uses_quality_search(format, min_quality):
+    return min_quality is not None and format in LOSSY_FORMATS and min_quality < DEFAULT_QUALITY
+
+
+def search_target_size(image, format, src_width, target_size_mb, first_scale, min_quality=None,
+                       preset=DEFAULT_PRESET, metrics=None, effort=DEFAULT_EFFORT, progressive=False):
+    """Find the largest encoding of image that fits in target_size_mb.
+
+    image may already be draft-decoded below src_width; scales are searched relative to
+    its decoded size. Candidates are encoded at SEARCH_EFFORT; if effort encodes
+    differently, the result is then refined with up to FINAL_ATTEMPTS encodes at effort
+    (kept as found if none fits). Returns a (resized_image, encoded_bytes) pair.
+    """
+    metrics = metrics if metrics is not None else ResizeMetrics()
+    search_options = encoder_options(format, SEARCH_EFFORT, progressive)
+    final_options = encoder_options(format, effort, progressive)
+    target_size_bytes = target_size_bytes_for(target_size_mb)
+    orig_width, orig_height = image.size
+    decoded_ratio = orig_width / src_width
+    max_attempts = 10  # Limit the number of encodes spent finding the optimal size
+    attempts = 0
+
+    def encode_at(scale, quality, options=search_options):
+        nonlocal attempts
+        new_width = max(1, int(orig_width * scale))
+        new_height = max(1, int(orig_height * scale))
+        if (new_width, new_height) == (orig_width, orig_height):
+            resized = image
+        else:
+            with metrics.stage("resample"):
+                resized = resample(image, (new_width, new_height), preset)
+        with metrics.stage("encode"):
+            data = encode_image(resized, format, quality, options)
+        attempts += 1
+        metrics.attempts += 1
+        metrics.encodes += 1
+        logger.info(f"Attempt {attempts}: Scale={scale * decoded_ratio:.2f}, Quality={quality or DEFAULT_QUALITY}, "
+              f"Size={len(data) / (1024 * 1024):.2f}MB (Target: {target_size_mb}MB)")
+        return resized, data
+
+    quality = None
+    best = None
+    scale_seed = []
+    quality_found = False
+    if uses_quality_search(format, min_quality):
+        # Keep full resolution if some quality >= min_quality meets the target
+        resized, data = encode_at(1.0, min_quality)
+        if len(data) <= target_size_bytes:
+            found, _ = model_search(
+                lambda q: encode_at(1.0, q), target_size_bytes, min_quality, DEFAULT_QUALITY,
+                seed=[(min_quality, len(data))], max_attempts=max_attempts - attempts,
+                resolution=1, quantize=lambda q: int(round(q)))
+            quality, resized, data = found or (min_quality, resized, data)
+            best = (1.0, resized, data)
+            quality_found = True
+        else:
+            # Even the lowest allowed quality is too big at full size: shrink at that quality
+            quality = min_quality
+            scale_seed = [(1.0, len(data))]
+
+    if best is None:
+        best, _ = model_search(
+            lambda scale: encode_at(scale, quality), target_size_bytes, 0.0, 1.0,
+            first=None if scale_seed else min(1.0, first_scale / decoded_ratio), seed=scale_seed,
+            max_attempts=max_attempts - attempts, resolution=0.005)
+
+    if best is None:
+        raise ValueError("Could not find suitable size within constraints")
+
+    if final_options != search_options:
+        # Sizes differ between efforts: the slower encoder usually leaves room for more
+        # quality or pixels, and may also overshoot
+        if quality_found:
+            refined, _ = model_search(
+                lambda q: encode_at(1.0, q, final_options), target_size_bytes, min_quality, DEFAULT_QUALITY,
+                first=quality, max_attempts=FINAL_ATTEMPTS, resolution=1, quantize=lambda q: int(round(q)))
+            if refined is not None:
+                quality, resized, data = refined
+                best = (1.0, resized, data)
+        else:
+            refined, _ = model_search(
+                lambda scale: encode_at(scale, quality, final_options), target_size_bytes, 0.0, 1.0,
+                first=best[0], max_attempts=FINAL_ATTEMPTS, resolution=0.005)
+            best = refined or best
+
+    _, final_image, data = best
+    logger.info(f"Final size: {len(data) / (1024 * 1024):.2f}MB after {attempts} encodes")
+    return final_image, data
+
+
+def resize_image(input_path, output_path, scaled_size=None, target_size_mb=None, min_quality=None,
+                 preset=DEFAULT_PRESET, metrics=None, file_io=None, output_format=None, effort=DEFAULT_EFFORT):
+    """Resize an image while maintaining aspect ratio. Optionally compress to a target file size.
+
+    In target size mode, JPEG and WEBP output may also lower the encoder quality down to
+    min_quality before giving up resolution. preset is one of RESIZE_PRESETS and controls
+    the reduced-resolution decode shortcuts used on large downscales.
+
+    scaled_size and target_size_mb may also be lists, in which case all the sizes are
+    produced from a single decode (see resize_variants) and a list is returned.
+    Animated GIFs and WebPs keep all their frames (see animation.resize_animation).
+
+    output_format (one of OUTPUT_EXTENSIONS) transcodes the output, to progressive JPEG
+    for "JPEG"; files under their target size are then encoded too instead of copied.
+    effort is the encoder's speed/effort preset (see ENCODER_EFFORTS).
+
+    Pass a ResizeMetrics as metrics to collect per-stage timings, and a FileIO as file_io
+    to change how the source is read and outputs are stored (by default outputs are
+    written atomically to disk).
+    """
+    if preset not in RESIZE_PRESETS:
+        raise ValueError(f"Invalid preset: {preset}")
+    if output_format is not None and output_format not in OUTPUT_EXTENSIONS:
+        raise ValueError(f"Invalid output format: {output_format}")
+    if effort not in EFFORTS:
+        raise ValueError(f"Invalid effort: {effort}")
+    metrics = metrics if metrics is not None else ResizeMetrics()
+    file_io = file_io if file_io is not None else FileIO()
+    # A JPEG can't hold an animation: its first frame is resized like a still image
+    if os.path.splitext(input_path)[1].lower() in ANIMATED_EXTENSIONS and output_format != "JPEG":
+        from animation import is_animation, resize_animation  # animation imports this module
+        with file_io.open(input_path) as image:
+            if is_animation(image):
+                return resize_animation(image, input_path, output_path, scaled_size, target_size_mb, min_quality,
+                                        preset, metrics, file_io, output_format, effort)
+    if isinstance(scaled_size, (list, tuple)) or isinstance(target_size_mb, (list, tuple)):
+        return resize_variants(input_path, output_path, as_list(scaled_size), as_list(target_size_mb),
+                               min_quality=min_quality, preset=preset, metrics=metrics, file_io=file_io,
+                               output_format=output_format, effort=effort)
+    progressive = output_format == "JPEG"
 
-def resize_image(input_path, output_path, scaled_size=None, target_size_mb=None):
-    """Resize an image while maintaining aspect ratio. Optionally compress to a target file size."""
     if target_size_mb is not None:
-        # Convert MB to bytes using base-2 (1 MB = 1048576 bytes)
-        target_size_bytes = target_size_mb * 1024 * 1024
-        # Add a 2% safety margin to account for filesystem variations
-        target_size_bytes = target_size_bytes * 0.98
+        target_size_bytes = target_size_bytes_for(target_size_mb)
         
         # Check current file size in bytes
-        current_size_bytes = os.path.getsize(input_path)
-        if current_size_bytes <= target_size_bytes:
-            shutil.copy2(input_path, output_path)
-            print(f"Skipped resizing: file already under target size ({current_size_bytes / (1024 * 1024):.2f}MB)")
+        current_size_bytes = file_io.size(input_path)
+        if current_size_bytes <= target_size_bytes and output_format is None:
+            copy_file(file_io, input_path, output_path, metrics)
+            logger.info(f"Skipped resizing: file already under target size ({current_size_bytes / (1024 * 1024):.2f}MB)")
             return None
 
-        image = Image.open(input_path)
-        format = image.format
-        orig_width, orig_height = image.size
-
-        # Binary search for the optimal scaling factor
-        left = 0.0  # Minimum scale (0%)
-        right = 1.0  # Maximum scale (100%)
-        best_scale = None
-        best_size_mb = 0
-        attempts = 0
-        max_attempts = 10  # Limit the number of attempts to find optimal size
-
-        while attempts < max_attempts and (best_scale is None or right - left > 0.01):
-            scale = (left + right) / 2
-            new_width = int(orig_width * scale)
-            new_height = int(orig_height * scale)
-            
-            # Ensure minimum dimensions of 1 pixel
-            new_width = max(1, new_width)
-            new_height = max(1, new_height)
-            
-            # Try this size
-            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            temp_output = io.BytesIO()
+        with metrics.stage("decode"):
+            image = file_io.open(input_path)
+            format = output_format or image.format
+            src_width = image.size[0]
+            first_scale = first_scale_guess(target_size_bytes, current_size_bytes)
+            if not uses_quality_search(format, min_quality):
+                # The quality search needs full resolution; the scale search only needs headroom
+                # above the first guess
+                decode_reduced(image, first_scale, preset)
+            image.load()
+            if output_format is not None:
+                image = convert_for_format(image, format)
+
+        final_image, data = search_target_size(image, format, src_width, target_size_mb, first_scale,
+                                               min_quality, preset, metrics, effort, progressive)
+
+        # Write the best encoding found instead of resizing and encoding it again
+        write_file(file_io, output_path, data, metrics)
+        return final_image
+
+    else:
+        # Handle pixel-based resizing as before
+        if not isinstance(scaled_size, (int, float)):
+            raise ValueError(f"Invalid scaled_size value: {scaled_size}")
             
-            if format == 'JPEG':
-                resized.save(temp_output, format=format, quality=95)
-            elif format == 'PNG':
-                resized.save(temp_output, format=format, optimize=True)
-            elif format == 'WEBP':
-                resized.save(temp_output, format=format, quality=95)
-            else:
-                resized.save(temp_output, format=format)
+        with metrics.stage("decode"):
+            image = file_io.open(input_path)
+            format = output_format or image.format
+            width, height = image.size
             
-            # Calculate size in bytes
-            size_bytes = len(temp_output.getvalue())
-            size_mb = size_bytes / (1024 * 1024)
+            scale_factor = scaled_size / min(width, height)
+            new_width = int(width * scale_factor)
+            new_height = int(height * scale_factor)
             
-            if size_bytes <= target_size_bytes:
-                # This size works, try a larger scale
-                left = scale
-                if size_bytes > best_size_mb * (1024 * 1024):  # Convert best_size_mb to bytes for comparison
-                    best_scale = scale
-                    best_size_mb = size_mb
-            else:
-                # Too big, try a smaller scale
-                right = scale
+            new_width = max(1, new_width)
+            new_height = max(1, new_height)
             
-            attempts += 1
-            print(f"Attempt {attempts}: Scale={scale:.2f}, Size={size_mb:.2f}MB (Target: {target_size_mb}MB)")
+            decode_reduced(image, scale_factor, preset)
+            image.load()
+            if output_format is not None:
+                image = convert_for_format(image, format)
+
+        with metrics.stage("resample"):
+            resized_image = resample(image, (new_width, new_height), preset)
+        with metrics.stage("encode"):
+            buffer = io.BytesIO()
+            resized_image.save(buffer, format=format, **encoder_options(format, effort, progressive))
+        metrics.encodes += 1
+        write_file(file_io, output_path, buffer.getvalue(), metrics)
+        return resized_image
 
-        if best_scale is None:
-            raise ValueError("Could not find suitable size within constraints")
 
-        # Use the best scale found
-        final_width = int(orig_width * best_scale)
-        final_height = int(orig_height * best_scale)
-        final_image = image.resize((final_width, final_height), Image.Resampling.LANCZOS)
-        
-        # Save with the best parameters found
-        if format == 'JPEG':
-            final_image.save(output_path, format=format, quality=95)
-        elif format == 'PNG':
-            final_image.save(output_path, format=format, optimize=True)
-        elif format == 'WEBP':
-            final_image.save(output_path, format=format, quality=95)
-        else:
-            final_image.save(output_path, format=format)
-        
-        print(f"Final size: {os.path.getsize(output_path) / (1024 * 1024):.2f}MB")
-        return final_image
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
 
-    else:
-        # Handle pixel-based resizing as before
+
+def resize_variants(input_path, output_path, scaled_sizes=(), target_sizes_mb=(), min_quality=None,
+                    preset=DEFAULT_PRESET, metrics=None, file_io=None, output_format=None, effort=DEFAULT_EFFORT):
+    """Write several sizes of one image from a single decode.
+
+    output_path is the base name: each variant is written to
+    get_output_filename(output_path, ...), as listed by variant_output_paths. Pixel variants
+    are resampled largest first, each from the previous variant when that is still at least
+    CASCADE_HEADROOM times larger, otherwise from the source. Returns the written images in
+    variant_output_paths order (None where a file under its target size was copied as is).
+    """
+    for scaled_size in scaled_sizes:
         if not isinstance(scaled_size, (int, float)):
             raise ValueError(f"Invalid scaled_size value: {scaled_size}")
-            
-        image = Image.open(input_path)
-        format = image.format
-        width, height = image.size
-        
-        scale_factor = scaled_size / min(width, height)
-        new_width = int(width * scale_factor)
-        new_height = int(height * scale_factor)
-        
-        new_width = max(1, new_width)
-        new_height = max(1, new_height)
-        
-        resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        resized_image.save(output_path, format=format)
-        return resized_image
+    metrics = metrics if metrics is not None else ResizeMetrics()
+    file_io = file_io if file_io is not None else FileIO()
+
+    current_size_bytes = file_io.size(input_path)
+    decode_start = time.perf_counter()
+    image = file_io.open(input_path)
+    format = output_format or image.format
+    progressive = output_format == "JPEG"
+    src_width, src_height = image.size
+
+    # The largest scale any variant needs limits how far a JPEG may be draft-decoded
+    needed_scales = [scaled_size / min(src_width, src_height) for scaled_size in scaled_sizes]
+    first_scales = {}
+    for target_size_mb in target_sizes_mb:
+        target_size_bytes = target_size_bytes_for(target_size_mb)
+        if current_size_bytes > target_size_bytes or output_format is not None:
+            first_scales[target_size_mb] = first_scale_guess(target_size_bytes, current_size_bytes)
+            needed_scales.append(1.0 if uses_quality_search(format, min_quality) else first_scales[target_size_mb])
+    if needed_scales:
+        decode_reduced(image, max(needed_scales), preset)
+        image.load()
+        if output_format is not None:
+            image = convert_for_format(image, format)
+    else:
+        # Every variant is a plain copy of a file already under its target: only the header was needed
+        image.close()
+    metrics.seconds["decode"] += time.perf_counter() - decode_start
+
+    results = {}
+    previous = image
+    for scaled_size in sorted(set(scaled_sizes), reverse=True):
+        scale_factor = scaled_size / min(src_width, src_height)
+        new_size = (max(1, int(src_width * scale_factor)), max(1, int(src_height * scale_factor)))
+        # Cascading from a much larger variant is indistinguishable from resampling the source
+        if min(previous.size) < CASCADE_HEADROOM * min(new_size):
+            previous = image
+        with metrics.stage("resample"):
+            resized_image = resample(previous, new_size, preset)
+        with metrics.stage("encode"):
+            buffer = io.BytesIO()
+            resized_image.save(buffer, format=format, **encoder_options(format, effort, progressive))
+        metrics.encodes += 1
+        write_file(file_io, get_output_filename(output_path, "pixels", scaled_size), buffer.getvalue(), metrics)
+        results[("pixels", scaled_size)] = resized_image
+        previous = resized_image
+
+    for target_size_mb in target_sizes_mb:
+        variant_path = get_output_filename(output_path, "size", target_size_mb=target_size_mb)
+        if target_size_mb not in first_scales:
+            copy_file(file_io, input_path, variant_path, metrics)
+            logger.info(f"Skipped resizing: file already under target size ({current_size_bytes / (1024 * 1024):.2f}MB)")
+            results[("size", target_size_mb)] = None
+            continue
+        final_image, data = search_target_size(image, format, src_width, target_size_mb,
+                                               first_scales[target_size_mb], min_quality, preset, metrics,
+                                               effort, progressive)
+        write_file(file_io, variant_path, data, metrics)
+        results[("size", target_size_mb)] = final_image
+
+    return ([results[("pixels", scaled_size)] for scaled_size in scaled_sizes]
+            + [results[("size", target_size_mb)] for target_size_mb in target_sizes_mb])
+
+
+def variant_output_paths(output_path, scaled_size=None, target_size_mb=None):
+    """Return the files resize_image writes for output_path and the given size settings."""
+    if isinstance(scaled_size, (list, tuple)) or isinstance(target_size_mb, (list, tuple)):
+        return ([get_output_filename(output_path, "pixels", scaled_size=size) for size in as_list(scaled_size)]
+                + [get_output_filename(output_path, "size", target_size_mb=size) for size in as_list(target_size_mb)])
+    return [output_path]
+
+
+def draft_fraction(format, scale, preset):
+    """Return the linear fraction of the source that decode_reduced would decode (1, 1/2, 1/4 or 1/8)."""
+    headroom, _ = RESIZE_PRESETS[preset]
+    fraction = 1.0
+    if headroom is None or format != "JPEG":
+        return fraction
+    while fraction > 1 / 8 and fraction / 2 >= scale * headroom:
+        fraction /= 2
+    return fraction
+
+
+def read_header(input_path):
+    """Return an image's (format, width, height, mode, frame_count) without decoding the pixels."""
+    with Image.open(input_path) as image:
+        frame_count = getattr(image, "n_frames", 1) if image.format in ANIMATED_FORMATS else 1
+        return image.format, image.size[0], image.size[1], image.mode, frame_count
+
+
+def variant_scales(format, width, height, current_size_bytes, scaled_size=None, target_size_mb=None,
+                   min_quality=None, output_format=None):
+    """Return (pixel_scales, search_scales) for the variants a job actually resizes.
+
+    pixel_scales are the exact scales of the pixel size variants. search_scales are the
+    scales the target size searches start from (full resolution for a quality search);
+    targets the file is already under are plain copies and have none, unless the job
+    transcodes to output_format.
+    """
+    pixel_scales = [size / min(width, height) for size in as_list(scaled_size)]
+    search_scales = []
+    for size_mb in as_list(target_size_mb):
+        target_size_bytes = target_size_bytes_for(size_mb)
+        if current_size_bytes > target_size_bytes or output_format is not None:
+            search_scales.append(1.0 if uses_quality_search(output_format or format, min_quality)
+                                 else first_scale_guess(target_size_bytes, current_size_bytes))
+    return pixel_scales, search_scales
+
+
+def is_plain_copy(current_size_bytes, scaled_size=None, target_size_mb=None, output_format=None):
+    """True if every output of a job is a copy of an input already under its target size."""
+    targets = as_list(target_size_mb)
+    return output_format is None and not as_list(scaled_size) and bool(targets) and all(
+        current_size_bytes <= target_size_bytes_for(size_mb) for size_mb in targets)
+
+
+def estimate_memory_bytes(input_path, scaled_size=None, target_size_mb=None, min_quality=None,
+                          preset=DEFAULT_PRESET, header=None, output_format=None, effort=DEFAULT_EFFORT):
+    """Estimate the peak memory resize_image needs for a file from its header, without decoding it.
+
+    Counts the decoded source (after any JPEG draft reduction), every resized frame kept
+    alive, and for target size mode the candidate frame and encode buffers of the search.
+    Pass header (see read_header) if it was already read. effort doesn't change the estimate.
+    """
+    format, width, height, mode, _ = header if header is not None else read_header(input_path)
+    bytes_per_pixel = MODE_BYTES_PER_PIXEL.get(mode, 4)
+    current_size_bytes = os.path.getsize(input_path)
+
+    pixel_scales, search_scales = variant_scales(format, width, height, current_size_bytes, scaled_size,
+                                                 target_size_mb, min_quality, output_format)
+    if not pixel_scales and not search_scales:
+        # Every variant is a plain copy of a file already under its target
+        return JOB_OVERHEAD_BYTES
+
+    fraction = draft_fraction(format, max(pixel_scales + search_scales), preset)
+    decoded_bytes = width * height * fraction * fraction * bytes_per_pixel
+    frame_bytes = sum(width * height * scale * scale * bytes_per_pixel for scale in pixel_scales)
+    if search_scales:
+        # Each search keeps its best and its current candidate (up to the decoded size) and two encodings
+        frame_bytes += (len(search_scales) + 1) * decoded_bytes + 2 * current_size_bytes
+    return int(decoded_bytes + frame_bytes + JOB_OVERHEAD_BYTES)
+
+
+def get_output_filename(input_path, resize_mode, scaled_size=None, target_size_mb=None, output_format=None):
+    """Generate output filename with appropriate suffix (and output_format's extension when transcoding)"""
+    filename, ext = os.path.splitext(input_path)
+    if output_format is not None:
+        ext = OUTPUT_EXTENSIONS[output_format]
+    if resize_mode == "pixels":
+        suffix = f"_w{scaled_size}px"
+    elif resize_mode == "variants":
+        # The base name variants are named after
+        suffix = ""
+    else:
+        suffix = f"_{target_size_mb}MB"
+    return f"{filename}{suffix}{ext}"
 
 
-class DragDropEntry(ttk.Entry):
-    """Custom Entry widget that supports drag and drop."""
-    def __init__(self, master=None, **kwargs):
-        super().__init__(master, **kwargs)
-        
-        # Enable drag and drop
-        self.drop_target_register(DND_FILES)
-        self.dnd_bind('<<Drop>>', self.drop)
+def find_input_files(folder, recursive=False, exclude=()):
+    """List image files in a folder with os.scandir, optionally descending into subfolders.
 
-    def drop(self, event):
-        """Handle dropped files."""
-        data = event.data
-        
-        # Remove unnecessary curly braces from file paths
-        if data.startswith('{') and data.endswith('}'):
-            data = data[1:-1]
+    Folders listed in exclude (e.g. an output folder inside the input folder) are skipped.
+    """
+    excluded = {os.path.abspath(path) for path in exclude}
+    input_files = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if recursive and os.path.abspath(entry.path) not in excluded:
+                    input_files.extend(find_input_files(entry.path, recursive, exclude))
+            elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in VALID_EXTENSIONS:
+                input_files.append(entry.path)
+    return sorted(input_files)
+
+
+def remove_files(paths, threads=8):
+    """Delete many files, several at a time (removals are latency bound on network storage).
+
+    Files that can't be removed are logged and skipped. Returns the number removed.
+    """
+    def remove(path):
+        try:
+            os.remove(path)
+            return True
+        except Exception as e:
+            logger.warning(f"Error removing file {path}: {str(e)}")
+            return False
 
-        # Update the entry with the dropped path
-        self.delete(0, tk.END)
-        self.insert(0, data.strip())
+    paths = list(paths)
+    if len(paths) <= 1:
+        return sum(map(remove, paths))
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return sum(executor.map(remove, paths))
 
 
 class UndoManager:
-    """Manage undo operations for batch processing."""
+    """Manage undo operations for batch processing in memory.
+
+    The GUI and CLI use journal.BatchJournal instead, which survives restarts.
+    """
     def __init__(self):
         self.last_operations = []
 
@@ -151,222 +744,43 @@ class UndoManager:
         if not self.last_operations:
             return False
         
-        for _, output_file in self.last_operations:
-            try:
-                os.remove(output_file)
-            except Exception as e:
-                print(f"Error removing file {output_file}: {str(e)}")
+        remove_files(output_file for _, output_file in self.last_operations)
         
         self.last_operations.clear()
         return True
 
 
-# Ensure the main window uses TkinterDnD for drag-and-drop support
-class ImageResizerApp:
-    def __init__(self, root):
-        self.root = root
-        self.undo_manager = UndoManager()
-        
-        # Input & Output folder selection
-        tk.Label(root, text="Input Folder:").grid(row=0, column=0, sticky="w", padx=5, pady=5)
-        self.input_folder_entry = DragDropEntry(root, width=50)
-        self.input_folder_entry.grid(row=0, column=1, padx=5, pady=5)
-        tk.Button(root, text="Browse", command=self.select_input_folder).grid(row=0, column=2, padx=5, pady=5)
-
-        tk.Label(root, text="Output Folder:").grid(row=1, column=0, sticky="w", padx=5, pady=5)
-        self.output_folder_entry = DragDropEntry(root, width=50)
-        self.output_folder_entry.grid(row=1, column=1, padx=5, pady=5)
-        tk.Button(root, text="Browse", command=self.select_output_folder).grid(row=1, column=2, padx=5, pady=5)
-
-        # Drag and drop info label
-        dnd_label = tk.Label(root, text="Tip: You can drag & drop folders into the input fields", 
-                             font=("Arial", 8, "italic"), fg="gray")
-        dnd_label.grid(row=2, column=0, columnspan=3, padx=5, pady=(0, 5))
-
-        # Resizing mode selection
-        tk.Label(root, text="Resize Mode:").grid(row=3, column=0, sticky="w", padx=5, pady=5)
-        
-        # Create a frame to hold the radio buttons
-        radio_frame = tk.Frame(root)
-        radio_frame.grid(row=3, column=1, sticky="w", padx=5, pady=5)
-        
-        self.resize_mode = tk.StringVar(value="pixels")
-        tk.Radiobutton(radio_frame, text="Pixels", variable=self.resize_mode, value="pixels", 
-                      command=self.toggle_options).pack(side=tk.LEFT, padx=(0, 10))
-        tk.Radiobutton(radio_frame, text="File Size (MB)", variable=self.resize_mode, value="size", 
-                      command=self.toggle_options).pack(side=tk.LEFT)
-
-        # Pixel size input
-        tk.Label(root, text="Shortest Side (px):").grid(row=4, column=0, sticky="w", padx=5, pady=5)
-        self.pixel_size_entry = tk.Entry(root, width=10)
-        self.pixel_size_entry.insert(0, "1000")
-        self.pixel_size_entry.grid(row=4, column=1, padx=5, pady=5, sticky="w")
-
-        # File size input
-        tk.Label(root, text="Target Size (MB):").grid(row=5, column=0, sticky="w", padx=5, pady=5)
-        self.file_size_entry = tk.Entry(root, width=10)
-        self.file_size_entry.insert(0, "1.0")  # Default value for clarity
-        self.file_size_entry.grid(row=5, column=1, padx=5, pady=5, sticky="w")
-        self.file_size_entry.config(state="disabled")  # Disabled initially
-
-        # Format information
-        supported_formats = "Supported formats: JPG, JPEG, PNG, BMP, TIFF, GIF, WEBP, HEIC, HEIF, AVIF"
-        format_label = tk.Label(root, text=supported_formats, font=("Arial", 8), fg="dark blue")
-        format_label.grid(row=6, column=0, columnspan=3, padx=5, pady=(0, 5), sticky="w")
-
-        # Progress bar
-        self.progress = ttk.Progressbar(root, orient="horizontal", length=300, mode="determinate")
-        self.progress.grid(row=7, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
-
-        # Button frame for aligned buttons
-        button_frame = tk.Frame(root)
-        button_frame.grid(row=8, column=0, columnspan=3, pady=10, sticky="ew")
-        
-        # Process Button (left-aligned in frame)
-        self.process_button = tk.Button(button_frame, text="Resize Images", 
-                                      command=self.process_images, 
-                                      bg="green", fg="white")
-        self.process_button.pack(side=tk.LEFT, padx=5)
-
-        # Undo Button (right-aligned in frame)
-        self.undo_button = tk.Button(button_frame, text="Undo Last Batch", 
-                                   command=self.undo_last_batch, 
-                                   state="disabled", bg="orange", fg="white")
-        self.undo_button.pack(side=tk.RIGHT, padx=5)
-
-        # Status label
-        self.status_label = tk.Label(root, text="Ready", font=("Arial", 9))
-        self.status_label.grid(row=9, column=0, columnspan=3, padx=5, pady=5)
-
-    def toggle_options(self):
-        """Enable/Disable input fields based on selected resize mode."""
-        if self.resize_mode.get() == "pixels":
-            self.pixel_size_entry.config(state="normal")
-            self.file_size_entry.config(state="disabled")
-        else:
-            self.pixel_size_entry.config(state="disabled")
-            self.file_size_entry.config(state="normal")
-
-    def select_input_folder(self):
-        folder = filedialog.askdirectory()
-        if folder:
-            self.input_folder_entry.delete(0, tk.END)
-            self.input_folder_entry.insert(0, folder)
-
-    def select_output_folder(self):
-        folder = filedialog.askdirectory()
-        if folder:
-            self.output_folder_entry.delete(0, tk.END)
-            self.output_folder_entry.insert(0, folder)
-
-    def get_output_filename(self, input_path, resize_mode, scaled_size=None, target_size_mb=None):
-        """Generate output filename with appropriate suffix"""
-        filename, ext = os.path.splitext(input_path)
-        if resize_mode == "pixels":
-            suffix = f"_w{scaled_size}px"
-        else:
-            suffix = f"_{target_size_mb}MB"
-        return f"{filename}{suffix}{ext}"
-
-    def process_images(self):
-        input_path = self.input_folder_entry.get().strip()
-        output_folder = self.output_folder_entry.get().strip()
-        
-        # Clear previous undo operations
-        self.undo_manager.last_operations.clear()
-        
-        # Handle multiple input files
-        input_files = []
-        if ',' in input_path:  # Multiple files
-            paths = [p.strip() for p in input_path.split(',')]
-            for path in paths:
-                if os.path.isfile(path):
-                    input_files.append(path)
-        elif os.path.isfile(input_path):  # Single file
-            input_files.append(input_path)
-        elif os.path.isdir(input_path):  # Directory
-            valid_extensions = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", 
-                              ".tif", ".gif", ".webp", ".heic", ".heif", ".avif"}
-            for file in os.listdir(input_path):
-                file_path = os.path.join(input_path, file)
-                if os.path.isfile(file_path) and os.path.splitext(file)[1].lower() in valid_extensions:
-                    input_files.append(file_path)
-        
-        if not input_files:
-            messagebox.showerror("Error", "No valid input files found")
-            return
-            
-        # Create output folder if it doesn't exist
-        os.makedirs(output_folder, exist_ok=True)
-
-        # Get resizing parameters
-        resize_mode = self.resize_mode.get()
-        
-        try:
-            if resize_mode == "pixels":
-                scaled_size = int(self.pixel_size_entry.get())
-                target_size_mb = None
-            else:
-                scaled_size = None
-                target_size_mb = float(self.file_size_entry.get())
-                
-                if target_size_mb <= 0:
-                    messagebox.showerror("Error", "Target size must be greater than 0 MB")
-                    return
-        except ValueError:
-            messagebox.showerror("Error", "Please enter valid numeric values")
-            return
-
-        # Process images
-        self.process_button.config(state="disabled")
-        self.progress["maximum"] = len(input_files)
-        self.progress["value"] = 0
-        processed_count = 0
-        failed_count = 0
-        
-        for input_file in input_files:
-            try:
-                self.status_label.config(text=f"Processing: {os.path.basename(input_file)}")
-                self.root.update()
-                
-                output_file = os.path.join(output_folder, 
-                    os.path.basename(self.get_output_filename(input_file, resize_mode, scaled_size, target_size_mb)))
-                
-                resize_image(input_file, output_file, scaled_size=scaled_size, target_size_mb=target_size_mb)
-                self.undo_manager.add_operation(input_file, output_file)
-                processed_count += 1
-            except Exception as e:
-                print(f"Error processing {input_file}: {str(e)}")
-                failed_count += 1
-            
-            self.progress["value"] = processed_count + failed_count
-            self.root.update()
-
-        # Re-enable buttons
-        self.process_button.config(state="normal")
-        self.undo_button.config(state="normal")
-        
-        # Show completion message
-        if failed_count > 0:
-            self.status_label.config(text=f"Completed: {processed_count} processed, {failed_count} failed")
-            messagebox.showinfo("Processing Complete", 
-                              f"{processed_count} images were successfully resized.\n{failed_count} images failed processing.")
-        else:
-            self.status_label.config(text=f"Completed: {processed_count} images processed")
-            messagebox.showinfo("Success", "All images have been resized!")
-
-    def undo_last_batch(self):
-        """Undo the last batch of operations"""
-        if self.undo_manager.undo_last_batch():
-            self.status_label.config(text="Last batch operation undone")
-            self.undo_button.config(state="disabled")
-            messagebox.showinfo("Undo Complete", "The last batch operation has been undone")
-        else:
-            messagebox.showinfo("Nothing to Undo", "No operations to undo")
+def __getattr__(name):
+    # Keep the GUI classes importable from here without loading tkinter for every import
+    if name in ("DragDropEntry", "ImageResizerApp"):
+        import gui
+        return getattr(gui, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main(argv=None):
+    """Run the HTTP server for "serve", a shared-folder worker for "worker", the watch-folder
+    mode for "watch", the command-line interface when other arguments are given, otherwise
+    the GUI."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "serve":
+        import server
+        return server.main(argv[1:])
+    if argv and argv[0] == "worker":
+        import shared_worker
+        return shared_worker.main(argv[1:])
+    if argv and argv[0] == "watch":
+        import watcher
+        return watcher.main(argv[1:])
+    if argv:
+        import cli
+        return cli.main(argv)
+
+    import gui
+    gui.run()
+    return 0
 
 
 if __name__ == "__main__":
-    root = TkinterDnD.Tk()  # Use TkinterDnD.Tk() instead of tk.Tk()
-    root.title("Batch Image Resizer")
-    app = ImageResizerApp(root)
-    root.mainloop()
\ No newline at end of file
+    multiprocessing.freeze_support()  # Required for process pools in frozen (PyInstaller) builds
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import uuid
+import logging
+from collections import OrderedDict
+
+from image_resizer import remove_files
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = ".image_resizer_journal.jsonl"
+# Completed operations are forced to disk at most this often; begin/end/undo always are
+SYNC_INTERVAL_SECONDS = 1.0
+# Batches older than this many are dropped when the journal is compacted
+KEEP_BATCHES = 20
+
+
+class BatchJournal:
+    """Append-only, crash-safe record of batches written into an output folder.
+
+    Each line of the journal file is one JSON record:
+        {"type": "begin", "batch": id, "time": t, "jobs": [[input, output, options], ...]}
+        {"type": "done", "batch": id, "input": input, "outputs": [...]}
+        {"type": "end", "batch": id}
+        {"type": "undone", "batch": id}
+    A "done" record is only appended once a job's outputs are in place, so after a crash
+    the batch can resume with exactly the jobs that have none, and undo removes exactly
+    the files the batch wrote, even after a restart. A torn last line is ignored.
+    """
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, JOURNAL_NAME)
+        self._file = None
+        self._last_sync = time.monotonic()
+
+    def _append(self, record, sync=False):
+        if self._file is None:
+            os.makedirs(self.output_folder, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            # Start on a fresh line if the last write was torn by a crash
+            if self._file.tell() > 0:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self._file.write("\n")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if sync or time.monotonic() - self._last_sync >= SYNC_INTERVAL_SECONDS:
+            os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def batches(self):
+        """Replay the journal. Returns {batch_id: batch} in order, where batch has "time",
+        "jobs", "done" ({input: outputs}), "finished" and "undone"."""
+        batches = OrderedDict()
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return batches
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    kind = record["type"]
+                    if kind == "begin":
+                        batches[record["batch"]] = {"time": record["time"], "jobs": record["jobs"], "done": {},
+                                                    "finished": False, "undone": False}
+                        continue
+                    batch = batches[record["batch"]]
+                except (ValueError, KeyError, TypeError):
+                    # A torn or foreign line: skip it rather than lose the whole history
+                    continue
+                if kind == "done":
+                    batch["done"][record["input"]] = record["outputs"]
+                elif kind == "end":
+                    batch["finished"] = True
+                elif kind == "undone":
+                    batch["undone"] = True
+        return batches
+
+    def begin(self, jobs):
+        """Start a batch of (input_file, output_file, options) jobs and return its id."""
+        self.compact()
+        batch_id = uuid.uuid4().hex[:12]
+        self._append({"type": "begin", "batch": batch_id, "time": time.time(),
+                      "jobs": [list(job) for job in jobs]}, sync=True)
+        return batch_id
+
+    def record_done(self, batch_id, input_file, output_files):
+        self._append({"type": "done", "batch": batch_id, "input": input_file, "outputs": list(output_files)})
+
+    def end(self, batch_id):
+        self._append({"type": "end", "batch": batch_id}, sync=True)
+
+    def interrupted_batch(self):
+        """Return (batch_id, remaining_jobs, done_count) for the last batch that neither
+        finished nor was undone, or None."""
+        for batch_id, batch in reversed(self.batches().items()):
+            if batch["undone"]:
+                continue
+            if batch["finished"]:
+                return None
+            remaining = [tuple(job) for job in batch["jobs"] if job[0] not in batch["done"]]
+            return batch_id, remaining, len(batch["done"])
+        return None
+
+    def last_undoable_batch(self):
+        """Return (batch_id, output_files) for the newest batch that wrote files and wasn't undone, or None."""
+        for batch_id, batch in reversed(self.batches().items()):
+            if not batch["undone"] and batch["done"]:
+                return batch_id, [path for outputs in batch["done"].values() for path in outputs]
+        return None
+
+    def undo_last_batch(self):
+        """Delete every output of the newest batch not yet undone. Returns the number of files, or None."""
+        undoable = self.last_undoable_batch()
+        if undoable is None:
+            return None
+        batch_id, output_files = undoable
+        remove_files(output_files)
+        self._append({"type": "undone", "batch": batch_id}, sync=True)
+        return len(output_files)
+
+    def compact(self):
+        """Rewrite the journal without batches beyond the newest KEEP_BATCHES."""
+        batches = self.batches()
+        if len(batches) < KEEP_BATCHES:
+            return
+        self.close()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for batch_id, batch in list(batches.items())[-(KEEP_BATCHES - 1):]:
+                f.write(json.dumps({"type": "begin", "batch": batch_id, "time": batch["time"],
+                                    "jobs": batch["jobs"]}) + "\n")
+                for input_file, outputs in batch["done"].items():
+                    f.write(json.dumps({"type": "done", "batch": batch_id, "input": input_file,
+                                        "outputs": outputs}) + "\n")
+                for kind in ("finished", "undone"):
+                    if batch[kind]:
+                        f.write(json.dumps({"type": "end" if kind == "finished" else kind, "batch": batch_id}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+from image_resizer import variant_output_paths
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".image_resizer_manifest.json"
+# Completed entries are flushed to disk at most this often during a batch
+SAVE_INTERVAL_SECONDS = 5.0
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Persistent record of completed resizes kept in the output folder.
+
+    Entries are keyed on the absolute input path and the output path relative to the
+    output folder, and store the input's size, mtime and resize options. A job is
+    skipped on a later run when all of these still match and the output exists. With
+    use_hash, an input whose mtime changed but whose content hash did not is also
+    treated as unchanged (e.g. after a sync tool touched it).
+    """
+    def __init__(self, output_folder, use_hash=False):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self.use_hash = use_hash
+        self.entries = {}
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("entries", {})
+        except FileNotFoundError:
+            self.entries = {}
+        except (ValueError, OSError) as e:
+            # A damaged manifest only costs a full re-run
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {str(e)}")
+            self.entries = {}
+
+    def save(self):
+        """Write the manifest atomically so an interrupted save never corrupts it."""
+        os.makedirs(self.output_folder, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries}, f)
+        os.replace(temp_path, self.path)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def save_if_due(self):
+        if self._dirty and time.monotonic() - self._last_save >= SAVE_INTERVAL_SECONDS:
+            self.save()
+
+    def _key(self, input_file, output_file):
+        return os.path.abspath(input_file), os.path.relpath(output_file, self.output_folder)
+
+    def is_current(self, input_file, output_file, options):
+        """Return True if output_file (or all its variants) was produced from the unchanged input with the same options."""
+        input_key, output_key = self._key(input_file, output_file)
+        entry = self.entries.get(input_key, {}).get(output_key)
+        if entry is None or entry["options"] != normalize_options(options):
+            return False
+        output_files = variant_output_paths(output_file, options.get("scaled_size"), options.get("target_size_mb"))
+        if not all(os.path.exists(path) for path in output_files):
+            return False
+
+        try:
+            stat = os.stat(input_file)
+        except OSError:
+            return False
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        if self.use_hash and entry.get("sha256"):
+            if file_hash(input_file) == entry["sha256"]:
+                # Same content, new mtime: remember the new mtime to avoid hashing next time
+                entry["mtime_ns"] = stat.st_mtime_ns
+                self._dirty = True
+                return True
+        return False
+
+    def record(self, input_file, output_file, options):
+        """Remember a completed job."""
+        input_key, output_key = self._key(input_file, output_file)
+        stat = os.stat(input_file)
+        entry = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "options": normalize_options(options),
+        }
+        if self.use_hash:
+            entry["sha256"] = file_hash(input_file)
+        self.entries.setdefault(input_key, {})[output_key] = entry
+        self._dirty = True
+
+    def split_jobs(self, jobs):
+        """Split jobs into (pending, skipped) lists."""
+        pending, skipped = [], []
+        for job in jobs:
+            input_file, output_file, options = job
+            (skipped if self.is_current(input_file, output_file, options) else pending).append(job)
+        return pending, skipped
+
+
+def normalize_options(options):
+    """Return resize options in the form they are stored in the manifest (JSON round-tripped)."""
+    return json.loads(json.dumps(options, sort_keys=True))
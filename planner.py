@@ -0,0 +1,125 @@
+"""Plan a batch from image headers, without decoding any pixels.
+
+The plan estimates how long each job takes, so the batch can start with its most
+expensive jobs: with several workers, one huge TIFF started last would otherwise keep
+the batch waiting at 99% long after the other workers ran out of work. It also finds
+the target size jobs whose inputs are already under the target, which are plain copies
+that only cost I/O.
+
+The time estimates come from pixel counts and a fixed throughput, so they are rough;
+they are good for ordering jobs and for a ballpark ETA.
+"""
+import heapq
+import logging
+import os
+
+from image_resizer import (DEFAULT_EFFORT, DEFAULT_PRESET, JOB_OVERHEAD_BYTES, as_list, draft_fraction,
+                           estimate_memory_bytes, is_plain_copy, read_header, variant_scales)
+
+logger = logging.getLogger(__name__)
+
+# Decoded, resampled or encoded pixels a worker gets through per second
+PIXELS_PER_SECOND = 20e6
+# Bytes read from or written to disk per second
+DISK_BYTES_PER_SECOND = 200e6
+# Encodes a target size search typically needs
+SEARCH_ENCODES = 4
+
+
+def job_seconds(header, current_size_bytes, scaled_size=None, target_size_mb=None, min_quality=None,
+                preset=DEFAULT_PRESET, output_format=None, effort=DEFAULT_EFFORT):
+    """Estimate the seconds resize_image spends on a file from its header and size.
+
+    Encoder efforts aren't modelled: effort is only accepted so job options can be passed as they are.
+    """
+    format, width, height, _, frame_count = header
+    pixel_scales, search_scales = variant_scales(format, width, height, current_size_bytes, scaled_size,
+                                                 target_size_mb, min_quality, output_format)
+    copies = len(as_list(scaled_size)) + len(as_list(target_size_mb)) - len(pixel_scales) - len(search_scales)
+    io_bytes = current_size_bytes * (1 + copies)
+    if not pixel_scales and not search_scales:
+        return io_bytes / DISK_BYTES_PER_SECOND
+
+    fraction = draft_fraction(format, max(pixel_scales + search_scales), preset)
+    decoded = width * height * fraction * fraction
+    # Every variant resamples the decoded source and encodes its own pixels
+    work = decoded + sum(decoded + width * height * scale * scale for scale in pixel_scales)
+    work += sum(SEARCH_ENCODES * (decoded + width * height * scale * scale) for scale in search_scales)
+    # Animations repeat it all for every frame
+    return frame_count * work / PIXELS_PER_SECOND + io_bytes / DISK_BYTES_PER_SECOND
+
+
+class BatchPlan:
+    """The header-only estimate of a batch (see plan_batch).
+
+    jobs are the jobs to resize, most expensive first, and copies the target
+    size jobs whose inputs are already under every target. seconds and memory map each
+    input file to its estimated time and peak memory (estimate_memory_bytes).
+    total_pixels counts the source pixels (every frame's, for animations) of the jobs to
+    resize and total_bytes the size of every input.
+    """
+    def __init__(self, jobs, copies, seconds, memory, total_pixels, total_bytes):
+        self.jobs = jobs
+        self.copies = copies
+        self.seconds = seconds
+        self.memory = memory
+        self.total_pixels = total_pixels
+        self.total_bytes = total_bytes
+
+    @property
+    def total_seconds(self):
+        """Estimated work of the whole batch in worker seconds."""
+        return sum(self.seconds.values())
+
+    def estimated_seconds(self, workers=1):
+        """Estimate the batch's wall clock time on workers running the jobs in plan order.
+
+        Each job goes to the worker that frees up first, as in the engine, starting with
+        the copies.
+        """
+        finish_times = [0.0] * max(1, workers)
+        for job in self.copies + self.jobs:
+            heapq.heapreplace(finish_times, finish_times[0] + self.seconds[job[0]])
+        return max(finish_times)
+
+
+def plan_batch(jobs):
+    """Read every job's header and return a BatchPlan.
+
+    Copies only need a stat. Inputs whose header can't be read are planned as free: they
+    fail quickly in the worker.
+    """
+    planned, copies, seconds, memory = [], [], {}, {}
+    total_pixels = 0
+    total_bytes = 0
+    for job in jobs:
+        input_file, _, options = job
+        try:
+            current_size_bytes = os.path.getsize(input_file)
+        except OSError:
+            current_size_bytes = 0
+        total_bytes += current_size_bytes
+
+        if current_size_bytes and is_plain_copy(current_size_bytes, options.get("scaled_size"),
+                                                options.get("target_size_mb"), options.get("output_format")):
+            copies.append(job)
+            copy_bytes = 2 * current_size_bytes * len(as_list(options["target_size_mb"]))
+            seconds[input_file] = copy_bytes / DISK_BYTES_PER_SECOND
+            memory[input_file] = JOB_OVERHEAD_BYTES
+            continue
+
+        planned.append(job)
+        try:
+            header = read_header(input_file)
+            seconds[input_file] = job_seconds(header, current_size_bytes, **options)
+            memory[input_file] = estimate_memory_bytes(input_file, header=header, **options)
+        except Exception as e:
+            logger.info(f"Could not plan {input_file}: {str(e)}")
+            seconds[input_file] = 0.0
+            memory[input_file] = 0
+            continue
+        total_pixels += header[1] * header[2] * header[4]
+
+    # Stable, so equally expensive jobs keep their order
+    planned.sort(key=lambda job: seconds[job[0]], reverse=True)
+    return BatchPlan(planned, copies, seconds, memory, total_pixels, total_bytes)
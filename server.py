@@ -0,0 +1,351 @@
+"""Serve resized images over HTTP, resizing on demand.
+
+    python image_resizer.py serve photos/ --port 8080
+    curl http://127.0.0.1:8080/cats/tom.jpg?px=500        # shortest side 500 pixels
+    curl http://127.0.0.1:8080/cats/tom.jpg?mb=0.2        # at most 0.2 MB
+
+Optional query parameters: preset (quality, balanced, fast), min_quality, format (jpeg,
+webp or avif, to transcode) and effort (fast, balanced, thorough). px may not exceed the
+image's shortest side (nothing is upscaled) or --max-px.
+"""
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import logging
+import argparse
+import mimetypes
+from http import HTTPStatus
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, unquote, urlsplit
+from PIL import Image
+
+from image_resizer import (DEFAULT_EFFORT, DEFAULT_PRESET, EFFORTS, OUTPUT_EXTENSIONS, RESIZE_PRESETS,
+                           VALID_EXTENSIONS, BufferedIO, get_output_filename, resize_image)
+from batch_engine import default_worker_count
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MB = 256
+# Largest px accepted, so one request can't make a worker allocate an enormous image
+DEFAULT_MAX_PX = 8192
+# Longest request line or header line accepted
+LINE_LIMIT = 8192
+
+
+def resize_to_bytes(path, options):
+    """Resize path in memory with resize_image options and return the encoded result.
+
+    Runs in a worker process. In target-size mode an input already under the target is
+    returned unchanged.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    file_io = BufferedIO(path, data)
+    resize_image(path, path, file_io=file_io, **options)
+    return file_io.outputs[0][1]
+
+
+def read_shortest_side(path):
+    """Return the image's shortest side from its header, or None if it can't be read (the resize reports that)."""
+    try:
+        with Image.open(path) as image:
+            return min(image.size)
+    except OSError:
+        return None
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+
+
+def parse_options(query, max_px=DEFAULT_MAX_PX):
+    """Turn query parameters ({name: [values]}) into resize_image options."""
+    def value(name, convert):
+        if name not in query:
+            return None
+        try:
+            return convert(query[name][-1])
+        except ValueError:
+            raise HTTPError(400, f"Invalid {name}")
+
+    scaled_size = value("px", int)
+    target_size_mb = value("mb", float)
+    if (scaled_size is None) == (target_size_mb is None):
+        raise HTTPError(400, "Give exactly one of px or mb")
+    size = scaled_size if scaled_size is not None else target_size_mb
+    if size <= 0:
+        raise HTTPError(400, "Size must be greater than 0")
+    if scaled_size is not None and scaled_size > max_px:
+        raise HTTPError(400, f"px must be at most {max_px}")
+
+    options = {"scaled_size": scaled_size} if scaled_size is not None else {"target_size_mb": target_size_mb}
+    options["preset"] = value("preset", str) or DEFAULT_PRESET
+    if options["preset"] not in RESIZE_PRESETS:
+        raise HTTPError(400, f"preset must be one of {', '.join(RESIZE_PRESETS)}")
+    min_quality = value("min_quality", int)
+    if min_quality is not None:
+        if not 1 <= min_quality <= 100:
+            raise HTTPError(400, "min_quality must be between 1 and 100")
+        options["min_quality"] = min_quality
+    output_format = value("format", str)
+    if output_format is not None:
+        if output_format.upper() not in OUTPUT_EXTENSIONS:
+            raise HTTPError(400, f"format must be one of {', '.join(OUTPUT_EXTENSIONS).lower()}")
+        options["output_format"] = output_format.upper()
+    effort = value("effort", str) or DEFAULT_EFFORT
+    if effort not in EFFORTS:
+        raise HTTPError(400, f"effort must be one of {', '.join(EFFORTS)}")
+    if effort != DEFAULT_EFFORT:
+        options["effort"] = effort
+    return options
+
+
+class ResponseCache:
+    """LRU of encoded responses, bounded by their total size in bytes."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        self.size -= len(self._entries.pop(key, b""))
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class ResizeServer:
+    """asyncio HTTP server for resized variants of the images under root.
+
+    GET /<path under root>?px=N or ?mb=X returns the resized image. Resizes run in a
+    pool of worker processes (threads with use_processes=False); concurrent requests
+    for the same variant share one resize, and results are kept in a ResponseCache.
+    The ETag is derived from the file's identity (path, size, mtime) and the options,
+    so a matching If-None-Match is answered with 304 without resizing. stats counts
+    requests, cache hits, coalesced requests and resizes.
+
+    px is limited to max_px and to the image's shortest side. If a worker process dies,
+    the pool is replaced and the resize retried once.
+    """
+    def __init__(self, root, workers=None, cache_mb=DEFAULT_CACHE_MB, use_processes=True, max_px=DEFAULT_MAX_PX):
+        self.root = os.path.realpath(root)
+        self.workers = max(1, workers or default_worker_count())
+        self.cache = ResponseCache(cache_mb * 1024 * 1024)
+        self.use_processes = use_processes
+        self.max_px = max_px
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "resizes": 0}
+        self.port = None
+        self._executor = None
+        self._server = None
+        self._inflight = {}
+
+    def new_executor(self):
+        executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        return executor_class(max_workers=self.workers)
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start listening (port 0 picks a free port, see self.port)."""
+        self._executor = self.new_executor()
+        self._server = await asyncio.start_server(self.handle_connection, host, port, limit=LINE_LIMIT)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def resolve(self, url_path):
+        """Map a URL path to an image file under root."""
+        path = os.path.realpath(os.path.join(self.root, unquote(url_path).lstrip("/")))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise HTTPError(403)
+        if os.path.splitext(path)[1].lower() not in VALID_EXTENSIONS or not os.path.isfile(path):
+            raise HTTPError(404)
+        return path
+
+    def etag(self, path, options):
+        stat = os.stat(path)
+        identity = f"{path}|{stat.st_size}|{stat.st_mtime_ns}|{json.dumps(options, sort_keys=True)}"
+        return '"' + hashlib.sha1(identity.encode("utf-8")).hexdigest() + '"'
+
+    async def resized(self, key, path, options):
+        """Return the encoded variant, from the cache, a resize already running or a new one."""
+        data = self.cache.get(key)
+        if data is not None:
+            self.stats["cache_hits"] += 1
+            return data
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._resize(key, path, options))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # Shielded so one client disconnecting doesn't cancel the resize for the others
+        return await asyncio.shield(task)
+
+    async def _resize(self, key, path, options):
+        self.stats["resizes"] += 1
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            data = await loop.run_in_executor(executor, resize_to_bytes, path, options)
+        except BrokenProcessPool:
+            # A worker died (crashed or was killed for memory) and the pool refuses all work from
+            # then on. Replace it, unless a concurrent resize already did, and retry once.
+            if self._executor is executor:
+                logger.warning(f"A worker process died while resizing {path}: restarting the pool")
+                self._executor = self.new_executor()
+                executor.shutdown(wait=False, cancel_futures=True)
+            data = await loop.run_in_executor(self._executor, resize_to_bytes, path, options)
+        self.cache.put(key, data)
+        return data
+
+    async def check_size(self, key, path, options):
+        """Reject px larger than the image's shortest side: nothing is upscaled.
+
+        The header is read off the event loop, and only for variants not already cached or
+        being resized (those passed the check).
+        """
+        if "scaled_size" not in options or key in self.cache or key in self._inflight:
+            return
+        shortest_side = await asyncio.to_thread(read_shortest_side, path)
+        if shortest_side is not None and options["scaled_size"] > shortest_side:
+            raise HTTPError(400, f"px must be at most the image's shortest side ({shortest_side})")
+
+    async def respond(self, method, target, headers):
+        """Return (status, headers, body) for a request."""
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(405)
+        url = urlsplit(target)
+        path = self.resolve(url.path)
+        options = parse_options(parse_qs(url.query), self.max_px)
+        etag = self.etag(path, options)
+        response_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            return 304, response_headers, b""
+        await self.check_size(etag, path, options)
+        try:
+            body = await self.resized(etag, path, options)
+        except Exception as e:
+            logger.warning(f"Error resizing {path}: {str(e)}")
+            raise HTTPError(500, "Could not resize image")
+        output_name = get_output_filename(path, "variants", output_format=options.get("output_format"))
+        response_headers["Content-Type"] = mimetypes.guess_type(output_name)[0] or "application/octet-stream"
+        return 200, response_headers, body
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.x requests on one connection (kept alive unless the client closes it)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode("latin-1").split()
+                self.stats["requests"] += 1
+                if len(parts) != 3:
+                    await self.send(writer, 400, {}, str(HTTPError(400)).encode(), close=True)
+                    break
+                method, target, version = parts
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    status, response_headers, body = await self.respond(method, target, headers)
+                except HTTPError as e:
+                    status, response_headers, body = e.status, {"Content-Type": "text/plain"}, str(e).encode()
+                    if e.status == 405:
+                        response_headers["Allow"] = "GET, HEAD"
+                await self.send(writer, status, response_headers, body, close=not keep_alive,
+                                head_only=method == "HEAD")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            # Client went away or sent an oversized line
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def send(self, writer, status, headers, body, close=False, head_only=False):
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        headers = dict(headers, **{"Content-Length": str(len(body)),
+                                   "Connection": "close" if close else "keep-alive"})
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if not head_only and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+
+async def serve(root, host, port, workers, cache_mb, max_px=DEFAULT_MAX_PX):
+    server = ResizeServer(root, workers=workers, cache_mb=cache_mb, max_px=max_px)
+    await server.start(host, port)
+    logger.warning(f"Serving {server.root} on http://{host}:{server.port}/ with {server.workers} worker(s)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="image_resizer serve",
+                                     description="Serve resized variants of the images under a folder over HTTP")
+    parser.add_argument("root", help="Folder whose images are served")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-w", "--workers", type=int, default=default_worker_count(),
+                        help="Number of worker processes")
+    parser.add_argument("--cache-mb", type=float, default=DEFAULT_CACHE_MB,
+                        help="Size of the in-memory cache of resized images")
+    parser.add_argument("--max-px", type=int, default=DEFAULT_MAX_PX,
+                        help="Largest px accepted in requests")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.root):
+        parser.error(f"{args.root} is not a folder")
+    if args.workers <= 0:
+        parser.error("--workers must be at least 1")
+    if args.max_px <= 0:
+        parser.error("--max-px must be greater than 0")
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s", stream=sys.stderr)
+    try:
+        asyncio.run(serve(args.root, args.host, args.port, args.workers, args.cache_mb, args.max_px))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
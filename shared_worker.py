@@ -0,0 +1,353 @@
+"""Cooperative workers that share a batch through a common output folder.
+
+Start any number of workers, on one machine or on several hosts mounting the same
+share, with the same input, output and size options:
+
+    python image_resizer.py worker /mnt/share/photos -o /mnt/share/resized --pixels 1000 -w 4
+
+Each job is claimed with a lease file created atomically (O_EXCL) in the output folder's
+.image_resizer_leases folder. The owner keeps touching the lease while it works; a lease
+whose mtime stops changing for --lease-seconds belongs to a crashed worker and is taken
+over. Expiry is measured on the observer's own clock, so clock skew between hosts doesn't
+matter. Finished jobs leave a marker, so workers started later (or re-runs) skip them.
+Failed jobs leave a marker naming the run that wrote it: workers of the same run don't
+retry them, a re-run does. A run starts with the first worker (which writes run.json in
+the lease folder, for workers joining later) and ends when a worker has seen every job
+finished or failed. In the rare race where a lease is taken over while its owner is
+still alive, the job is resized twice; outputs are written atomically, so that is
+harmless, and the old owner neither renews nor removes the new owner's lease.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import hashlib
+import logging
+import argparse
+import threading
+import multiprocessing
+
+from image_resizer import DEFAULT_PRESET, RESIZE_PRESETS, atomic_write
+from batch_engine import job_outputs, run_job
+
+logger = logging.getLogger(__name__)
+
+LEASE_FOLDER = ".image_resizer_leases"
+RUN_FILE = "run.json"
+DEFAULT_LEASE_SECONDS = 60.0
+# How long a worker waits before looking again at jobs leased by others
+POLL_SECONDS = 1.0
+
+
+class LeaseDirectory:
+    """Leases and completion markers for the jobs of a shared batch."""
+    def __init__(self, output_folder, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.output_folder = output_folder
+        self.folder = os.path.join(output_folder, LEASE_FOLDER)
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.run_id = None
+        self._observed = {}  # lease path -> (mtime_ns, local time it was first seen)
+        os.makedirs(self.folder, exist_ok=True)
+
+    def key(self, job):
+        """Name a job the same way on every host, whatever the share's mount point."""
+        _, output_file, options = job
+        identity = os.path.relpath(output_file, self.output_folder) + "|" + json.dumps(options, sort_keys=True)
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def path(self, key, suffix):
+        return os.path.join(self.folder, key + suffix)
+
+    def join_run(self):
+        """Set run_id to the run in progress on this folder, starting one if there is none."""
+        path = os.path.join(self.folder, RUN_FILE)
+        while True:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.run_id = json.load(f)["run"]
+                return self.run_id
+            except FileNotFoundError:
+                pass
+            # Written aside and linked into place, so other workers never read it half-written
+            new_path = f"{path}.{uuid.uuid4().hex}.new"
+            with open(new_path, "w", encoding="utf-8") as f:
+                json.dump({"run": uuid.uuid4().hex, "worker": self.worker_id}, f)
+            try:
+                os.link(new_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(new_path)
+
+    def end_run(self):
+        """Mark the run as over, so the next worker to start begins a new one."""
+        self.remove_if(os.path.join(self.folder, RUN_FILE), "run", self.run_id)
+
+    def marker(self, key, suffix, input_file):
+        """Return the job's done or failed record if it was written for the input as it is now."""
+        try:
+            with open(self.path(key, suffix), "r", encoding="utf-8") as f:
+                record = json.load(f)
+            stat = os.stat(input_file)
+        except (OSError, ValueError):
+            return None
+        if record.get("size") == stat.st_size and record.get("mtime_ns") == stat.st_mtime_ns:
+            return record
+        return None
+
+    def is_finished(self, key, input_file):
+        """True if a worker completed the job for the input as it is now."""
+        return self.marker(key, ".done", input_file) is not None
+
+    def failed_in_run(self, key, input_file):
+        """True if a worker of this run gave up on the job for the input as it is now."""
+        record = self.marker(key, ".failed", input_file)
+        return record is not None and record.get("run") == self.run_id
+
+    def claim(self, key, input_file):
+        """Try to take the job's lease. Returns True if this worker now owns it."""
+        path = self.path(key, ".lease")
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self.expired(path):
+                return False
+            # Only one worker's rename of the stale lease succeeds
+            stale_path = f"{path}.{uuid.uuid4().hex}.stale"
+            try:
+                os.rename(path, stale_path)
+            except FileNotFoundError:
+                return False
+            os.remove(stale_path)
+            logger.warning(f"Took over expired lease for {input_file}")
+            return self.claim(key, input_file)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"worker": self.worker_id, "host": socket.gethostname(), "pid": os.getpid(),
+                       "input": input_file}, f)
+        return True
+
+    def expired(self, path):
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        now = time.monotonic()
+        observed = self._observed.get(path)
+        if observed is None or observed[0] != mtime_ns:
+            self._observed[path] = (mtime_ns, now)
+            return False
+        return now - observed[1] >= self.lease_seconds
+
+    def owns(self, path):
+        return self.read_field(path, "worker") == self.worker_id
+
+    def read_field(self, path, field):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get(field)
+        except (OSError, ValueError):
+            return None
+
+    def renew(self, key):
+        """Keep the job's lease fresh. Returns False once the lease isn't this worker's any more."""
+        path = self.path(key, ".lease")
+        if not self.owns(path):
+            return False
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def finish(self, key, input_file, error=None):
+        """Leave a done (or failed) marker for the job, replacing the other one, and drop its lease."""
+        stat = os.stat(input_file) if os.path.exists(input_file) else None
+        record = {"worker": self.worker_id, "size": stat.st_size if stat else None,
+                  "mtime_ns": stat.st_mtime_ns if stat else None}
+        if error is not None:
+            record["error"] = error
+            record["run"] = self.run_id
+        atomic_write(self.path(key, ".failed" if error is not None else ".done"), json.dumps(record).encode("utf-8"))
+        try:
+            os.remove(self.path(key, ".done" if error is not None else ".failed"))
+        except FileNotFoundError:
+            pass
+        self.release(key)
+
+    def release(self, key):
+        """Drop the job's lease, unless another worker took it over."""
+        self.remove_if(self.path(key, ".lease"), "worker", self.worker_id)
+
+    def remove_if(self, path, field, value):
+        """Remove a JSON file if its field holds value; one written by another worker stays."""
+        if self.read_field(path, field) != value:
+            return
+        # Moved aside first, so it can't be replaced between the check and the removal
+        moved_path = f"{path}.{uuid.uuid4().hex}.removed"
+        try:
+            os.rename(path, moved_path)
+        except FileNotFoundError:
+            return
+        if self.read_field(moved_path, field) != value:
+            try:
+                os.link(moved_path, path)
+            except FileExistsError:
+                pass
+        os.remove(moved_path)
+
+
+class SharedFolderWorker:
+    """Claim and run jobs until every job of the shared batch is finished.
+
+    Jobs leased by other workers are revisited every poll_seconds, so the worker also
+    picks up the work of any worker that crashes. Jobs that failed in an earlier run are
+    retried; one another worker fails during this run is left to that worker to report.
+    on_event, if given, is called with ("done", input_file, output_files) or ("failed",
+    input_file, error_message).
+    """
+    def __init__(self, jobs, output_folder, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 poll_seconds=POLL_SECONDS, on_event=None):
+        self.jobs = list(jobs)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.leases = LeaseDirectory(output_folder, self.worker_id, lease_seconds)
+        self.poll_seconds = poll_seconds
+        self.on_event = on_event
+
+    def run(self):
+        """Returns (processed_count, failed_count) for the jobs this worker ran."""
+        processed_count = 0
+        failed_count = 0
+        pending = self.jobs[:]
+        # Workers start at different places so they rarely contend for the same lease
+        random.shuffle(pending)
+        self.leases.join_run()
+
+        def settled(key, input_file):
+            return self.leases.is_finished(key, input_file) or self.leases.failed_in_run(key, input_file)
+
+        while pending:
+            leased_elsewhere = []
+            for job in pending:
+                key = self.leases.key(job)
+                if settled(key, job[0]):
+                    continue
+                if not self.leases.claim(key, job[0]):
+                    leased_elsewhere.append(job)
+                    continue
+                if settled(key, job[0]):
+                    # Finished by another worker between the check and the claim
+                    self.leases.release(key)
+                    continue
+                if self.process(job, key):
+                    processed_count += 1
+                else:
+                    failed_count += 1
+            pending = leased_elsewhere
+            if pending:
+                time.sleep(self.poll_seconds)
+        # Every job is finished or failed: a worker started from now on begins a new run
+        self.leases.end_run()
+        return processed_count, failed_count
+
+    def process(self, job, key):
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self.keep_alive, args=(key, stop), daemon=True)
+        heartbeat.start()
+        try:
+            run_job(*job)
+        except Exception as e:
+            self.leases.finish(key, job[0], error=str(e))
+            self.emit("failed", job[0], str(e))
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+        self.leases.finish(key, job[0])
+        self.emit("done", job[0], job_outputs(job))
+        return True
+
+    def keep_alive(self, key, stop):
+        while not stop.wait(self.leases.lease_seconds / 4):
+            if not self.leases.renew(key):
+                # Taken over by another worker
+                return
+
+    def emit(self, kind, input_file, detail):
+        if self.on_event is not None:
+            self.on_event(kind, input_file, detail)
+
+
+def print_event(worker_id):
+    def on_event(kind, input_file, detail):
+        fields = {"event": kind, "worker": worker_id, "input": input_file}
+        fields["outputs" if kind == "done" else "error"] = detail
+        sys.stdout.write(json.dumps(fields) + "\n")
+        sys.stdout.flush()
+    return on_event
+
+
+def run_worker(jobs, output_folder, worker_id, lease_seconds, poll_seconds=POLL_SECONDS):
+    """Run one worker, printing its progress as JSON lines. Exits non-zero if a job failed.
+
+    Used as a process target.
+    """
+    worker = SharedFolderWorker(jobs, output_folder, worker_id, lease_seconds, poll_seconds,
+                                on_event=print_event(worker_id))
+    _, failed_count = worker.run()
+    sys.exit(1 if failed_count else 0)
+
+
+def main(argv=None):
+    import cli  # Reuses the batch CLI's job collection
+
+    parser = argparse.ArgumentParser(
+        prog="image_resizer worker",
+        description="Resize a shared folder cooperatively with other workers (on this or other hosts). "
+                    "Progress is written to stdout as JSON lines.")
+    parser.add_argument("inputs", nargs="+", help="Image files or folders to resize")
+    parser.add_argument("-o", "--output", required=True, help="Output folder shared by all workers")
+    parser.add_argument("--pixels", type=int, nargs="+", metavar="PX")
+    parser.add_argument("--target-mb", type=float, nargs="+", metavar="MB")
+    parser.add_argument("--min-quality", type=int, metavar="Q")
+    parser.add_argument("--preset", choices=list(RESIZE_PRESETS), default=DEFAULT_PRESET)
+    cli.add_output_arguments(parser)
+    parser.add_argument("-r", "--recursive", action="store_true")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes to run on this host")
+    parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="Time after which a silent worker's claims are taken over")
+    parser.add_argument("--worker-id", help="Name of this worker in leases and progress (default host-pid)")
+    args = parser.parse_args(argv)
+    if not args.pixels and not args.target_mb:
+        parser.error("one of --pixels or --target-mb is required")
+    if args.workers <= 0:
+        parser.error("--workers must be at least 1")
+    if args.lease_seconds <= 0:
+        parser.error("--lease-seconds must be greater than 0")
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s", stream=sys.stderr)
+    jobs = cli.collect_jobs(args)
+    if not jobs:
+        parser.error("no valid input files found")
+    for output_folder in {os.path.dirname(output_file) for _, output_file, _ in jobs}:
+        os.makedirs(output_folder, exist_ok=True)
+
+    base_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    if args.workers == 1:
+        run_worker(jobs, args.output, base_id, args.lease_seconds)
+
+    processes = [multiprocessing.Process(target=run_worker,
+                                         args=(jobs, args.output, f"{base_id}-{index}", args.lease_seconds))
+                 for index in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return 1 if any(process.exitcode for process in processes) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
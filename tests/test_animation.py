@@ -0,0 +1,152 @@
+import io
+import os
+import tempfile
+import unittest
+from PIL import Image, ImageChops, ImageDraw
+from image_resizer import resize_image
+from animation import encode_gif, resized_frames
+
+
+def make_animation(path, frame_count=12, size=(240, 160), transparent=False):
+    frames = []
+    for i in range(frame_count):
+        frame = Image.new("RGBA" if transparent else "RGB", size, (0, 0, 0, 0) if transparent else "white")
+        draw = ImageDraw.Draw(frame)
+        draw.ellipse((i * 15, 40, i * 15 + 60, 100), fill=(255, i * 20, 0, 255))
+        draw.rectangle((0, 120, size[0], size[1]), fill=(0, 100, 200, 255))
+        frames.append(frame)
+    # Disposal 2 so the source GIF shows each frame as drawn, without trails
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=[50 + 10 * i for i in range(frame_count)],
+                   loop=3, disposal=2 if transparent else 0)
+    return frames
+
+
+def frames_of(path):
+    with Image.open(path) as image:
+        frames = []
+        for index in range(image.n_frames):
+            image.seek(index)
+            image.load()
+            frames.append((image.convert("RGBA"), image.info.get("duration")))
+        return frames, image.info.get("loop")
+
+
+class TestAnimation(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_resized_frames(self, source_frames, output_path, size, tolerance, loop=3):
+        frames, output_loop = frames_of(output_path)
+        self.assertEqual(len(frames), len(source_frames))
+        self.assertEqual(output_loop, loop)
+        self.assertEqual([duration for _, duration in frames], [50 + 10 * i for i in range(len(source_frames))])
+        white = Image.new("RGBA", size, "white")
+        for source, (frame, _) in zip(source_frames, frames):
+            self.assertEqual(frame.size, size)
+            # Compared as shown on a white page, so transparent pixels' hidden colors don't count
+            expected = Image.alpha_composite(white, source.convert("RGBA").resize(size, Image.Resampling.LANCZOS))
+            difference = ImageChops.difference(expected, Image.alpha_composite(white, frame)).convert("L")
+            mean = sum(value * count for value, count in enumerate(difference.histogram())) / (size[0] * size[1])
+            self.assertLess(mean, tolerance)
+
+    def test_gif_keeps_every_frame_duration_and_loop(self):
+        path = os.path.join(self.tmp.name, "anim.gif")
+        source_frames = make_animation(path)
+        output_path = os.path.join(self.tmp.name, "out.gif")
+
+        resize_image(path, output_path, scaled_size=80)
+
+        self.assert_resized_frames(source_frames, output_path, (120, 80), tolerance=4)
+
+    def test_transparent_gif_frames_clear_where_pixels_turn_transparent(self):
+        path = os.path.join(self.tmp.name, "anim.gif")
+        source_frames = make_animation(path, transparent=True)
+        output_path = os.path.join(self.tmp.name, "out.gif")
+
+        resize_image(path, output_path, scaled_size=80)
+
+        self.assert_resized_frames(source_frames, output_path, (120, 80), tolerance=6)
+
+    def test_webp_keeps_every_frame_duration_and_loop(self):
+        path = os.path.join(self.tmp.name, "anim.webp")
+        source_frames = make_animation(path, transparent=True)
+        output_path = os.path.join(self.tmp.name, "out.webp")
+
+        resize_image(path, output_path, scaled_size=80)
+
+        self.assert_resized_frames(source_frames, output_path, (120, 80), tolerance=6)
+
+    def test_target_size_trades_scale_colors_and_frames(self):
+        path = os.path.join(self.tmp.name, "anim.gif")
+        make_animation(path, frame_count=20)
+        output_path = os.path.join(self.tmp.name, "out.gif")
+        target_size_mb = os.path.getsize(path) / 8 / (1024 * 1024)
+
+        resize_image(path, output_path, target_size_mb=target_size_mb)
+
+        self.assertLessEqual(os.path.getsize(output_path), target_size_mb * 1024 * 1024)
+        frames, loop = frames_of(output_path)
+        self.assertGreater(len(frames), 1)
+        self.assertEqual(loop, 3)
+        # Dropped frames lend their time to the frame kept before them
+        self.assertEqual(sum(duration for _, duration in frames), sum(50 + 10 * i for i in range(20)))
+
+    def test_gif_encode_stops_once_over_budget(self):
+        path = os.path.join(self.tmp.name, "anim.gif")
+        make_animation(path)
+        with Image.open(path) as image:
+            full = encode_gif(resized_frames(image, image.size), image.n_frames)
+            stopped = encode_gif(resized_frames(image, image.size), image.n_frames, budget=full.size // 3)
+
+        self.assertIsNone(stopped.data)
+        self.assertGreater(stopped.size, full.size // 3)
+
+    def test_gif_frames_share_the_global_palette(self):
+        path = os.path.join(self.tmp.name, "anim.gif")
+        make_animation(path, frame_count=20, transparent=True)
+        with Image.open(path) as image:
+            encoded = encode_gif(resized_frames(image, (60, 40)), image.n_frames)
+            frames = [frame for frame, _ in resized_frames(image, (60, 40))]
+        buffer = io.BytesIO()
+        frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], disposal=2)
+
+        # No larger than Pillow's own writer, which also omits palettes equal to the global one
+        self.assertLessEqual(encoded.size, len(buffer.getvalue()))
+
+    def test_no_size_is_an_error(self):
+        path = os.path.join(self.tmp.name, "anim.gif")
+        make_animation(path)
+
+        with self.assertRaises(ValueError):
+            resize_image(path, os.path.join(self.tmp.name, "out.gif"))
+
+    def test_variants_and_copies(self):
+        path = os.path.join(self.tmp.name, "anim.webp")
+        make_animation(path)
+        output_path = os.path.join(self.tmp.name, "anim.webp".replace("anim", "out"))
+
+        resize_image(path, output_path, scaled_size=[40, 80], target_size_mb=[10])
+
+        for name, size in (("out_w40px.webp", (60, 40)), ("out_w80px.webp", (120, 80)), ("out_10MB.webp", (240, 160))):
+            with Image.open(os.path.join(self.tmp.name, name)) as image:
+                self.assertEqual((image.size, image.n_frames), (size, 12))
+
+    def test_gif_transcodes_to_animated_webp_and_avif(self):
+        path = os.path.join(self.tmp.name, "anim.gif")
+        source_frames = make_animation(path)
+
+        # Pillow's AVIF plugin doesn't store loop counts
+        for format, loop in (("WEBP", 3), ("AVIF", None)):
+            output_path = os.path.join(self.tmp.name, f"out.{format.lower()}")
+            resize_image(path, output_path, scaled_size=80, output_format=format)
+
+            with Image.open(output_path) as image:
+                self.assertEqual(image.format, format)
+            self.assert_resized_frames(source_frames, output_path, (120, 80), 12, loop)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,295 @@
+import os
+import queue
+import time
+import tempfile
+import unittest
+from unittest.mock import ANY, patch
+from PIL import Image
+from image_resizer import atomic_write
+from batch_engine import (BatchEngine, PipelinedBatchEngine, build_jobs, default_worker_count, job_outputs,
+                          run_buffered_job, run_job, write_report)
+from duplicates import split_duplicates
+
+
+def drain(progress_queue):
+    events = []
+    while True:
+        try:
+            events.append(progress_queue.get_nowait())
+        except queue.Empty:
+            return events
+
+
+class TestBatchEngine(unittest.TestCase):
+    def test_default_worker_count_is_positive(self):
+        self.assertGreaterEqual(default_worker_count(), 1)
+
+    @patch("batch_engine.resize_image")
+    def test_single_worker_reports_progress(self, mock_resize):
+        engine = BatchEngine(workers=1)
+        jobs = [("a.jpg", "out/a.jpg", {"scaled_size": 100}),
+                ("b.jpg", "out/b.jpg", {"scaled_size": 100})]
+
+        result = engine.run(jobs)
+
+        self.assertEqual(result, (2, 0))
+        mock_resize.assert_any_call("a.jpg", "out/a.jpg", scaled_size=100, metrics=ANY, file_io=ANY)
+        events = drain(engine.progress_queue)
+        self.assertEqual(events[0], ("done", "a.jpg", ["out/a.jpg"]))
+        self.assertEqual(events[-1], ("finished", 2, 0))
+
+    @patch("batch_engine.resize_image")
+    def test_failures_are_reported(self, mock_resize):
+        mock_resize.side_effect = [None, ValueError("bad image")]
+        engine = BatchEngine(workers=1)
+        jobs = [("a.jpg", "out/a.jpg", {}), ("b.jpg", "out/b.jpg", {})]
+
+        result = engine.run(jobs)
+
+        self.assertEqual(result, (1, 1))
+        events = drain(engine.progress_queue)
+        self.assertIn(("failed", "b.jpg", "bad image"), events)
+
+    def test_build_jobs_names_variants_after_input(self):
+        jobs = build_jobs(["in/cat.jpg"], "out", "pixels", scaled_size=[320, 640], target_size_mb=[0.5],
+                          preset="fast")
+
+        self.assertEqual(jobs[0][1], os.path.join("out", "cat.jpg"))
+        self.assertEqual(jobs[0][2], {"scaled_size": [320, 640], "target_size_mb": [0.5], "preset": "fast"})
+        self.assertEqual(job_outputs(jobs[0]), [os.path.join("out", name)
+                                                for name in ("cat_w320px.jpg", "cat_w640px.jpg", "cat_0.5MB.jpg")])
+
+    @patch("batch_engine.estimate_memory_bytes")
+    @patch("batch_engine.resize_image")
+    def test_oversized_job_uses_bounded_memory_strategy(self, mock_resize, mock_estimate):
+        def estimate(input_file, preset=None, **options):
+            if input_file == "small.jpg":
+                return 10 * 1024 * 1024
+            # Only the JPEG shrinks with reduced-resolution decoding
+            return 50 * 1024 * 1024 if input_file == "huge.jpg" and preset == "fast" else 500 * 1024 * 1024
+        mock_estimate.side_effect = estimate
+        engine = BatchEngine(workers=1, memory_budget_mb=100)
+        jobs = [("small.jpg", "out/small.jpg", {"scaled_size": 100}),
+                ("huge.jpg", "out/huge.jpg", {"scaled_size": 100, "preset": "quality"}),
+                ("huge.tif", "out/huge.tif", {"scaled_size": 100, "preset": "quality"})]
+
+        result = engine.run(jobs)
+
+        self.assertEqual(result, (3, 0))
+        mock_resize.assert_any_call("small.jpg", "out/small.jpg", scaled_size=100, metrics=ANY, file_io=ANY)
+        mock_resize.assert_any_call("huge.jpg", "out/huge.jpg", scaled_size=100, preset="fast", metrics=ANY, file_io=ANY)
+        # Reduced-resolution decoding doesn't help the TIFF, so it keeps its preset and runs alone
+        mock_resize.assert_any_call("huge.tif", "out/huge.tif", scaled_size=100, preset="quality", metrics=ANY,
+                                    file_io=ANY)
+
+    def test_memory_budget_still_completes_every_job(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = []
+            for i in range(3):
+                input_file = os.path.join(tmp, f"in{i}.png")
+                Image.new("RGB", (400, 300)).save(input_file)
+                jobs.append((input_file, os.path.join(tmp, f"out{i}.png"), {"scaled_size": 30}))
+
+            # Each job alone is over budget, so they run one at a time
+            result = BatchEngine(workers=2, memory_budget_mb=1).run(jobs)
+
+            self.assertEqual(result, (3, 0))
+            result = PipelinedBatchEngine(workers=2, memory_budget_mb=1).run(jobs)
+
+            self.assertEqual(result, (3, 0))
+
+    def test_metrics_report_and_profile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_file = os.path.join(tmp, "in.jpg")
+            Image.new("RGB", (400, 300), "red").save(input_file)
+            profile_path = os.path.join(tmp, "batch.prof")
+            engine = BatchEngine(workers=1, profile_path=profile_path)
+
+            engine.run([(input_file, os.path.join(tmp, "out.jpg"), {"target_size_mb": 0.001}),
+                        (os.path.join(tmp, "missing.jpg"), os.path.join(tmp, "out2.jpg"), {"scaled_size": 10})])
+
+            done, failed = engine.report
+            self.assertEqual(done["status"], "done")
+            self.assertGreater(done["attempts"], 0)
+            self.assertGreater(done["encode_seconds"], 0)
+            self.assertEqual(done["bytes_out"], os.path.getsize(os.path.join(tmp, "out.jpg")))
+            self.assertEqual(failed["status"], "failed")
+            self.assertTrue(os.path.exists(profile_path))
+
+            csv_path = os.path.join(tmp, "report.csv")
+            write_report(engine.report, csv_path)
+            with open(csv_path) as f:
+                self.assertTrue(f.readline().startswith("input,status,error,total_seconds,decode_seconds"))
+
+    def test_process_pool_resizes_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = []
+            for i in range(3):
+                input_file = os.path.join(tmp, f"in{i}.png")
+                Image.new("RGB", (200, 100), (i * 40, 0, 0)).save(input_file)
+                jobs.append((input_file, os.path.join(tmp, f"out{i}.png"), {"scaled_size": 50}))
+
+            engine = BatchEngine(workers=2)
+            engine.start(jobs).join(timeout=60)
+
+            events = drain(engine.progress_queue)
+            self.assertEqual(events[-1], ("finished", 3, 0))
+            for _, output_file, _ in jobs:
+                with Image.open(output_file) as image:
+                    self.assertEqual(image.size, (100, 50))
+
+    def test_plan_copies_first_then_runs_largest_first(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sizes = [(100, 50), (800, 400), (300, 150)]
+            jobs = []
+            for i, size in enumerate(sizes):
+                input_file = os.path.join(tmp, f"in{i}.png")
+                Image.new("RGB", size, (i * 40, 0, 0)).save(input_file)
+                jobs.append((input_file, os.path.join(tmp, f"out{i}.png"), {"target_size_mb": 1.0, "preset": "fast"}))
+            jobs[1] = (jobs[1][0], jobs[1][1], {"scaled_size": 100})
+            jobs[2] = (jobs[2][0], jobs[2][1], {"scaled_size": 50})
+            engine = BatchEngine(workers=1, plan=True)
+
+            result = engine.run(jobs)
+
+            self.assertEqual(result, (3, 0))
+            events = drain(engine.progress_queue)
+            self.assertEqual(events[0], ("planned", engine.plan))
+            self.assertEqual([event[1] for event in events[1:4]], [jobs[0][0], jobs[1][0], jobs[2][0]])
+            self.assertEqual(engine.plan.copies, [jobs[0]])
+            self.assertTrue(os.path.exists(jobs[0][1]))
+
+
+class TestPipelinedBatchEngine(unittest.TestCase):
+    def make_jobs(self, tmp, count, options):
+        jobs = []
+        for i in range(count):
+            input_file = os.path.join(tmp, f"in{i}.png")
+            Image.new("RGB", (200, 100), (i * 40, 0, 0)).save(input_file)
+            jobs.append((input_file, os.path.join(tmp, f"out{i}.png"), options))
+        return jobs
+
+    def test_resizes_and_reports_through_the_pipeline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = self.make_jobs(tmp, 5, {"scaled_size": 50})
+            jobs.append((os.path.join(tmp, "missing.png"), os.path.join(tmp, "missing_out.png"), {"scaled_size": 50}))
+            engine = PipelinedBatchEngine(workers=1, io_threads=2, prefetch=2)
+
+            result = engine.run(jobs)
+
+            self.assertEqual(result, (5, 1))
+            for _, output_file, _ in jobs[:-1]:
+                with Image.open(output_file) as image:
+                    self.assertEqual(image.size, (100, 50))
+            done = [row for row in engine.report if row["status"] == "done"]
+            self.assertEqual(len(done), 5)
+            self.assertTrue(all(row["bytes_out"] == os.path.getsize(row["input"].replace("in", "out"))
+                                for row in done))
+            self.assertEqual(drain(engine.progress_queue)[-1], ("finished", 5, 1))
+            self.assertFalse([name for name in os.listdir(tmp) if name.endswith(".tmp")])
+
+    @patch("batch_engine.estimate_memory_bytes", return_value=0)
+    def test_prefetched_inputs_count_against_memory_budget(self, mock_estimate):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = []
+            for i in range(4):
+                input_file = os.path.join(tmp, f"in{i}.bmp")
+                Image.new("RGB", (500, 500)).save(input_file)
+                jobs.append((input_file, os.path.join(tmp, f"out{i}.png"), {"scaled_size": 50}))
+            input_size = os.path.getsize(jobs[0][0])
+            engine = PipelinedBatchEngine(workers=1, memory_budget_mb=1, prefetch=8)
+            in_use = []
+
+            def resize(*args, **kwargs):
+                time.sleep(0.05)
+                in_use.append(engine.memory.in_use)
+                return run_buffered_job(*args, **kwargs)
+
+            with patch("batch_engine.run_buffered_job", side_effect=resize):
+                result = engine.run(jobs)
+
+            self.assertEqual(result, (4, 0))
+            # Only one 750KB input fits the 1MB budget, so readers don't prefetch the rest
+            self.assertEqual(max(in_use), input_size)
+
+    def test_copies_keep_source_metadata(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = self.make_jobs(tmp, 2, {"target_size_mb": 1})
+            os.utime(jobs[0][0], (1000000000, 1000000000))
+
+            result = PipelinedBatchEngine(workers=2).run(jobs)
+
+            self.assertEqual(result, (2, 0))
+            self.assertEqual(os.path.getmtime(jobs[0][1]), 1000000000)
+
+    def test_planned_copies_go_through_the_pipeline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = self.make_jobs(tmp, 3, {"target_size_mb": 1})
+            engine = PipelinedBatchEngine(workers=1, plan=True)
+
+            with patch("batch_engine.run_buffered_job", side_effect=run_buffered_job) as mock_run:
+                result = engine.run(jobs)
+
+            self.assertEqual(result, (3, 0))
+            self.assertEqual(engine.plan.copies, jobs)
+            self.assertEqual(mock_run.call_count, 3)
+            for input_file, output_file, _ in jobs:
+                with open(input_file, "rb") as source, open(output_file, "rb") as copy:
+                    self.assertEqual(source.read(), copy.read())
+
+
+class TestDuplicates(unittest.TestCase):
+    def test_identical_inputs_are_resized_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            inputs = [os.path.join(tmp, name) for name in ("a.png", "copy_of_a.png", "b.png", "also_a.png")]
+            Image.new("RGB", (200, 100), "red").save(inputs[0])
+            Image.new("RGB", (200, 100), "blue").save(inputs[2])
+            for copy in (inputs[1], inputs[3]):
+                with open(inputs[0], "rb") as src, open(copy, "wb") as dst:
+                    dst.write(src.read())
+            out = os.path.join(tmp, "out")
+            os.makedirs(out)
+            jobs = build_jobs(inputs, out, "pixels", scaled_size=50)
+
+            with patch("batch_engine.run_job", wraps=run_job) as mock_run:
+                engine = BatchEngine(workers=1, dedupe=True)
+                result = engine.run(jobs)
+
+            self.assertEqual(result, (2, 0))
+            self.assertEqual(mock_run.call_count, 2)
+            events = drain(engine.progress_queue)
+            self.assertIn(("duplicate", inputs[1], [os.path.join(out, "copy_of_a_w50px.png")], inputs[0]), events)
+            duplicates = [row for row in engine.report if row["status"] == "duplicate"]
+            self.assertEqual([(row["input"], row["duplicate_of"]) for row in duplicates],
+                             [(inputs[1], inputs[0]), (inputs[3], inputs[0])])
+            self.assertTrue(os.path.samefile(os.path.join(out, "a_w50px.png"), os.path.join(out, "also_a_w50px.png")))
+
+    def test_same_size_different_content_is_not_a_duplicate(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            first, second = os.path.join(tmp, "a.bin"), os.path.join(tmp, "b.bin")
+            for path, content in ((first, b"1234"), (second, b"5678")):
+                with open(path, "wb") as f:
+                    f.write(content)
+            jobs = [(first, "out/a", {}), (second, "out/b", {})]
+
+            self.assertEqual(split_duplicates(jobs), (jobs, {}))
+            self.assertEqual(split_duplicates(jobs + [(first, "out/c", {"scaled_size": 5})])[1], {})
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def test_failed_write_leaves_no_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.jpg")
+            atomic_write(path, b"old")
+
+            with patch("image_resizer.os.replace", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    atomic_write(path, b"new")
+
+            self.assertEqual(os.listdir(tmp), ["out.jpg"])
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"old")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image
+from image_resizer import resize_image
+from benchmark import build_corpus, find_regressions, run_case, synthetic_image
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_synthetic_images_are_deterministic(self):
+        for entropy in ("low", "medium", "high"):
+            first = synthetic_image((64, 48), entropy, seed=1)
+            second = synthetic_image((64, 48), entropy, seed=1)
+            self.assertEqual(first.tobytes(), second.tobytes())
+
+    def test_build_corpus_writes_every_format(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = build_corpus(tmp, resolutions=[(64, 48)], entropy_levels=["low"])
+            formats = set()
+            for path in paths:
+                with Image.open(path) as image:
+                    formats.add(image.format)
+            self.assertEqual(formats, {"JPEG", "PNG", "WEBP", "TIFF", "GIF"})
+
+    def test_run_case_counts_encodes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = build_corpus(tmp, resolutions=[(320, 240)], formats={"JPEG": ".jpg"},
+                                entropy_levels=["high"])[0]
+            result = run_case(path, "size", repeat=1)
+            self.assertGreater(result["encodes"], 0)
+            self.assertLessEqual(result["output_bytes"], os.path.getsize(path) * 0.4)
+
+    def test_pixel_cases_count_encodes_and_downscale(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for path in build_corpus(tmp, resolutions=[(320, 240)], formats={"PNG": ".png", "GIF": ".gif"},
+                                     entropy_levels=["low"]):
+                with patch("image_resizer.resize_image", side_effect=resize_image) as mock_resize:
+                    result = run_case(path, "pixels", repeat=1)
+                self.assertEqual(result["encodes"], 1)
+                self.assertEqual(mock_resize.call_args.kwargs["scaled_size"], 48)
+
+    def test_find_regressions(self):
+        baseline = {"case/size": {"seconds": 1.0, "peak_rss_mb": 100, "encodes": 3}}
+
+        self.assertEqual(find_regressions({"case/size": {"seconds": 1.2, "peak_rss_mb": 100, "encodes": 3}}, baseline), [])
+        slower = find_regressions({"case/size": {"seconds": 1.5, "peak_rss_mb": 100, "encodes": 4}}, baseline)
+        self.assertEqual(len(slower), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import io
+import sys
+import json
+import tempfile
+import subprocess
+import unittest
+from contextlib import redirect_stdout
+from PIL import Image
+from cli import main
+from journal import BatchJournal
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_folder = os.path.join(self.tmp.name, "input")
+        self.output_folder = os.path.join(self.tmp.name, "output")
+        os.makedirs(os.path.join(self.input_folder, "nested"))
+        Image.new("RGB", (400, 200), "red").save(os.path.join(self.input_folder, "a.jpg"))
+        Image.new("RGB", (300, 600), "blue").save(os.path.join(self.input_folder, "nested", "b.png"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_cli(self, *argv):
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            exit_code = main(list(argv))
+        return exit_code, [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_recursive_pixel_resize_writes_json_progress(self):
+        exit_code, events = self.run_cli(self.input_folder, "-o", self.output_folder,
+                                         "--pixels", "100", "--recursive", "--workers", "1")
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(events[0], {"event": "start", "total": 2, "workers": 1})
+        self.assertEqual(events[-1], {"event": "finished", "processed": 2, "skipped": 0, "failed": 0})
+        with Image.open(os.path.join(self.output_folder, "nested", "b_w100px.png")) as image:
+            self.assertEqual(image.size, (100, 200))
+
+    def test_format_transcodes_every_output(self):
+        exit_code, events = self.run_cli(self.input_folder, "-o", self.output_folder, "--target-mb", "1",
+                                         "--recursive", "--format", "webp", "--effort", "fast")
+
+        self.assertEqual(exit_code, 0)
+        for name in ("a_1.0MB.webp", os.path.join("nested", "b_1.0MB.webp")):
+            with Image.open(os.path.join(self.output_folder, name)) as image:
+                self.assertEqual(image.format, "WEBP")
+
+    def test_non_recursive_skips_subfolders(self):
+        exit_code, events = self.run_cli(self.input_folder, "-o", self.output_folder, "--pixels", "100")
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(events[0]["total"], 1)
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "a_w100px.jpg")))
+
+    def test_incremental_rerun_skips_unchanged_inputs(self):
+        argv = (self.input_folder, "-o", self.output_folder, "--pixels", "100", "--incremental")
+        self.run_cli(*argv)
+        Image.new("RGB", (500, 200), "green").save(os.path.join(self.input_folder, "c.jpg"))
+
+        exit_code, events = self.run_cli(*argv)
+
+        self.assertEqual(exit_code, 0)
+        self.assertIn({"event": "skipped", "input": os.path.join(self.input_folder, "a.jpg"),
+                       "outputs": [os.path.join(self.output_folder, "a_w100px.jpg")]}, events)
+        self.assertEqual(events[-1], {"event": "finished", "processed": 1, "skipped": 1, "failed": 0})
+
+    def test_multiple_sizes_write_all_variants(self):
+        exit_code, events = self.run_cli(self.input_folder, "-o", self.output_folder,
+                                         "--pixels", "50", "100", "--target-mb", "5")
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(events[1]["outputs"], [os.path.join(self.output_folder, name)
+                                                for name in ("a_w50px.jpg", "a_w100px.jpg", "a_5.0MB.jpg")])
+        with Image.open(os.path.join(self.output_folder, "a_w50px.jpg")) as image:
+            self.assertEqual(image.size, (100, 50))
+
+    def test_pipeline_writes_same_outputs(self):
+        exit_code, events = self.run_cli(self.input_folder, "-o", self.output_folder, "--pixels", "100",
+                                         "--recursive", "--pipeline", "--io-threads", "2", "--prefetch", "1")
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(events[-1], {"event": "finished", "processed": 2, "skipped": 0, "failed": 0})
+        with Image.open(os.path.join(self.output_folder, "nested", "b_w100px.png")) as image:
+            self.assertEqual(image.size, (100, 200))
+
+    def test_resume_and_undo_use_the_journal(self):
+        first = os.path.join(self.input_folder, "a.jpg")
+        second = os.path.join(self.input_folder, "nested", "b.png")
+        journal = BatchJournal(self.output_folder)
+        batch_id = journal.begin([(first, os.path.join(self.output_folder, "a_w100px.jpg"), {"scaled_size": 100}),
+                                  (second, os.path.join(self.output_folder, "b_w100px.png"), {"scaled_size": 100})])
+        journal.record_done(batch_id, first, [os.path.join(self.output_folder, "a_w100px.jpg")])
+        journal.close()
+
+        exit_code, events = self.run_cli("-o", self.output_folder, "--resume")
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(events[0], {"event": "resume", "batch": batch_id, "done": 1, "remaining": 1})
+        self.assertEqual(events[-1], {"event": "finished", "processed": 1, "skipped": 0, "failed": 0})
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "b_w100px.png")))
+
+        exit_code, events = self.run_cli("-o", self.output_folder, "--undo")
+
+        self.assertEqual(events, [{"event": "undone", "removed": 2}])
+        self.assertFalse(os.path.exists(os.path.join(self.output_folder, "b_w100px.png")))
+
+    def test_dedupe_reports_duplicates(self):
+        with open(os.path.join(self.input_folder, "a.jpg"), "rb") as src:
+            data = src.read()
+        with open(os.path.join(self.input_folder, "a_copy.jpg"), "wb") as dst:
+            dst.write(data)
+
+        exit_code, events = self.run_cli(self.input_folder, "-o", self.output_folder, "--pixels", "100", "--dedupe")
+
+        self.assertEqual(exit_code, 0)
+        self.assertIn({"event": "duplicate", "input": os.path.join(self.input_folder, "a_copy.jpg"),
+                       "outputs": [os.path.join(self.output_folder, "a_copy_w100px.jpg")],
+                       "duplicate_of": os.path.join(self.input_folder, "a.jpg")}, events)
+        self.assertEqual(events[-1], {"event": "finished", "processed": 1, "skipped": 0, "failed": 0, "duplicates": 1})
+
+    def test_dry_run_reports_the_plan_only(self):
+        exit_code, events = self.run_cli(self.input_folder, "-o", self.output_folder, "--pixels", "100",
+                                         "--recursive", "--dry-run")
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["event"], "plan")
+        self.assertEqual((events[0]["resize"], events[0]["copy"]), (2, 0))
+        self.assertEqual(events[0]["pixels"], 400 * 200 + 300 * 600)
+        self.assertFalse(os.path.exists(self.output_folder))
+
+    def test_plan_copies_inputs_under_target(self):
+        exit_code, events = self.run_cli(self.input_folder, "-o", self.output_folder, "--target-mb", "1",
+                                         "--recursive", "--plan")
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(events[1]["event"], "plan")
+        self.assertEqual((events[1]["resize"], events[1]["copy"]), (0, 2))
+        self.assertEqual(events[-1], {"event": "finished", "processed": 2, "skipped": 0, "failed": 0})
+
+    def test_no_inputs_is_an_error(self):
+        empty_folder = os.path.join(self.tmp.name, "empty")
+        os.makedirs(empty_folder)
+        with self.assertRaises(SystemExit):
+            self.run_cli(empty_folder, "-o", self.output_folder, "--target-mb", "1")
+
+    def test_importing_resizer_does_not_load_gui(self):
+        code = "import sys, image_resizer; print('tkinter' in sys.modules or 'tkinterdnd2' in sys.modules)"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip(), "False")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,43 +1,70 @@
 import os
 import shutil
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock, mock_open
 from PIL import Image
 from io import BytesIO
-from image_resizer import resize_image, UndoManager, DragDropEntry
+from image_resizer import resize_image, encode_image, estimate_memory_bytes, FINAL_ATTEMPTS, JOB_OVERHEAD_BYTES, find_input_files, get_output_filename, UndoManager, DragDropEntry
 
 
 class TestResizeImage(unittest.TestCase):
+    @patch("image_resizer.os.replace")
     @patch("image_resizer.os.path.getsize")
     @patch("image_resizer.shutil.copy2")
     @patch("image_resizer.Image.open")
-    def test_resize_image_skip_if_already_under_target(self, mock_open, mock_copy, mock_getsize):
+    def test_resize_image_skip_if_already_under_target(self, mock_open, mock_copy, mock_getsize, mock_replace):
         mock_getsize.return_value = 500 * 1024  # 500 KB (less than target 1 MB)
         input_path = "test.jpg"
         output_path = "output.jpg"
         
         result = resize_image(input_path, output_path, target_size_mb=1)
         
-        mock_copy.assert_called_once_with(input_path, output_path)
+        # Copied to a temporary name, then renamed into place
+        mock_copy.assert_called_once()
+        source, temp_path = mock_copy.call_args[0]
+        self.assertEqual(source, input_path)
+        mock_replace.assert_called_once_with(temp_path, output_path)
+        mock_open.assert_not_called()
         self.assertIsNone(result)
 
+    @patch("image_resizer.encode_image")
     @patch("image_resizer.os.path.getsize")
     @patch("image_resizer.Image.open")
-    def test_resize_image_binary_search_to_target_size(self, mock_open, mock_getsize):
+    def test_resize_image_binary_search_to_target_size(self, mock_open, mock_getsize, mock_encode):
         mock_image = MagicMock()
         mock_image.size = (2000, 1000)
         mock_image.format = "JPEG"
         mock_open.return_value = mock_image
-        mock_getsize.side_effect = [5 * 1024 * 1024, 1.5 * 1024 * 1024, 900 * 1024]  # Simulate decreasing size
+        mock_getsize.return_value = 5 * 1024 * 1024
+        # Simulate encodings converging on the 1 MB target
+        mock_encode.side_effect = [b"x" * int(1.5 * 1024 * 1024), b"x" * (900 * 1024), b"x" * (1000 * 1024)]
 
-        input_path = "test.jpg"
-        output_path = "output.jpg"
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = "test.jpg"
+            output_path = os.path.join(tmp, "output.jpg")
 
-        result = resize_image(input_path, output_path, target_size_mb=1)
+            result = resize_image(input_path, output_path, target_size_mb=1)
 
-        # Check that the image was resized multiple times to find optimal size
-        self.assertIsNotNone(result)
-        self.assertEqual(mock_image.resize.call_count, 3)
+            # Check that the image was resized multiple times to find optimal size
+            self.assertIsNotNone(result)
+            self.assertEqual(mock_image.resize.call_count, 3)
+            # The best buffer is written directly instead of being encoded again
+            self.assertEqual(mock_encode.call_count, 3)
+            with open(output_path, "rb") as f:
+                self.assertEqual(len(f.read()), 1000 * 1024)
+
+    def test_resize_image_target_size_lowers_quality_before_scale(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "noise.jpg")
+            output_path = os.path.join(tmp, "output.jpg")
+            Image.effect_noise((600, 400), 80).convert("RGB").save(input_path, quality=100)
+            target_size_mb = os.path.getsize(input_path) * 0.6 / (1024 * 1024)
+
+            result = resize_image(input_path, output_path, target_size_mb=target_size_mb, min_quality=50)
+
+            self.assertEqual(result.size, (600, 400))
+            self.assertLessEqual(os.path.getsize(output_path), target_size_mb * 1024 * 1024)
 
     @patch("image_resizer.os.path.getsize")
     @patch("image_resizer.Image.open")
@@ -56,13 +83,132 @@ class TestResizeImage(unittest.TestCase):
         mock_open.return_value = mock_image
 
         input_path = "test.png"
-        output_path = "output.png"
 
-        result = resize_image(input_path, output_path, scaled_size=500)
+        with tempfile.TemporaryDirectory() as tmp:
+            output_path = os.path.join(tmp, "output.png")
+
+            result = resize_image(input_path, output_path, scaled_size=500)
 
         self.assertIsNotNone(result)
         mock_image.resize.assert_called_once_with((1000, 500), Image.Resampling.LANCZOS)
 
+    def test_resize_image_invalid_preset(self):
+        with self.assertRaises(ValueError):
+            resize_image("test.jpg", "output.jpg", scaled_size=100, preset="instant")
+
+    def test_resize_image_fast_preset_decodes_jpeg_at_reduced_scale(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "large.jpg")
+            output_path = os.path.join(tmp, "output.jpg")
+            Image.new("RGB", (1600, 1200), (200, 100, 50)).save(input_path)
+
+            with patch("image_resizer.Image.Image.resize", autospec=True, side_effect=Image.Image.resize) as mock_resize:
+                result = resize_image(input_path, output_path, scaled_size=150, preset="fast")
+
+            # Draft mode decoded at 1/8 scale before the final resample
+            self.assertEqual(mock_resize.call_args[0][0].size, (200, 150))
+            self.assertEqual(result.size, (200, 150))
+
+    def test_resize_image_variants_from_single_decode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "photo.jpg")
+            Image.effect_noise((1600, 1200), 40).convert("RGB").save(input_path)
+            base_path = os.path.join(tmp, "out", "photo.jpg")
+            os.makedirs(os.path.dirname(base_path))
+
+            with patch("image_resizer.Image.open", side_effect=Image.open) as mock_image_open:
+                results = resize_image(input_path, base_path, scaled_size=[150, 600], target_size_mb=[0.05])
+
+            mock_image_open.assert_called_once_with(input_path)
+            self.assertEqual([image.size for image in results[:2]], [(200, 150), (800, 600)])
+            self.assertLessEqual(os.path.getsize(os.path.join(tmp, "out", "photo_0.05MB.jpg")), 0.05 * 1024 * 1024)
+            for name in ("photo_w150px.jpg", "photo_w600px.jpg"):
+                self.assertTrue(os.path.exists(os.path.join(tmp, "out", name)))
+
+    def test_variants_that_are_all_copies_skip_the_decode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "photo.png")
+            Image.new("RGB", (400, 300), "red").save(input_path)
+            base_path = os.path.join(tmp, "photo.png")
+
+            with patch("PIL.ImageFile.ImageFile.load") as mock_load:
+                results = resize_image(input_path, base_path, target_size_mb=[1, 2])
+
+            mock_load.assert_not_called()
+            self.assertEqual(results, [None, None])
+            for name in ("photo_1MB.png", "photo_2MB.png"):
+                with open(os.path.join(tmp, name), "rb") as copy, open(input_path, "rb") as source:
+                    self.assertEqual(copy.read(), source.read())
+
+    def test_estimate_memory_accounts_for_draft_decoding(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "large.jpg")
+            Image.new("RGB", (4000, 3000)).save(input_path)
+
+            full = estimate_memory_bytes(input_path, scaled_size=300, preset="quality")
+            reduced = estimate_memory_bytes(input_path, scaled_size=300, preset="fast")
+
+            self.assertGreaterEqual(full, 4000 * 3000 * 4)
+            self.assertLess(reduced - JOB_OVERHEAD_BYTES, (full - JOB_OVERHEAD_BYTES) / 16)
+
+    def test_resize_image_transcodes_instead_of_copying(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "logo.png")
+            image = Image.new("RGBA", (300, 200), (0, 0, 0, 0))
+            image.paste((200, 0, 0, 255), (50, 50, 250, 150))
+            image.save(input_path)
+            webp_path = os.path.join(tmp, "logo.webp")
+            jpeg_path = os.path.join(tmp, "logo.jpg")
+
+            # Already under the target, but a different format is asked for
+            resize_image(input_path, webp_path, target_size_mb=1, output_format="WEBP")
+            resize_image(input_path, jpeg_path, scaled_size=100, output_format="JPEG")
+
+            with Image.open(webp_path) as webp:
+                self.assertEqual((webp.format, webp.size), ("WEBP", (300, 200)))
+            with Image.open(jpeg_path) as jpeg:
+                self.assertEqual((jpeg.format, jpeg.mode, jpeg.size), ("JPEG", "RGB", (150, 100)))
+                self.assertTrue(jpeg.info.get("progressive"))
+                # Transparent pixels are flattened onto white
+                self.assertEqual(jpeg.getpixel((2, 2)), (255, 255, 255))
+
+    def test_resize_image_searches_at_fast_effort_and_refines_at_final_effort(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "noise.png")
+            output_path = os.path.join(tmp, "output.webp")
+            Image.effect_noise((600, 400), 40).convert("RGB").save(input_path)
+
+            with patch("image_resizer.encode_image", side_effect=encode_image) as mock_encode:
+                resize_image(input_path, output_path, target_size_mb=0.03, output_format="WEBP", effort="thorough")
+
+            methods = [call.args[3]["method"] for call in mock_encode.call_args_list]
+            self.assertEqual(methods[0], 0)
+            self.assertEqual(methods[-1], 6)
+            self.assertLessEqual(methods.count(6), FINAL_ATTEMPTS)
+            self.assertLessEqual(os.path.getsize(output_path), 0.03 * 1024 * 1024)
+            with Image.open(output_path) as image:
+                self.assertEqual(image.format, "WEBP")
+
+
+class TestInputFiles(unittest.TestCase):
+    def test_find_input_files_filters_extensions_and_recurses(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "sub"))
+            for name in ("a.JPG", "notes.txt", os.path.join("sub", "b.webp")):
+                open(os.path.join(tmp, name), "w").close()
+
+            self.assertEqual(find_input_files(tmp), [os.path.join(tmp, "a.JPG")])
+            self.assertEqual(find_input_files(tmp, recursive=True),
+                             [os.path.join(tmp, "a.JPG"), os.path.join(tmp, "sub", "b.webp")])
+            self.assertEqual(find_input_files(tmp, recursive=True, exclude=[os.path.join(tmp, "sub")]),
+                             [os.path.join(tmp, "a.JPG")])
+
+    def test_get_output_filename(self):
+        self.assertEqual(get_output_filename("photos/cat.jpg", "pixels", scaled_size=1000), "photos/cat_w1000px.jpg")
+        self.assertEqual(get_output_filename("cat.png", "size", target_size_mb=1.5), "cat_1.5MB.png")
+        self.assertEqual(get_output_filename("cat.png", "size", target_size_mb=1.5, output_format="AVIF"),
+                         "cat_1.5MB.avif")
+
 
 class TestUndoManager(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image
+from journal import BatchJournal, JOURNAL_NAME, KEEP_BATCHES
+from batch_engine import BatchEngine
+
+
+class TestBatchJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output_folder = os.path.join(self.tmp.name, "out")
+        self.jobs = []
+        for i in range(4):
+            input_file = os.path.join(self.tmp.name, f"in{i}.png")
+            Image.new("RGB", (200, 100), (i * 50, 0, 0)).save(input_file)
+            self.jobs.append((input_file, os.path.join(self.output_folder, f"out{i}.png"), {"scaled_size": 50}))
+        os.makedirs(self.output_folder)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_interrupted_batch_resumes_with_remaining_jobs(self):
+        journal = BatchJournal(self.output_folder)
+        batch_id = journal.begin(self.jobs)
+        journal.record_done(batch_id, self.jobs[0][0], [self.jobs[0][1]])
+        journal.record_done(batch_id, self.jobs[1][0], [self.jobs[1][1]])
+        # Simulate a crash in the middle of writing a record
+        journal._file.write('{"type": "done", "batch"')
+        journal.close()
+
+        reopened = BatchJournal(self.output_folder)
+        self.assertEqual(reopened.interrupted_batch(), (batch_id, self.jobs[2:], 2))
+
+        result = BatchEngine(workers=1, journal=reopened).run(self.jobs[2:], batch_id)
+
+        self.assertEqual(result, (2, 0))
+        self.assertIsNone(reopened.interrupted_batch())
+        self.assertEqual(len(reopened.batches()[batch_id]["done"]), 4)
+
+    def test_cancelled_batch_stays_resumable(self):
+        journal = BatchJournal(self.output_folder)
+        engine = BatchEngine(workers=1, journal=journal)
+        engine.cancel()
+
+        engine.run(self.jobs)
+
+        self.assertEqual(journal.interrupted_batch(), (engine.batch_id, self.jobs, 0))
+
+    def test_undo_removes_outputs_after_restart(self):
+        BatchEngine(workers=1, journal=BatchJournal(self.output_folder)).run(self.jobs[:2])
+        BatchEngine(workers=1, journal=BatchJournal(self.output_folder)).run(self.jobs[2:])
+
+        journal = BatchJournal(self.output_folder)
+        self.assertEqual(journal.undo_last_batch(), 2)
+        self.assertEqual(sorted(os.listdir(self.output_folder)), [JOURNAL_NAME, "out0.png", "out1.png"])
+        self.assertEqual(BatchJournal(self.output_folder).undo_last_batch(), 2)
+        self.assertIsNone(BatchJournal(self.output_folder).undo_last_batch())
+        self.assertEqual(os.listdir(self.output_folder), [JOURNAL_NAME])
+
+    def test_compaction_keeps_recent_batches(self):
+        journal = BatchJournal(self.output_folder)
+        with patch("journal.os.fsync"):
+            for _ in range(KEEP_BATCHES + 5):
+                batch_id = journal.begin(self.jobs[:1])
+                journal.record_done(batch_id, self.jobs[0][0], [self.jobs[0][1]])
+                journal.end(batch_id)
+        journal.close()
+
+        batches = BatchJournal(self.output_folder).batches()
+        self.assertLessEqual(len(batches), KEEP_BATCHES)
+        self.assertIn(batch_id, batches)
+        self.assertTrue(batches[batch_id]["finished"])
+
+
+if __name__ == "__main__":
+    unittest.main()
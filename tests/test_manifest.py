@@ -0,0 +1,67 @@
+import os
+import time
+import tempfile
+import unittest
+from manifest import Manifest, MANIFEST_NAME
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_file = os.path.join(self.tmp.name, "photo.jpg")
+        self.output_folder = os.path.join(self.tmp.name, "out")
+        self.output_file = os.path.join(self.output_folder, "photo_w100px.jpg")
+        self.options = {"scaled_size": 100, "target_size_mb": None}
+        os.makedirs(self.output_folder)
+        for path in (self.input_file, self.output_file):
+            with open(path, "wb") as f:
+                f.write(b"image data")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def recorded_manifest(self, use_hash=False):
+        manifest = Manifest(self.output_folder, use_hash=use_hash)
+        manifest.record(self.input_file, self.output_file, self.options)
+        manifest.save()
+        return Manifest(self.output_folder, use_hash=use_hash)
+
+    def test_unchanged_input_is_current_after_reload(self):
+        manifest = self.recorded_manifest()
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, MANIFEST_NAME)))
+        self.assertTrue(manifest.is_current(self.input_file, self.output_file, self.options))
+
+    def test_changed_settings_or_missing_output_are_not_current(self):
+        manifest = self.recorded_manifest()
+        self.assertFalse(manifest.is_current(self.input_file, self.output_file, {"scaled_size": 200, "target_size_mb": None}))
+        os.remove(self.output_file)
+        self.assertFalse(manifest.is_current(self.input_file, self.output_file, self.options))
+
+    def test_modified_input_is_not_current(self):
+        manifest = self.recorded_manifest()
+        with open(self.input_file, "wb") as f:
+            f.write(b"new image data")
+        self.assertFalse(manifest.is_current(self.input_file, self.output_file, self.options))
+
+    def test_content_hash_ignores_touched_mtime(self):
+        manifest = self.recorded_manifest(use_hash=True)
+        later = time.time() + 60
+        os.utime(self.input_file, (later, later))
+        self.assertTrue(manifest.is_current(self.input_file, self.output_file, self.options))
+        self.assertFalse(Manifest(self.output_folder).is_current(self.input_file, self.output_file, self.options))
+
+    def test_split_jobs(self):
+        manifest = self.recorded_manifest()
+        new_job = (os.path.join(self.tmp.name, "new.jpg"), os.path.join(self.output_folder, "new_w100px.jpg"), self.options)
+        pending, skipped = manifest.split_jobs([(self.input_file, self.output_file, self.options), new_job])
+        self.assertEqual(pending, [new_job])
+        self.assertEqual(len(skipped), 1)
+
+    def test_corrupt_manifest_is_ignored(self):
+        with open(os.path.join(self.output_folder, MANIFEST_NAME), "w") as f:
+            f.write("{not json")
+        self.assertEqual(Manifest(self.output_folder).entries, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image
+from planner import plan_batch
+
+
+class TestPlanBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.small = os.path.join(self.tmp.name, "small.png")
+        self.large = os.path.join(self.tmp.name, "large.png")
+        self.medium = os.path.join(self.tmp.name, "medium.jpg")
+        Image.new("RGB", (100, 100), "red").save(self.small)
+        Image.new("RGB", (2000, 1000), "blue").save(self.large)
+        Image.effect_noise((800, 600), 60).convert("RGB").save(self.medium, quality=95)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def job(self, input_file, **options):
+        return input_file, os.path.join(self.tmp.name, "out", os.path.basename(input_file)), options
+
+    def test_largest_jobs_come_first(self):
+        jobs = [self.job(path, scaled_size=50) for path in (self.small, self.medium, self.large)]
+
+        with patch("PIL.ImageFile.ImageFile.load") as load:
+            plan = plan_batch(jobs)
+
+        load.assert_not_called()  # headers only
+        self.assertEqual([job[0] for job in plan.jobs], [self.large, self.medium, self.small])
+        self.assertEqual(plan.copies, [])
+        self.assertEqual(plan.total_pixels, 100 * 100 + 800 * 600 + 2000 * 1000)
+        self.assertEqual(plan.total_bytes, sum(os.path.getsize(job[0]) for job in jobs))
+
+    def test_inputs_under_target_size_are_copies(self):
+        small_mb = 1.1 * os.path.getsize(self.small) / (1024 * 1024)
+        jobs = [self.job(self.small, target_size_mb=[small_mb, 2 * small_mb]),
+                self.job(self.medium, target_size_mb=small_mb), self.job(self.large, target_size_mb=[small_mb, 1.0])]
+
+        plan = plan_batch(jobs)
+
+        self.assertEqual(plan.copies, [jobs[0]])
+        self.assertEqual(plan.jobs, [jobs[2], jobs[1]])
+        self.assertEqual(plan.total_pixels, 800 * 600 + 2000 * 1000)
+
+    def test_estimate_spreads_jobs_over_workers(self):
+        jobs = [self.job(path, scaled_size=50) for path in (self.small, self.medium, self.large)]
+        plan = plan_batch(jobs)
+
+        self.assertAlmostEqual(plan.estimated_seconds(1), plan.total_seconds)
+        # The largest job alone bounds the batch once every other job runs beside it
+        self.assertAlmostEqual(plan.estimated_seconds(3), plan.seconds[self.large])
+        self.assertLess(plan.estimated_seconds(2), plan.estimated_seconds(1))
+
+    def test_unreadable_inputs_are_planned_as_free(self):
+        broken = os.path.join(self.tmp.name, "broken.jpg")
+        with open(broken, "wb") as f:
+            f.write(b"not an image")
+
+        plan = plan_batch([self.job(broken, scaled_size=50), self.job(self.small, scaled_size=50)])
+
+        self.assertEqual([job[0] for job in plan.jobs], [self.small, broken])
+        self.assertEqual(plan.seconds[broken], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
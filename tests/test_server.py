@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+import http.client
+from io import BytesIO
+from unittest.mock import patch
+from PIL import Image
+import server
+from server import ResizeServer, ResponseCache
+
+
+class TestResizeServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, "cats"))
+        Image.new("RGB", (400, 200), "red").save(os.path.join(self.tmp.name, "cats", "tom.png"))
+        with open(os.path.join(self.tmp.name, "notes.txt"), "w") as f:
+            f.write("not an image")
+        self.server = ResizeServer(self.tmp.name, workers=2, cache_mb=1, use_processes=False)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        self.tmp.cleanup()
+
+    async def fetch(self, path, headers=None, method="GET"):
+        def request():
+            connection = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=30)
+            try:
+                connection.request(method, path, headers=headers or {})
+                response = connection.getresponse()
+                return response.status, dict(response.getheaders()), response.read()
+            finally:
+                connection.close()
+        return await asyncio.to_thread(request)
+
+    async def test_pixel_and_target_modes(self):
+        status, headers, body = await self.fetch("/cats/tom.png?px=50")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["Content-Type"], "image/png")
+        with Image.open(BytesIO(body)) as image:
+            self.assertEqual(image.size, (100, 50))
+
+        status, _, body = await self.fetch("/cats/tom.png?mb=5")
+        self.assertEqual(status, 200)
+        with open(os.path.join(self.tmp.name, "cats", "tom.png"), "rb") as f:
+            self.assertEqual(body, f.read())
+
+    async def test_etag_and_cache(self):
+        _, headers, body = await self.fetch("/cats/tom.png?px=50")
+        status, _, cached = await self.fetch("/cats/tom.png?px=50")
+        self.assertEqual((status, cached), (200, body))
+        self.assertEqual(self.server.stats["resizes"], 1)
+        self.assertEqual(self.server.stats["cache_hits"], 1)
+
+        status, _, body = await self.fetch("/cats/tom.png?px=50", {"If-None-Match": headers["ETag"]})
+        self.assertEqual((status, body), (304, b""))
+        self.assertEqual(self.server.stats["resizes"], 1)
+
+        # Cached and revalidated variants don't read the image header again
+        with patch("server.read_shortest_side") as mock_read:
+            self.assertEqual((await self.fetch("/cats/tom.png?px=50"))[0], 200)
+            self.assertEqual((await self.fetch("/cats/tom.png?px=50", {"If-None-Match": headers["ETag"]}))[0], 304)
+        mock_read.assert_not_called()
+
+    async def test_identical_requests_are_coalesced(self):
+        resize_to_bytes = server.resize_to_bytes
+
+        def slow_resize(*args):
+            time.sleep(0.3)
+            return resize_to_bytes(*args)
+
+        with patch("server.resize_to_bytes", side_effect=slow_resize) as mock_resize:
+            results = await asyncio.gather(*[self.fetch("/cats/tom.png?px=60") for _ in range(4)])
+
+        self.assertEqual(mock_resize.call_count, 1)
+        self.assertEqual(len({body for _, _, body in results}), 1)
+        self.assertEqual(self.server.stats["coalesced"], 3)
+
+    async def test_errors(self):
+        self.assertEqual((await self.fetch("/cats/tom.png"))[0], 400)
+        self.assertEqual((await self.fetch("/cats/tom.png?px=50&mb=1"))[0], 400)
+        self.assertEqual((await self.fetch("/cats/tom.png?px=-5"))[0], 400)
+        self.assertEqual((await self.fetch("/cats/tom.png?px=0"))[0], 400)
+        self.assertEqual((await self.fetch("/cats/tom.png?mb=0"))[0], 400)
+        # Larger than the image's shortest side, and than max_px
+        self.assertEqual((await self.fetch("/cats/tom.png?px=201"))[0], 400)
+        self.assertEqual((await self.fetch("/cats/tom.png?px=100000"))[0], 400)
+        self.assertEqual((await self.fetch("/cats/tom.png?px=200"))[0], 200)
+        self.assertEqual((await self.fetch("/cats/missing.png?px=50"))[0], 404)
+        self.assertEqual((await self.fetch("/notes.txt?px=50"))[0], 404)
+        self.assertEqual((await self.fetch("/../outside.png?px=50"))[0], 403)
+        self.assertEqual((await self.fetch("/cats/tom.png?px=50", method="POST"))[0], 405)
+
+
+class TestWorkerRecovery(unittest.IsolatedAsyncioTestCase):
+    async def test_dead_worker_is_replaced(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Image.new("RGB", (400, 200), "red").save(os.path.join(tmp, "tom.png"))
+            resize_server = ResizeServer(tmp, workers=1, cache_mb=1, max_px=100)
+            await resize_server.start()
+            try:
+                self.assertEqual((await resize_server.respond("GET", "/tom.png?px=50", {}))[0], 200)
+                broken = resize_server._executor
+                for process in list(broken._processes.values()):
+                    process.kill()
+                    process.join()
+
+                status, _, body = await resize_server.respond("GET", "/tom.png?px=60", {})
+
+                self.assertEqual(status, 200)
+                self.assertIsNot(resize_server._executor, broken)
+                with self.assertRaises(server.HTTPError) as raised:
+                    await resize_server.respond("GET", "/tom.png?px=101", {})
+                self.assertEqual(raised.exception.status, 400)
+            finally:
+                await resize_server.close()
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_evicts_least_recently_used_by_size(self):
+        cache = ResponseCache(10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        cache.get("a")
+        cache.put("c", b"1234")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"1234")
+        self.assertEqual(cache.size, 8)
+        cache.put("huge", b"x" * 11)
+        self.assertIsNone(cache.get("huge"))
+
+
+if __name__ == "__main__":
+    unittest.main()
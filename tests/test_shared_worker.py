@@ -0,0 +1,139 @@
+import os
+import json
+import tempfile
+import unittest
+import multiprocessing
+from unittest.mock import patch
+from PIL import Image
+from batch_engine import build_jobs
+from shared_worker import LEASE_FOLDER, LeaseDirectory, SharedFolderWorker
+
+
+def run_local_worker(jobs, output_folder, worker_id, results):
+    worker = SharedFolderWorker(jobs, output_folder, worker_id, lease_seconds=5, poll_seconds=0.05)
+    results.put((worker_id, worker.run()))
+
+
+class TestSharedFolderWorker(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output_folder = os.path.join(self.tmp.name, "out")
+        os.makedirs(self.output_folder)
+        inputs = []
+        for i in range(8):
+            path = os.path.join(self.tmp.name, f"in{i}.png")
+            Image.new("RGB", (300, 200), (i * 30, 0, 0)).save(path)
+            inputs.append(path)
+        self.jobs = build_jobs(inputs, self.output_folder, "pixels", scaled_size=50)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def markers(self, suffix):
+        return [name for name in os.listdir(os.path.join(self.output_folder, LEASE_FOLDER)) if name.endswith(suffix)]
+
+    def test_local_workers_share_the_batch(self):
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=run_local_worker,
+                                             args=(self.jobs, self.output_folder, f"w{i}", results))
+                     for i in range(3)]
+        for process in processes:
+            process.start()
+        counts = dict(results.get(timeout=60) for _ in processes)
+        for process in processes:
+            process.join(timeout=60)
+
+        # Every job ran exactly once across the workers
+        self.assertEqual(sum(processed for processed, _ in counts.values()), len(self.jobs))
+        self.assertEqual(len(self.markers(".done")), len(self.jobs))
+        self.assertEqual(self.markers(".lease"), [])
+        for _, output_file, _ in self.jobs:
+            with Image.open(output_file) as image:
+                self.assertEqual(image.size, (75, 50))
+
+        # A later run finds nothing left to do
+        self.assertEqual(SharedFolderWorker(self.jobs, self.output_folder).run(), (0, 0))
+
+    def test_crashed_workers_lease_expires(self):
+        crashed = LeaseDirectory(self.output_folder, "crashed")
+        key = crashed.key(self.jobs[0])
+        self.assertTrue(crashed.claim(key, self.jobs[0][0]))
+
+        worker = SharedFolderWorker(self.jobs, self.output_folder, "survivor", lease_seconds=0.2, poll_seconds=0.05)
+
+        self.assertEqual(worker.run(), (len(self.jobs), 0))
+        with open(os.path.join(self.output_folder, LEASE_FOLDER, key + ".done")) as f:
+            self.assertEqual(json.load(f)["worker"], "survivor")
+
+    def test_live_lease_is_respected(self):
+        owner = LeaseDirectory(self.output_folder, "owner", lease_seconds=60)
+        other = LeaseDirectory(self.output_folder, "other", lease_seconds=60)
+        key = owner.key(self.jobs[0])
+
+        self.assertTrue(owner.claim(key, self.jobs[0][0]))
+        self.assertFalse(other.claim(key, self.jobs[0][0]))
+        owner.finish(key, self.jobs[0][0])
+        self.assertTrue(other.is_finished(key, self.jobs[0][0]))
+
+    def test_failed_jobs_are_retried_by_a_rerun(self):
+        worker = SharedFolderWorker(self.jobs[:1], self.output_folder, poll_seconds=0.05)
+        with patch("shared_worker.run_job", side_effect=OSError("share unavailable")):
+            self.assertEqual(worker.run(), (0, 1))
+        self.assertEqual(len(self.markers(".failed")), 1)
+
+        self.assertEqual(SharedFolderWorker(self.jobs[:1], self.output_folder).run(), (1, 0))
+        self.assertEqual(self.markers(".failed"), [])
+        self.assertEqual(len(self.markers(".done")), 1)
+
+    def test_job_failed_by_another_worker_is_not_retried(self):
+        worker = SharedFolderWorker(self.jobs[:1], self.output_folder, poll_seconds=0.05)
+        other = LeaseDirectory(self.output_folder, "other")
+        other.join_run()
+        key = other.key(self.jobs[0])
+        other.claim(key, self.jobs[0][0])
+
+        def fail_while_waiting(seconds):
+            other.finish(key, self.jobs[0][0], error="corrupt")
+
+        with patch("shared_worker.time.sleep", side_effect=fail_while_waiting):
+            self.assertEqual(worker.run(), (0, 0))
+
+    def test_worker_joining_a_run_skips_its_failures(self):
+        other = LeaseDirectory(self.output_folder, "other")
+        other.join_run()
+        key = other.key(self.jobs[0])
+        other.claim(key, self.jobs[0][0])
+        other.finish(key, self.jobs[0][0], error="corrupt")
+
+        # Started after the failure, but while the run is still going
+        worker = SharedFolderWorker(self.jobs[:1], self.output_folder)
+        self.assertEqual(worker.run(), (0, 0))
+        self.assertEqual(worker.leases.run_id, other.run_id)
+
+    def test_taken_over_lease_is_left_to_its_new_owner(self):
+        owner = LeaseDirectory(self.output_folder, "owner")
+        successor = LeaseDirectory(self.output_folder, "successor")
+        key = owner.key(self.jobs[0])
+        owner.claim(key, self.jobs[0][0])
+        # As when the successor takes over the expired lease
+        os.remove(owner.path(key, ".lease"))
+        self.assertTrue(successor.claim(key, self.jobs[0][0]))
+
+        self.assertFalse(owner.renew(key))
+        owner.finish(key, self.jobs[0][0])
+
+        self.assertTrue(successor.renew(key))
+        self.assertFalse(LeaseDirectory(self.output_folder, "third").claim(key, self.jobs[0][0]))
+
+    def test_changed_input_is_processed_again(self):
+        leases = LeaseDirectory(self.output_folder, "w")
+        key = leases.key(self.jobs[0])
+        leases.finish(key, self.jobs[0][0])
+
+        Image.new("RGB", (300, 210), "white").save(self.jobs[0][0])
+
+        self.assertFalse(leases.is_finished(key, self.jobs[0][0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image, JpegImagePlugin
+from thumbnails import ThumbnailCache, ThumbnailLoader, make_thumbnail, render_preview
+
+
+class TestThumbnailCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_folder = os.path.join(self.tmp.name, "cache")
+        self.images = []
+        for i in range(3):
+            path = os.path.join(self.tmp.name, f"photo{i}.jpg")
+            Image.new("RGB", (800, 600), (i * 60, 100, 0)).save(path)
+            self.images.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_jpeg_thumbnail_uses_reduced_decode(self):
+        with patch.object(JpegImagePlugin.JpegImageFile, "draft", autospec=True,
+                          side_effect=JpegImagePlugin.JpegImageFile.draft) as mock_draft:
+            thumbnail = make_thumbnail(self.images[0], (64, 64))
+
+        self.assertEqual(thumbnail.size, (64, 48))
+        mock_draft.assert_called()
+
+    def test_memory_hit_does_not_decode_again(self):
+        cache = ThumbnailCache(None, size=(64, 64))
+        first = cache.get(self.images[0])
+
+        with patch("thumbnails.make_thumbnail") as mock_make:
+            self.assertIs(cache.get(self.images[0]), first)
+        mock_make.assert_not_called()
+
+    def test_memory_is_bounded_least_recently_used_first(self):
+        # Room for two 64x48 RGB thumbnails
+        cache = ThumbnailCache(None, size=(64, 64), max_memory_bytes=2 * 64 * 48 * 3)
+        first = cache.get(self.images[0])
+        cache.get(self.images[1])
+        cache.get(self.images[0])
+        cache.get(self.images[2])
+
+        self.assertIs(cache.get(self.images[0]), first)
+        self.assertEqual(len(cache._memory), 2)
+
+    def test_disk_cache_survives_restart_and_is_bounded(self):
+        cache = ThumbnailCache(self.cache_folder, size=(64, 64))
+        cache.get(self.images[0])
+
+        with patch("thumbnails.make_thumbnail") as mock_make:
+            reloaded = ThumbnailCache(self.cache_folder, size=(64, 64)).get(self.images[0])
+        mock_make.assert_not_called()
+        self.assertEqual(reloaded.size, (64, 48))
+
+        entry_size = os.path.getsize(os.path.join(self.cache_folder, os.listdir(self.cache_folder)[0]))
+        small = ThumbnailCache(self.cache_folder, size=(64, 64), max_disk_bytes=entry_size * 5 // 2)
+        for path in self.images:
+            small.get(path)
+        self.assertEqual(len(os.listdir(self.cache_folder)), 2)
+
+    def test_modified_file_gets_new_thumbnail(self):
+        cache = ThumbnailCache(None, size=(64, 64))
+        key = cache.key(self.images[0])
+        Image.new("RGB", (400, 400), "white").save(self.images[0])
+        os.utime(self.images[0], ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+
+        self.assertNotEqual(cache.key(self.images[0]), key)
+        self.assertEqual(cache.get(self.images[0]).size, (64, 64))
+
+
+class TestPreview(unittest.TestCase):
+    def test_render_preview_describes_before_and_after_without_writing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "photo.png")
+            Image.new("RGB", (400, 200), "red").save(path)
+
+            preview = render_preview(path, {"scaled_size": 50})
+
+            self.assertEqual(preview["before"][1], (400, 200))
+            self.assertEqual(preview["after"][1], (100, 50))
+            self.assertGreater(preview["after"][2], 0)
+            self.assertEqual(os.listdir(tmp), ["photo.png"])
+
+    def test_loader_serves_requests_in_background(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "photo.png")
+            Image.new("RGB", (400, 200), "red").save(path)
+            loader = ThumbnailLoader(ThumbnailCache(None, size=(64, 64)))
+
+            loader.request_listing(tmp)
+            self.assertEqual(loader.results.get(timeout=10), (0, "listing", tmp, [path]))
+            loader.request_thumbnail(path)
+            generation, kind, _, image = loader.results.get(timeout=10)
+            self.assertEqual((generation, kind, image.size), (0, "thumbnail", (64, 32)))
+            loader.request_thumbnail(os.path.join(tmp, "missing.png"))
+            self.assertEqual(loader.results.get(timeout=10)[1], "error")
+
+
+if __name__ == "__main__":
+    unittest.main()
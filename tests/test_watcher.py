@@ -0,0 +1,114 @@
+import os
+import time
+import queue
+import tempfile
+import threading
+import unittest
+from PIL import Image
+from watcher import Debouncer, FolderWatcher, PollingWatcher, create_watcher
+
+
+class TestDebouncer(unittest.TestCase):
+    def test_file_still_being_written_is_held_back(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "upload.jpg")
+            with open(path, "wb") as f:
+                f.write(b"part one")
+            debouncer = Debouncer(settle_seconds=0.2)
+            debouncer.touch(path)
+
+            self.assertEqual(debouncer.ready(), [])
+            time.sleep(0.1)
+            with open(path, "ab") as f:
+                f.write(b" and part two")
+            time.sleep(0.15)
+            self.assertEqual(debouncer.ready(), [])
+            time.sleep(0.25)
+            self.assertEqual(debouncer.ready(), [path])
+            self.assertEqual(len(debouncer), 0)
+
+
+class TestFolderWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # Registered first so it runs after the watcher thread has stopped
+        self.addCleanup(self.tmp.cleanup)
+        self.folder = os.path.join(self.tmp.name, "incoming")
+        self.output_folder = os.path.join(self.tmp.name, "resized")
+        os.makedirs(self.folder)
+        os.makedirs(self.output_folder)
+        Image.new("RGB", (400, 200), "red").save(os.path.join(self.folder, "old.png"))
+
+    def watch(self, use_polling, process_existing=False):
+        events = queue.Queue()
+        stop_event = threading.Event()
+        self.watcher = watcher = FolderWatcher(self.folder, self.output_folder, "pixels", scaled_size=50, workers=1,
+                                               settle_seconds=0.2, use_polling=use_polling, poll_interval=0.1,
+                                               on_event=lambda *event: events.put(event))
+        self.thread = thread = threading.Thread(target=watcher.run, args=(stop_event, process_existing))
+        thread.start()
+        self.addCleanup(thread.join, 60)
+        self.addCleanup(stop_event.set)
+        time.sleep(0.3)
+
+        def stop():
+            stop_event.set()
+            thread.join(60)
+        return events, stop
+
+    def check_new_file_is_resized(self, use_polling):
+        events, _ = self.watch(use_polling)
+        Image.new("RGB", (400, 200), "blue").save(os.path.join(self.folder, "new.png"))
+
+        kind, input_file, outputs = events.get(timeout=30)
+
+        self.assertEqual((kind, input_file), ("done", os.path.join(self.folder, "new.png")))
+        with Image.open(outputs[0]) as image:
+            self.assertEqual(image.size, (100, 50))
+        # Files present before the watch started are left alone
+        self.assertFalse(os.path.exists(os.path.join(self.output_folder, "old_w50px.png")))
+
+    def test_inotify_detects_new_file(self):
+        self.check_new_file_is_resized(use_polling=False)
+
+    def test_polling_detects_new_file(self):
+        self.check_new_file_is_resized(use_polling=True)
+
+    def test_existing_files_are_caught_up_once(self):
+        events, stop = self.watch(use_polling=True, process_existing=True)
+        self.assertEqual(events.get(timeout=30)[:2], ("done", os.path.join(self.folder, "old.png")))
+        stop()
+
+        # The manifest remembers the file, so a restarted watcher skips it
+        watcher = FolderWatcher(self.folder, self.output_folder, "pixels", scaled_size=50)
+        self.assertEqual(watcher.jobs_for([os.path.join(self.folder, "old.png")]), [])
+
+    def test_dead_worker_process_is_replaced(self):
+        events, _ = self.watch(use_polling=True)
+        Image.new("RGB", (400, 200), "blue").save(os.path.join(self.folder, "first.png"))
+        self.assertEqual(events.get(timeout=30)[0], "done")
+        broken = self.watcher.executor
+        for process in list(broken._processes.values()):
+            process.kill()
+            process.join()
+
+        Image.new("RGB", (400, 200), "green").save(os.path.join(self.folder, "second.png"))
+
+        self.assertEqual(events.get(timeout=30)[:2], ("done", os.path.join(self.folder, "second.png")))
+        self.assertTrue(self.thread.is_alive())
+        self.assertIsNot(self.watcher.executor, broken)
+
+    def test_output_folder_hiding_the_watched_folder_is_rejected(self):
+        with self.assertRaises(ValueError):
+            FolderWatcher(self.folder, self.folder, "pixels", scaled_size=50)
+        with self.assertRaises(ValueError):
+            FolderWatcher(self.folder, self.tmp.name, "pixels", scaled_size=50)
+        # An output folder inside the watched one is fine: it's excluded from watching
+        FolderWatcher(self.tmp.name, self.output_folder, "pixels", scaled_size=50)
+
+    def test_create_watcher_falls_back_to_polling(self):
+        self.assertIsInstance(create_watcher(self.folder, use_polling=True), PollingWatcher)
+
+
+if __name__ == "__main__":
+    unittest.main()
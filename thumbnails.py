@@ -0,0 +1,218 @@
+import io
+import os
+import queue
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from image_resizer import BufferedIO, atomic_write, find_input_files, resize_image
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (128, 128)
+PREVIEW_SIZE = (240, 240)
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024
+
+
+def default_cache_folder():
+    """Per-user folder for the on-disk thumbnail cache."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "image_resizer", "thumbnails")
+
+
+def make_thumbnail(source, size):
+    """Return an RGB/RGBA thumbnail fitting in size.
+
+    source is a path or file object. Pillow's thumbnail() asks the decoder for a reduced
+    resolution first (JPEG decodes at up to 1/8 scale), so large photos are never
+    decoded in full.
+    """
+    with Image.open(source) as image:
+        image.thumbnail(size, reducing_gap=2.0)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def image_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class ThumbnailCache:
+    """Size-bounded LRU cache of thumbnails, in memory and on disk.
+
+    Entries are keyed on the file's absolute path, mtime and size, so an edited image
+    gets a new thumbnail and the stale one ages out. The least recently used entries
+    are dropped once max_memory_bytes (decoded pixels) or max_disk_bytes (PNG files in
+    folder) is exceeded. Pass folder=None to keep thumbnails in memory only.
+
+    Not thread safe: use it from one thread (ThumbnailLoader does).
+    """
+    def __init__(self, folder=None, size=THUMBNAIL_SIZE, max_memory_bytes=DEFAULT_MEMORY_BYTES,
+                 max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.folder = folder
+        self.size = tuple(size)
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = None
+        self._disk_bytes = 0
+
+    def key(self, path):
+        stat = os.stat(path)
+        identity = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size[0]}x{self.size[1]}"
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def get(self, path):
+        """Return the thumbnail for path, generating and caching it on a miss."""
+        key = self.key(path)
+        image = self._memory.get(key)
+        if image is not None:
+            self._memory.move_to_end(key)
+            return image
+
+        image = self._load(key)
+        if image is None:
+            image = make_thumbnail(path, self.size)
+            self._store(key, image)
+        self._remember(key, image)
+        return image
+
+    def _remember(self, key, image):
+        self._memory[key] = image
+        self._memory_bytes += image_bytes(image)
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= image_bytes(evicted)
+
+    def _disk_index(self):
+        """Cached file sizes by name, least recently used first (loaded on first use)."""
+        if self._disk is None:
+            self._disk = OrderedDict()
+            try:
+                entries = [entry for entry in os.scandir(self.folder) if entry.name.endswith(".png")]
+            except OSError:
+                entries = []
+            for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime_ns):
+                self._disk[entry.name] = entry.stat().st_size
+            self._disk_bytes = sum(self._disk.values())
+        return self._disk
+
+    def _load(self, key):
+        if self.folder is None:
+            return None
+        name = key + ".png"
+        if name not in self._disk_index():
+            return None
+        path = os.path.join(self.folder, name)
+        try:
+            with Image.open(path) as image:
+                image.load()
+            # The file's mtime records its last use for eviction
+            os.utime(path)
+        except OSError:
+            self._forget(name)
+            return None
+        self._disk.move_to_end(name)
+        return image
+
+    def _store(self, key, image):
+        if self.folder is None:
+            return
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        data = buffer.getvalue()
+        name = key + ".png"
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            atomic_write(os.path.join(self.folder, name), data)
+        except OSError as e:
+            # A read-only or full cache folder only costs regenerating thumbnails
+            logger.warning(f"Could not cache thumbnail in {self.folder}: {str(e)}")
+            return
+        index = self._disk_index()
+        self._disk_bytes -= index.pop(name, 0)
+        index[name] = len(data)
+        self._disk_bytes += len(data)
+        while self._disk_bytes > self.max_disk_bytes and len(index) > 1:
+            evicted = next(iter(index))
+            try:
+                os.remove(os.path.join(self.folder, evicted))
+            except OSError:
+                pass
+            self._forget(evicted)
+
+    def _forget(self, name):
+        self._disk_bytes -= self._disk.pop(name, 0)
+
+
+def render_preview(input_path, options, size=PREVIEW_SIZE):
+    """Run resize_image in memory with the given options and describe the first output.
+
+    Returns {"before": (thumbnail, (width, height), bytes), "after": (...)}; nothing is
+    written to disk.
+    """
+    with open(input_path, "rb") as f:
+        data = f.read()
+    file_io = BufferedIO(input_path, data)
+    resize_image(input_path, input_path, file_io=file_io, **options)
+    output = file_io.outputs[0][1]
+
+    def describe(encoded):
+        with Image.open(io.BytesIO(encoded)) as image:
+            dimensions = image.size
+        return make_thumbnail(io.BytesIO(encoded), size), dimensions, len(encoded)
+
+    return {"before": describe(data), "after": describe(output)}
+
+
+class ThumbnailLoader:
+    """Background thread that lists folders and produces thumbnails and previews.
+
+    Results are put on the results queue as (generation, kind, path, result) where kind
+    is "listing", "thumbnail", "preview" or "error" (with the message as result). The
+    newest request is served first. clear() starts a new generation and drops older
+    requests that haven't run yet; with a wanted callback, thumbnail requests for paths
+    it rejects (e.g. scrolled out of view) are skipped as well.
+    """
+    def __init__(self, cache, wanted=None):
+        self.cache = cache
+        self.wanted = wanted
+        self.results = queue.Queue()
+        self.generation = 0
+        self._requests = queue.LifoQueue()
+        self._thread = None
+
+    def clear(self):
+        self.generation += 1
+
+    def request_listing(self, folder):
+        self._submit("listing", folder, lambda: find_input_files(folder))
+
+    def request_thumbnail(self, path):
+        self._submit("thumbnail", path, lambda: self.cache.get(path))
+
+    def request_preview(self, path, options):
+        self._submit("preview", path, lambda: render_preview(path, options))
+
+    def _submit(self, kind, path, work):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._requests.put((self.generation, kind, path, work))
+
+    def _run(self):
+        while True:
+            generation, kind, path, work = self._requests.get()
+            if generation != self.generation:
+                continue
+            if kind == "thumbnail" and self.wanted is not None and not self.wanted(path):
+                continue
+            try:
+                self.results.put((generation, kind, path, work()))
+            except Exception as e:
+                self.results.put((generation, "error", path, str(e)))
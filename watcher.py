@@ -0,0 +1,381 @@
+"""Watch a hot folder and resize images shortly after they arrive.
+
+    python image_resizer.py watch incoming/ -o resized/ --pixels 1000
+
+New and changed files are detected with inotify on Linux (a polling scan elsewhere or
+with --poll). A file is only resized once its size and mtime have stayed the same for
+--settle-seconds, so images still being copied in are left alone until complete. A
+manifest in the output folder records what was processed, so restarting the watcher
+(with --existing to catch up on files that arrived while it was stopped) never redoes work.
+"""
+import os
+import sys
+import json
+import time
+import select
+import struct
+import logging
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from image_resizer import DEFAULT_PRESET, RESIZE_PRESETS, VALID_EXTENSIONS, find_input_files
+from batch_engine import build_jobs, default_worker_count, job_outputs, run_job
+from manifest import Manifest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTLE_SECONDS = 1.0
+DEFAULT_POLL_INTERVAL = 1.0
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_candidate(path, exclude):
+    """Images only; hidden files (partial uploads, our own temporary files) and excluded folders are ignored."""
+    name = os.path.basename(path)
+    if name.startswith(".") or os.path.splitext(name)[1].lower() not in VALID_EXTENSIONS:
+        return False
+    absolute = os.path.abspath(path)
+    return not any(absolute.startswith(folder + os.sep) for folder in exclude)
+
+
+def check_output_folder(folder, output_folder):
+    """Raise ValueError if the output folder would hide the watched one.
+
+    The output folder is excluded from watching (so outputs aren't resized again), which
+    would silently exclude everything if it were the watched folder or contained it.
+    """
+    folder, output_folder = os.path.realpath(folder), os.path.realpath(output_folder)
+    if os.path.commonpath([folder, output_folder]) == output_folder:
+        raise ValueError(f"The output folder must not be the watched folder or contain it: {output_folder}")
+
+
+class InotifyWatcher:
+    """Report paths created, written or moved into a folder, using Linux inotify through ctypes."""
+    def __init__(self, folder, recursive=False, exclude=()):
+        import ctypes
+        import ctypes.util
+
+        self.recursive = recursive
+        self.exclude = {os.path.abspath(path) for path in exclude}
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watches = {}
+        self.folder = folder
+        self.add_folder(folder)
+
+    def add_folder(self, folder):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), WATCH_MASK)
+        if wd >= 0:
+            self._watches[wd] = folder
+        if self.recursive:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir() and os.path.abspath(entry.path) not in self.exclude:
+                        self.add_folder(entry.path)
+
+    def read(self, timeout):
+        """Wait up to timeout seconds and return the paths that changed."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: fall back to a full listing once
+                logger.warning(f"inotify queue overflowed, rescanning {self.folder}")
+                paths.extend(find_input_files(self.folder, self.recursive, self.exclude))
+                continue
+            if wd not in self._watches or not name:
+                continue
+            path = os.path.join(self._watches[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) and os.path.abspath(path) not in self.exclude:
+                    self.add_folder(path)
+                    # Files that landed before the watch was in place
+                    paths.extend(find_input_files(path, True, self.exclude))
+                continue
+            paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Fallback watcher: compares (size, mtime) snapshots of the folder every interval."""
+    def __init__(self, folder, recursive=False, exclude=(), interval=DEFAULT_POLL_INTERVAL):
+        self.folder = folder
+        self.recursive = recursive
+        self.exclude = tuple(exclude)
+        self.interval = interval
+        self._snapshot = self.scan()
+        self._next_scan = time.monotonic() + interval
+
+    def scan(self):
+        snapshot = {}
+        for path in find_input_files(self.folder, self.recursive, self.exclude):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout):
+        delay = self._next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0, delay))
+        self._next_scan = time.monotonic() + self.interval
+        snapshot = self.scan()
+        changed = [path for path, signature in snapshot.items() if self._snapshot.get(path) != signature]
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(folder, recursive=False, exclude=(), use_polling=False, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Return an inotify watcher where available, otherwise a polling one."""
+    if not use_polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder, recursive, exclude)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify unavailable ({str(e)}), polling {folder} instead")
+    return PollingWatcher(folder, recursive, exclude, poll_interval)
+
+
+class Debouncer:
+    """Hold back files until their size and mtime have been stable for settle_seconds."""
+    def __init__(self, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self._pending = {}  # path -> (signature, time it was last seen changing)
+
+    def touch(self, path):
+        signature = self._pending.get(path, (None, 0))[0]
+        self._pending[path] = (signature, time.monotonic())
+
+    def __len__(self):
+        return len(self._pending)
+
+    def ready(self):
+        """Return the files that have settled and stop tracking them."""
+        now = time.monotonic()
+        settled = []
+        for path, (signature, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Deleted or renamed away before it settled
+                del self._pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != signature:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle_seconds:
+                del self._pending[path]
+                settled.append(path)
+        return settled
+
+
+class FolderWatcher:
+    """Resize images arriving in folder with fixed settings until stop_event is set.
+
+    resize_mode, scaled_size, target_size_mb and options are passed to build_jobs.
+    Settled files the manifest shows as already processed are skipped. Resizes run on
+    a process pool kept for the watcher's lifetime, so a new image starts immediately.
+    If a worker process dies (e.g. killed for memory), the pool is replaced and its jobs
+    go back through the debouncer; a job whose worker dies twice is reported as failed.
+    on_event, if given, is called with ("done", input_file, output_files) or ("failed",
+    input_file, error_message). Raises ValueError if output_folder is folder or contains it.
+    """
+    def __init__(self, folder, output_folder, resize_mode, scaled_size=None, target_size_mb=None,
+                 recursive=False, workers=None, settle_seconds=DEFAULT_SETTLE_SECONDS, use_polling=False,
+                 poll_interval=DEFAULT_POLL_INTERVAL, on_event=None, **options):
+        check_output_folder(folder, output_folder)
+        self.folder = folder
+        self.output_folder = output_folder
+        self.job_settings = (resize_mode, scaled_size, target_size_mb)
+        self.options = options
+        self.recursive = recursive
+        self.workers = max(1, workers or default_worker_count())
+        self.debouncer = Debouncer(settle_seconds)
+        self.use_polling = use_polling
+        self.poll_interval = poll_interval
+        self.on_event = on_event
+        self.manifest = Manifest(output_folder)
+        self.executor = None
+        self._requeued = set()
+
+    def jobs_for(self, paths):
+        resize_mode, scaled_size, target_size_mb = self.job_settings
+        jobs = build_jobs(paths, self.output_folder, resize_mode, scaled_size, target_size_mb,
+                          input_root=self.folder if self.recursive else None, **self.options)
+        pending, _ = self.manifest.split_jobs(jobs)
+        return pending
+
+    def run(self, stop_event=None, process_existing=False):
+        stop_event = stop_event or threading.Event()
+        exclude = (os.path.abspath(self.output_folder),)
+        watcher = create_watcher(self.folder, self.recursive, exclude, self.use_polling, self.poll_interval)
+        if process_existing:
+            for path in find_input_files(self.folder, self.recursive, exclude):
+                self.debouncer.touch(path)
+        running = {}
+        orphaned = set()  # Futures of a pool that was replaced
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            while not stop_event.is_set():
+                # Wake up often enough to notice settled files promptly
+                timeout = min(0.2, self.debouncer.settle_seconds / 2) if self.debouncer else 0.5
+                for path in watcher.read(timeout):
+                    if is_candidate(path, exclude):
+                        self.debouncer.touch(path)
+                ready = self.debouncer.ready()
+                busy = {running_job[0] for running_job in running.values()}
+                broken = False
+                for job in self.jobs_for(ready) if ready else []:
+                    if job[0] in busy:
+                        # Changed again while being resized: look at it once more later
+                        self.debouncer.touch(job[0])
+                        continue
+                    try:
+                        running[self.executor.submit(run_job, *job)] = job
+                    except BrokenProcessPool:
+                        broken = True
+                        self.debouncer.touch(job[0])
+                done = [future for future in running if future.done()]
+                for future in done:
+                    job = running.pop(future)
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        if future not in orphaned:
+                            broken = True
+                        orphaned.discard(future)
+                        if self.requeue(job):
+                            continue
+                    self.job_finished(job, future)
+                if broken:
+                    # The pool refuses all work once a worker has died: replace it
+                    logger.warning("A worker process died: restarting the pool")
+                    orphaned.update(running)
+                    self.executor.shutdown(wait=False, cancel_futures=True)
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            if running:
+                for future in wait(running).done:
+                    self.job_finished(running.pop(future), future)
+        finally:
+            self.executor.shutdown()
+            watcher.close()
+            self.manifest.save()
+
+    def requeue(self, job):
+        """Send a job whose worker died back through the debouncer. Returns False if it already was once."""
+        input_file = job[0]
+        if input_file in self._requeued:
+            self._requeued.discard(input_file)
+            return False
+        self._requeued.add(input_file)
+        self.debouncer.touch(input_file)
+        return True
+
+    def job_finished(self, job, future):
+        input_file, output_file, options = job
+        self._requeued.discard(input_file)
+        try:
+            future.result()
+        except Exception as e:
+            self.emit("failed", input_file, str(e))
+            return
+        self.manifest.record(input_file, output_file, options)
+        self.manifest.save_if_due()
+        self.emit("done", input_file, job_outputs(job))
+
+    def emit(self, kind, input_file, detail):
+        if self.on_event is not None:
+            self.on_event(kind, input_file, detail)
+
+
+def main(argv=None):
+    import cli  # Reuses the batch CLI's transcoding options
+
+    parser = argparse.ArgumentParser(
+        prog="image_resizer watch",
+        description="Resize images as they arrive in a folder. Progress is written to stdout as JSON lines.")
+    parser.add_argument("folder", help="Folder to watch")
+    parser.add_argument("-o", "--output", required=True, help="Output folder")
+    parser.add_argument("--pixels", type=int, metavar="PX", help="Shortest side of the output in pixels")
+    parser.add_argument("--target-mb", type=float, metavar="MB", help="Target output file size in MB")
+    parser.add_argument("--min-quality", type=int, metavar="Q")
+    parser.add_argument("--preset", choices=list(RESIZE_PRESETS), default=DEFAULT_PRESET)
+    cli.add_output_arguments(parser)
+    parser.add_argument("-r", "--recursive", action="store_true", help="Watch subfolders too")
+    parser.add_argument("-w", "--workers", type=int, default=default_worker_count(),
+                        help="Number of worker processes")
+    parser.add_argument("--settle-seconds", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="How long a file must stay unchanged before it is resized")
+    parser.add_argument("--existing", action="store_true",
+                        help="Also resize files already in the folder that weren't processed before")
+    parser.add_argument("--poll", action="store_true", help="Poll the folder instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, metavar="SECONDS")
+    args = parser.parse_args(argv)
+    if (args.pixels is None) == (args.target_mb is None):
+        parser.error("exactly one of --pixels or --target-mb is required")
+    if not os.path.isdir(args.folder):
+        parser.error(f"{args.folder} is not a folder")
+    if args.workers <= 0:
+        parser.error("--workers must be at least 1")
+    try:
+        check_output_folder(args.folder, args.output)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s", stream=sys.stderr)
+    os.makedirs(args.output, exist_ok=True)
+
+    def on_event(kind, input_file, detail):
+        fields = {"event": kind, "input": input_file, "outputs" if kind == "done" else "error": detail}
+        sys.stdout.write(json.dumps(fields) + "\n")
+        sys.stdout.flush()
+
+    options = dict(cli.output_options(args), preset=args.preset)
+    if args.min_quality is not None:
+        options["min_quality"] = args.min_quality
+    resize_mode = "pixels" if args.pixels is not None else "size"
+    watcher = FolderWatcher(args.folder, args.output, resize_mode, args.pixels, args.target_mb,
+                            recursive=args.recursive, workers=args.workers, settle_seconds=args.settle_seconds,
+                            use_polling=args.poll, poll_interval=args.poll_interval, on_event=on_event, **options)
+    try:
+        watcher.run(process_existing=args.existing)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())